@@ -102,17 +102,16 @@ def _get_marker_param(request):
     return request.GET['marker']
 
 
-def limited(items, request, max_limit=CONF.osapi_max_limit):
-    """Return a slice of items according to requested offset and limit.
+def get_offset_and_limit(request, max_limit=CONF.osapi_max_limit):
+    """Return offset, limit tuple from request.
 
-    :param items: A sliceable entity
     :param request: ``wsgi.Request`` possibly containing 'offset' and 'limit'
                     GET variables. 'offset' is where to start in the list,
                     and 'limit' is the maximum number of items to return. If
                     'limit' is not specified, 0, or > max_limit, we default
                     to max_limit. Negative values for either offset or limit
                     will cause exc.HTTPBadRequest() exceptions to be raised.
-    :kwarg max_limit: The maximum number of items to return from 'items'
+    :kwarg max_limit: The maximum number of items to return
     """
     try:
         offset = int(request.GET.get('offset', 0))
@@ -135,6 +134,18 @@ def limited(items, request, max_limit=CONF.osapi_max_limit):
         raise webob.exc.HTTPBadRequest(explanation=msg)
 
     limit = min(max_limit, limit or max_limit)
+    return offset, limit
+
+
+def limited(items, request, max_limit=CONF.osapi_max_limit):
+    """Return a slice of items according to requested offset and limit.
+
+    :param items: A sliceable entity
+    :param request: ``wsgi.Request`` possibly containing 'offset' and 'limit'
+                    GET variables, see :py:func:`get_offset_and_limit`.
+    :kwarg max_limit: The maximum number of items to return from 'items'
+    """
+    offset, limit = get_offset_and_limit(request, max_limit)
     range_end = offset + limit
     return items[offset:range_end]
 
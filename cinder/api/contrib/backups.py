@@ -203,6 +203,11 @@ class BackupsController(wsgi.Controller):
         """Returns a list of backups, transformed through view builder."""
         context = req.environ['cinder.context']
         filters = req.params.copy()
+        marker = filters.pop('marker', None)
+        sort_key = filters.pop('sort_key', 'created_at')
+        sort_dir = filters.pop('sort_dir', 'asc')
+        filters.pop('limit', None)
+        filters.pop('offset', None)
 
         utils.remove_invalid_filter_options(context,
                                             filters,
@@ -212,13 +217,16 @@ class BackupsController(wsgi.Controller):
             filters['display_name'] = filters['name']
             del filters['name']
 
-        backups = self.backup_api.get_all(context, search_opts=filters)
-        limited_list = common.limited(backups, req)
+        offset, limit = common.get_offset_and_limit(req)
+        backups = self.backup_api.get_all(context, search_opts=filters,
+                                          marker=marker, limit=limit,
+                                          sort_key=sort_key,
+                                          sort_dir=sort_dir, offset=offset)
 
         if is_detail:
-            backups = self._view_builder.detail_list(req, limited_list)
+            backups = self._view_builder.detail_list(req, backups)
         else:
-            backups = self._view_builder.summary_list(req, limited_list)
+            backups = self._view_builder.summary_list(req, backups)
         return backups
 
     # TODO(frankm): Add some checks here including
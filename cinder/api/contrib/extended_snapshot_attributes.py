@@ -37,8 +37,12 @@ class ExtendedSnapshotAttributesController(wsgi.Controller):
                                                                    **kwargs)
         self.volume_api = volume.API()
 
-    def _get_snapshots(self, context):
-        snapshots = self.volume_api.get_all_snapshots(context)
+    def _get_snapshots(self, context, snapshot_ids):
+        search_opts = {'id': snapshot_ids}
+        if context.is_admin:
+            search_opts['all_tenants'] = True
+        snapshots = self.volume_api.get_all_snapshots(context,
+                                                      search_opts=search_opts)
         rval = dict((snapshot['id'], snapshot) for snapshot in snapshots)
         return rval
 
@@ -54,11 +58,14 @@ class ExtendedSnapshotAttributesController(wsgi.Controller):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedSnapshotAttributeTemplate())
 
-            try:
-                snapshot = self.volume_api.get_snapshot(context, id)
-            except exception.NotFound:
-                explanation = _("Snapshot not found.")
-                raise exc.HTTPNotFound(explanation=explanation)
+            # The snapshot was just read by the snapshots controller
+            snapshot = req.cached_resource_by_id(id)
+            if snapshot is None:
+                try:
+                    snapshot = self.volume_api.get_snapshot(context, id)
+                except exception.NotFound:
+                    explanation = _("Snapshot not found.")
+                    raise exc.HTTPNotFound(explanation=explanation)
 
             self._extend_snapshot(snapshot=resp_obj.obj['snapshot'],
                                   data=snapshot)
@@ -71,7 +78,11 @@ class ExtendedSnapshotAttributesController(wsgi.Controller):
             resp_obj.attach(xml=ExtendedSnapshotAttributesTemplate())
 
             snapshots = list(resp_obj.obj.get('snapshots', []))
-            db_snapshots = self._get_snapshots(context)
+            # Only the snapshots of the page the snapshots controller did
+            # not cache are read, all at once
+            db_snapshots = req.cached_resources_by_ids(
+                [snapshot['id'] for snapshot in snapshots],
+                lambda ids: self._get_snapshots(context, ids))
 
             for snapshot_object in snapshots:
                 try:
@@ -130,6 +130,47 @@ class Request(webob.Request):
             return None
         return resources.get(resource_id)
 
+    def cached_resources_by_ids(self, resource_ids, load, name=None):
+        """Get the resources with the given IDs, loading them in bulk.
+
+        Allow API extensions which decorate a list of resources to fetch
+        what they need for the whole page with one call, rather than with
+        one call per resource or one call for every resource visible to
+        the context, and to share it with the other extensions of the same
+        API request. For example:
+
+            image_metadata = request.cached_resources_by_ids(
+                [volume['id'] for volume in volumes],
+                lambda ids: volume_api.get_volumes_image_metadata(context,
+                                                                  ids),
+                'image_metadata')
+
+        Resources the controller cached with cache_resource are used as
+        they are, so only those it did not cache are loaded.
+
+        :param resource_ids: IDs of the resources to get
+        :param load: callable given the IDs of the resources which are not
+                     cached yet, returning a dict of ID to resource for
+                     those of them which exist
+        :param name: name the resources are cached under, see cache_resource
+        :returns: a dict of ID to resource for the resources which exist
+        """
+        if not name:
+            name = self.path
+        cached_resources = self._resource_cache.setdefault(name, {})
+        missing_ids = [resource_id for resource_id in resource_ids
+                       if resource_id not in cached_resources]
+        if missing_ids:
+            loaded_resources = load(missing_ids)
+            for resource_id in missing_ids:
+                # Resources which do not exist are cached as None so that
+                # they are not asked for again
+                cached_resources[resource_id] = loaded_resources.get(
+                    resource_id)
+        return dict((resource_id, cached_resources[resource_id])
+                    for resource_id in resource_ids
+                    if cached_resources[resource_id] is not None)
+
     def best_match_content_type(self):
         """Determine the requested response content-type."""
         if 'cinder.best_content_type' not in self.environ:
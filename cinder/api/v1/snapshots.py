@@ -109,6 +109,7 @@ class SnapshotsController(wsgi.Controller):
         except exception.NotFound:
             raise exc.HTTPNotFound()
 
+        req.cache_resource(vol)
         return {'snapshot': _translate_snapshot_detail_view(context, vol)}
 
     def delete(self, req, id):
@@ -148,10 +149,13 @@ class SnapshotsController(wsgi.Controller):
         utils.remove_invalid_filter_options(context, search_opts,
                                             allowed_search_options)
 
+        offset, limit = common.get_offset_and_limit(req)
         snapshots = self.volume_api.get_all_snapshots(context,
-                                                      search_opts=search_opts)
-        limited_list = common.limited(snapshots, req)
-        res = [entity_maker(context, snapshot) for snapshot in limited_list]
+                                                      search_opts=search_opts,
+                                                      limit=limit,
+                                                      offset=offset)
+        req.cache_resource(snapshots)
+        res = [entity_maker(context, snapshot) for snapshot in snapshots]
         return {'snapshots': res}
 
     @wsgi.serializers(xml=SnapshotTemplate)
@@ -18,12 +18,16 @@ Module dedicated functions/classes dealing with rate limiting requests.
 """
 
 import collections
-import copy
+import hashlib
 import httplib
 import math
+import mmap
+import multiprocessing
 import re
+import struct
 import time
 
+from oslo.config import cfg
 import webob.dec
 import webob.exc
 
@@ -32,9 +36,30 @@ from cinder.api.views import limits as limits_views
 from cinder.api import xmlutil
 from cinder.openstack.common import importutils
 from cinder.openstack.common import jsonutils
+from cinder.openstack.common import log as logging
 from cinder import quota
 from cinder import wsgi as base_wsgi
 
+limits_opts = [
+    cfg.StrOpt('rate_limit_store',
+               default='memory',
+               help='Where the rate limiting state of the users is kept: '
+                    '"memory" for each API worker process on its own, or '
+                    '"shared_memory" for memory shared by all the API '
+                    'worker processes, so that the limits apply to all of '
+                    'them together'),
+    cfg.IntOpt('rate_limit_max_users',
+               default=10000,
+               help='Maximum number of users whose rate limiting state is '
+                    'kept, the users seen least recently are forgotten '
+                    'first'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(limits_opts)
+
+LOG = logging.getLogger(__name__)
+
 QUOTAS = quota.QUOTAS
 LIMITS_PREFIX = "limits."
 
@@ -121,6 +146,7 @@ class Limit(object):
         self.verb = verb
         self.uri = uri
         self.regex = regex
+        self._regex = None
         self.value = int(value)
         self.unit = unit
         self.unit_string = self.display_unit().lower()
@@ -145,35 +171,71 @@ class Limit(object):
         @param verb: string http verb (POST, GET, etc.)
         @param url: string URL
         """
-        if self.verb != verb or not re.match(self.regex, url):
+        if self.verb != verb or not self.matches(url):
             return
 
+        delay, state = self.consume(self.get_state())
+        self.set_state(state)
+        return delay
+
+    def initial_state(self):
+        """Return the state of this limit before any request was made."""
+        return (0, None, None, self.value)
+
+    def matches(self, url):
+        """Whether the given URL is subject to this limit."""
+        if self._regex is None:
+            self._regex = re.compile(self.regex)
+        return self._regex.match(url) is not None
+
+    def get_state(self):
+        """Return the state of the leaky bucket of this limit."""
+        return (self.water_level, self.last_request, self.next_request,
+                self.remaining)
+
+    def set_state(self, state):
+        """Restore a state returned by get_state or consume."""
+        (self.water_level, self.last_request, self.next_request,
+         self.remaining) = state
+
+    def consume(self, state):
+        """Account for a request against the given state of this limit.
+
+        The limit itself is left unchanged, so that one `Limit` can be used
+        for the states of many users.
+
+        @param state: state as returned by get_state
+        @return: Tuple of the delay (or None) and of the new state
+        """
+        water_level, last_request, next_request, remaining = state
+
         now = self._get_time()
 
-        if self.last_request is None:
-            self.last_request = now
+        if last_request is None:
+            last_request = now
 
-        leak_value = now - self.last_request
+        leak_value = now - last_request
 
-        self.water_level -= leak_value
-        self.water_level = max(self.water_level, 0)
-        self.water_level += self.request_value
+        water_level -= leak_value
+        water_level = max(water_level, 0)
+        water_level += self.request_value
 
-        difference = self.water_level - self.capacity
+        difference = water_level - self.capacity
 
-        self.last_request = now
+        last_request = now
 
         if difference > 0:
-            self.water_level -= self.request_value
-            self.next_request = now + difference
-            return difference
+            water_level -= self.request_value
+            next_request = now + difference
+            return difference, (water_level, last_request, next_request,
+                                remaining)
 
         cap = self.capacity
-        water = self.water_level
         val = self.value
 
-        self.remaining = math.floor(((cap - water) / cap) * val)
-        self.next_request = now
+        remaining = math.floor(((cap - water_level) / cap) * val)
+        next_request = now
+        return None, (water_level, last_request, next_request, remaining)
 
     def _get_time(self):
         """Retrieve the current time. Broken out for testability."""
@@ -183,16 +245,23 @@ class Limit(object):
         """Display the string name of the unit."""
         return self.UNITS.get(self.unit, "UNKNOWN")
 
-    def display(self):
-        """Return a useful representation of this class."""
+    def display(self, state=None):
+        """Return a useful representation of this class.
+
+        @param state: optional state to display this limit in, as returned
+                      by get_state, rather than the state of the limit
+        """
+        if state is None:
+            state = self.get_state()
+        water_level, last_request, next_request, remaining = state
         return {
             "verb": self.verb,
             "URI": self.uri,
             "regex": self.regex,
             "value": self.value,
-            "remaining": int(self.remaining),
+            "remaining": int(remaining),
             "unit": self.display_unit(),
-            "resetTime": int(self.next_request or self._get_time()),
+            "resetTime": int(next_request or self._get_time()),
         }
 
 # "Limit" format is a dictionary with the HTTP verb, human-readable URI,
@@ -267,16 +336,180 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
         return self.application
 
 
+class LimiterStore(object):
+    """Keeps the state of the limits of the users of a `Limiter`.
+
+    The states of a user are a list holding, for each of the limits of the
+    user, either None or the state of the limit as returned by
+    `Limit.consume`.
+    """
+
+    def get(self, key):
+        """Return the states stored under the given key, or None."""
+        raise NotImplementedError()
+
+    def update(self, key, func):
+        """Atomically replace the states stored under the given key.
+
+        @param key: string identifying the user
+        @param func: callable given the stored states, or None, returning a
+                     tuple of the new states and of a result
+        @return: the result returned by func
+        """
+        raise NotImplementedError()
+
+
+class MemoryLimiterStore(LimiterStore):
+    """Keeps the states in the memory of the process.
+
+    The users seen least recently are forgotten first once the states of
+    max_users users are kept.
+    """
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._states = collections.OrderedDict()
+
+    def get(self, key):
+        return self._states.get(key)
+
+    def update(self, key, func):
+        states, result = func(self._states.pop(key, None))
+        self._states[key] = states
+        if len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+        return result
+
+
+class SharedMemoryLimiterStore(LimiterStore):
+    """Keeps the states in memory shared with the forked processes.
+
+    The store has to be created before the API worker processes are forked,
+    which is the case of the limiter of `RateLimitingMiddleware`, so that
+    all the workers enforce the limits together.
+
+    The memory is a table of max_users slots of fixed size, each key can
+    be kept in one of a few slots and takes the one used least recently
+    when none of them holds it yet. Only the states of the first
+    max_limits limits of a user are kept, the others aren't enforced.
+    """
+
+    # Slot header: digest of the key, time of last use, number of states
+    _HEADER = struct.Struct('<16sdH')
+    # Limit state: water level, last request, next request, remaining
+    _STATE = struct.Struct('<4d')
+    _PROBES = 8
+
+    def __init__(self, max_users, max_limits=16):
+        self.slots = max_users
+        self.max_limits = max_limits
+        self.slot_size = self._HEADER.size + self._STATE.size * max_limits
+        self._memory = mmap.mmap(-1, self.slot_size * self.slots)
+        self._lock = multiprocessing.Lock()
+        self._truncated = False
+
+    def _find_slot(self, digest):
+        """Return the slot holding the digest, or the slot to store it in.
+
+        @return: Tuple of the slot and of whether it holds the digest
+        """
+        start = struct.unpack('<Q', digest[:8])[0] % self.slots
+        victim = victim_used = None
+        for probe in xrange(min(self._PROBES, self.slots)):
+            slot = (start + probe) % self.slots
+            slot_digest, used, count = self._HEADER.unpack_from(
+                self._memory, slot * self.slot_size)
+            if slot_digest == digest:
+                return slot, True
+            if victim is None or used < victim_used:
+                victim, victim_used = slot, used
+        return victim, False
+
+    def _read(self, slot):
+        offset = slot * self.slot_size
+        count = self._HEADER.unpack_from(self._memory, offset)[2]
+        offset += self._HEADER.size
+        states = []
+        for i in xrange(count):
+            state = self._STATE.unpack_from(self._memory,
+                                            offset + i * self._STATE.size)
+            if math.isnan(state[0]):
+                states.append(None)
+            else:
+                states.append(tuple(None if math.isnan(value) else value
+                                    for value in state))
+        return states
+
+    def _write(self, slot, digest, states):
+        if len(states) > self.max_limits:
+            if not self._truncated:
+                LOG.warn(_('Only the first %(max_limits)d of the %(count)d '
+                           'rate limits of a user can be enforced') %
+                         {'max_limits': self.max_limits,
+                          'count': len(states)})
+                self._truncated = True
+            states = states[:self.max_limits]
+        offset = slot * self.slot_size
+        self._HEADER.pack_into(self._memory, offset, digest, time.time(),
+                               len(states))
+        offset += self._HEADER.size
+        nan = float('nan')
+        for i, state in enumerate(states):
+            if state is None:
+                state = (nan,) * 4
+            self._STATE.pack_into(self._memory,
+                                  offset + i * self._STATE.size,
+                                  *[nan if value is None else value
+                                    for value in state])
+
+    @staticmethod
+    def _digest(key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.md5(key).digest()
+
+    def get(self, key):
+        digest = self._digest(key)
+        with self._lock:
+            slot, found = self._find_slot(digest)
+            if found:
+                return self._read(slot)
+
+    def update(self, key, func):
+        digest = self._digest(key)
+        with self._lock:
+            slot, found = self._find_slot(digest)
+            states, result = func(self._read(slot) if found else None)
+            self._write(slot, digest, states)
+        return result
+
+
+def get_limiter_store(max_limits=16):
+    """Return a new `LimiterStore` as configured by rate_limit_store.
+
+    @param max_limits: Largest number of limits of a user
+    """
+    if CONF.rate_limit_store == 'memory':
+        return MemoryLimiterStore(CONF.rate_limit_max_users)
+    if CONF.rate_limit_store == 'shared_memory':
+        return SharedMemoryLimiterStore(CONF.rate_limit_max_users,
+                                        max_limits=max_limits)
+    raise ValueError(_("Invalid rate_limit_store: %s") %
+                     CONF.rate_limit_store)
+
+
 class Limiter(object):
     """Rate-limit checking class which handles limits in memory."""
 
-    def __init__(self, limits, **kwargs):
+    def __init__(self, limits, store=None, **kwargs):
         """Initialize the new `Limiter`.
 
         @param limits: List of `Limit` objects
+        @param store: `LimiterStore` for the state of the limits of the
+                      users, the one configured by rate_limit_store if None
         """
-        self.limits = copy.deepcopy(limits)
-        self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.limits = list(limits)
+        self.levels = {}
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
@@ -284,21 +517,73 @@ class Limiter(object):
                 username = key[len(LIMITS_PREFIX):]
                 self.levels[username] = self.parse_limits(value)
 
+        if store is None:
+            store = get_limiter_store(max(
+                [len(self.limits)] +
+                [len(level) for level in self.levels.values()]))
+        self.store = store
+
+        # Index the limits by verb, so that a request is only checked
+        # against the limits it may be subject to
+        self._default_index = self._index_limits(self.limits)
+        self._level_indexes = dict(
+            (username, self._index_limits(limits))
+            for username, limits in self.levels.items())
+
+    @staticmethod
+    def _index_limits(limits):
+        """Return the digest of the limits and their positions by verb."""
+        by_verb = collections.defaultdict(list)
+        for index, limit in enumerate(limits):
+            by_verb[limit.verb].append((index, limit))
+        digest = hashlib.md5(repr([(limit.verb, limit.regex, limit.value,
+                                    limit.unit)
+                                   for limit in limits])).hexdigest()
+        return digest, dict(by_verb)
+
+    def _get_user_limits(self, username):
+        if username in self.levels:
+            return self.levels[username], self._level_indexes[username]
+        return self.limits, self._default_index
+
+    @staticmethod
+    def _store_key(digest, username):
+        # The digest of the limits keeps states from being applied to other
+        # limits than their own, should the limits of the user change
+        return '%s:%s' % (digest, jsonutils.dumps(username))
+
     def get_limits(self, username=None):
         """Return the limits for a given user."""
-        return [limit.display() for limit in self.levels[username]]
+        limits, (digest, by_verb) = self._get_user_limits(username)
+        states = self.store.get(self._store_key(digest, username)) or []
+        states = states + [None] * (len(limits) - len(states))
+        return [limit.display(state or limit.initial_state())
+                for limit, state in zip(limits, states)]
 
     def check_for_delay(self, verb, url, username=None):
         """Check the given verb/user/user triplet for limit.
 
         @return: Tuple of delay (in seconds) and error message (or None, None)
         """
-        delays = []
+        limits, (digest, by_verb) = self._get_user_limits(username)
+        matching = [(index, limit) for index, limit in by_verb.get(verb, [])
+                    if limit.matches(url)]
+        if not matching:
+            return None, None
 
-        for limit in self.levels[username]:
-            delay = limit(verb, url)
-            if delay:
-                delays.append((delay, limit.error_message))
+        def consume(states):
+            states = list(states or [])
+            states += [None] * (len(limits) - len(states))
+            delays = []
+            for index, limit in matching:
+                delay, states[index] = limit.consume(
+                    states[index] or limit.initial_state())
+                if delay:
+                    delays.append((delay, limit.error_message))
+            return states, delays
+
+        delays = self.store.update(self._store_key(digest, username),
+                                   consume)
 
         if delays:
             delays.sort()
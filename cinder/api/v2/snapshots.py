@@ -110,6 +110,7 @@ class SnapshotsController(wsgi.Controller):
             msg = _("Snapshot could not be found")
             raise exc.HTTPNotFound(explanation=msg)
 
+        req.cache_resource(vol)
         return {'snapshot': _translate_snapshot_detail_view(context, vol)}
 
     def delete(self, req, id):
@@ -141,8 +142,11 @@ class SnapshotsController(wsgi.Controller):
         """Returns a list of snapshots, transformed through entity_maker."""
         context = req.environ['cinder.context']
 
-        #pop out limit and offset , they are not search_opts
+        #pop out the paginate options, they are not search_opts
         search_opts = req.GET.copy()
+        marker = search_opts.pop('marker', None)
+        sort_key = search_opts.pop('sort_key', 'created_at')
+        sort_dir = search_opts.pop('sort_dir', 'asc')
         search_opts.pop('limit', None)
         search_opts.pop('offset', None)
 
@@ -156,10 +160,16 @@ class SnapshotsController(wsgi.Controller):
             search_opts['display_name'] = search_opts['name']
             del search_opts['name']
 
+        offset, limit = common.get_offset_and_limit(req)
         snapshots = self.volume_api.get_all_snapshots(context,
-                                                      search_opts=search_opts)
-        limited_list = common.limited(snapshots, req)
-        res = [entity_maker(context, snapshot) for snapshot in limited_list]
+                                                      search_opts=search_opts,
+                                                      marker=marker,
+                                                      limit=limit,
+                                                      sort_key=sort_key,
+                                                      sort_dir=sort_dir,
+                                                      offset=offset)
+        req.cache_resource(snapshots)
+        res = [entity_maker(context, snapshot) for snapshot in snapshots]
         return {'snapshots': res}
 
     @wsgi.response(202)
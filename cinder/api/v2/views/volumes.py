@@ -25,6 +25,9 @@ class ViewBuilder(common.ViewBuilder):
 
     _collection_name = "volumes"
 
+    # Volume columns the summary view is built from.
+    summary_columns = ('id', 'display_name')
+
     def __init__(self):
         """Initialize view builder."""
         super(ViewBuilder, self).__init__()
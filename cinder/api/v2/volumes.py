@@ -226,14 +226,23 @@ class VolumeController(wsgi.Controller):
         if 'metadata' in filters:
             filters['metadata'] = ast.literal_eval(filters['metadata'])
 
+        # The summary view is built from a couple of columns only, so there
+        # is no need to load the volumes and their metadata for it.
+        if is_detail:
+            columns = None
+        else:
+            columns = self._view_builder.summary_columns
+
         volumes = self.volume_api.get_all(context, marker, limit, sort_key,
                                           sort_dir, filters,
-                                          viewable_admin_meta=True)
+                                          viewable_admin_meta=is_detail,
+                                          columns=columns)
 
-        volumes = [dict(vol.iteritems()) for vol in volumes]
+        if is_detail:
+            volumes = [dict(vol.iteritems()) for vol in volumes]
 
-        for volume in volumes:
-            utils.add_visible_admin_metadata(volume)
+            for volume in volumes:
+                utils.add_visible_admin_metadata(volume)
 
         limited_list = common.limited(volumes, req)
 
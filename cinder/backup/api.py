@@ -71,16 +71,26 @@ class API(base.Base):
                                          backup['host'],
                                          backup['id'])
 
-    def get_all(self, context, search_opts=None):
+    def get_all(self, context, search_opts=None, marker=None, limit=None,
+                sort_key='created_at', sort_dir='asc', offset=None):
         if search_opts is None:
             search_opts = {}
         check_policy(context, 'get_all')
         if context.is_admin:
-            backups = self.db.backup_get_all(context, filters=search_opts)
+            backups = self.db.backup_get_all(context, filters=search_opts,
+                                             marker=marker, limit=limit,
+                                             sort_key=sort_key,
+                                             sort_dir=sort_dir,
+                                             offset=offset)
         else:
             backups = self.db.backup_get_all_by_project(context,
                                                         context.project_id,
-                                                        filters=search_opts)
+                                                        filters=search_opts,
+                                                        marker=marker,
+                                                        limit=limit,
+                                                        sort_key=sort_key,
+                                                        sort_dir=sort_dir,
+                                                        offset=offset)
 
         return backups
 
@@ -15,6 +15,8 @@
 
 """Base class for all backup drivers."""
 
+import time
+
 from cinder.db import base
 from cinder import exception
 from cinder.openstack.common import jsonutils
@@ -25,7 +27,12 @@ service_opts = [
     cfg.IntOpt('backup_metadata_version', default=1,
                help='Backup metadata version to be used when backing up '
                     'volume metadata. If this number is bumped, make sure the '
-                    'service doing the restore supports the new version.')
+                    'service doing the restore supports the new version.'),
+    cfg.IntOpt('backup_checkpoint_interval', default=300,
+               help='Interval in seconds between the checkpoints of the '
+                    'progress of a backup or restore, which it is resumed '
+                    'from after a restart of the service by drivers '
+                    'supporting it. 0 disables checkpoints'),
 ]
 
 CONF = cfg.CONF
@@ -239,6 +246,25 @@ class BackupMetadataAPI(base.Base):
                 LOG.debug(msg)
 
 
+class CheckpointTimer(object):
+    """Tells when the progress of an operation is due to be checkpointed."""
+
+    def __init__(self, interval=None):
+        if interval is None:
+            interval = CONF.backup_checkpoint_interval
+        self.interval = interval
+        self.last = time.time()
+
+    def due(self):
+        if not self.interval:
+            return False
+        now = time.time()
+        if now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+
 class BackupDriver(base.Base):
 
     def __init__(self, context, db_driver=None):
@@ -264,6 +290,32 @@ class BackupDriver(base.Base):
         """Delete a saved backup."""
         raise NotImplementedError()
 
+    def get_checkpoint(self, backup):
+        """Return the checkpoint of an interrupted backup or restore.
+
+        :returns: the dict saved by save_checkpoint, or None
+        """
+        checkpoint = backup.get('checkpoint')
+        if not checkpoint:
+            return None
+        return jsonutils.loads(checkpoint)
+
+    def save_checkpoint(self, backup, checkpoint):
+        """Record the progress of a backup or restore to resume it from."""
+        value = jsonutils.dumps(checkpoint) if checkpoint else None
+        self.db.backup_update(self.context, backup['id'],
+                              {'checkpoint': value})
+        backup['checkpoint'] = value
+
+    def can_resume(self, backup):
+        """Return whether an interrupted backup or restore can be resumed.
+
+        Drivers resuming operations from the checkpoint of the backup
+        override this. The operation is then started again, and resumes
+        from the checkpoint.
+        """
+        return False
+
     def export_record(self, backup):
         """Export backup record.
 
@@ -36,28 +36,37 @@ as snapshots so that minimal space is consumed in the object store and
 restoring the volume takes a far reduced amount of time compared to a full
 copy.
 
+The extents changed between snapshots are copied in-process with librbd, a
+number of them at once, unless backup_ceph_diff_engine selects the rbd
+export-diff and import-diff commands.
+
 Note that Cinder supports restoring to a new volume or the original volume the
 backup was taken from. For the latter case, a full copy is enforced since this
 was deemed the safest action to take. It is therefore recommended to always
 restore to a new volume (default).
 """
 
+import contextlib
 import eventlet
+from eventlet import tpool
 import fcntl
 import os
 import re
+import stat
 import subprocess
 import time
 
 from oslo.config import cfg
 
 from cinder.backup.driver import BackupDriver
+from cinder.backup.driver import CheckpointTimer
 from cinder import exception
 from cinder.openstack.common import excutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import strutils
 from cinder.openstack.common import units
 from cinder import utils
+from cinder.volume import blockcopy
 import cinder.volume.drivers.rbd as rbd_driver
 
 try:
@@ -87,9 +96,21 @@ service_opts = [
                help='RBD stripe count to use when creating a backup image.'),
     cfg.BoolOpt('restore_discard_excess_bytes', default=True,
                 help='If True, always discard excess bytes when restoring '
-                     'volumes i.e. pad with zeroes.')
+                     'volumes i.e. pad with zeroes.'),
+    cfg.StrOpt('backup_ceph_diff_engine', default='native',
+               help='How differential backups and restores between RBD '
+                    'images are transferred: "native" copies the changed '
+                    'extents in-process with librbd, "cli" pipes rbd '
+                    'export-diff into rbd import-diff'),
+    cfg.IntOpt('backup_ceph_diff_queue_depth', default=8,
+               help='Number of reads and writes of changed extents in '
+                    'flight at once in native differential transfers'),
 ]
 
+# Largest read and write of native differential transfers, the default size
+# of the objects of RBD images
+DIFF_IO_SIZE = 4 * units.Mi
+
 CONF = cfg.CONF
 CONF.register_opts(service_opts)
 
@@ -273,16 +294,19 @@ class CephBackupDriver(BackupDriver):
     def _discard_bytes(self, volume, offset, length):
         """Trim length bytes from offset.
 
-        If the volume is an rbd do a discard() otherwise assume it is a file
-        and pad with zeroes.
+        If the volume is an rbd do a discard(). Otherwise assume it is a
+        file or block device and discard the range or punch a hole in it,
+        padding it with zeroes if that fails.
         """
         if length:
             LOG.debug("Discarding %(length)s bytes from offset %(offset)s" %
                       {'length': length, 'offset': offset})
             if self._file_is_rbd(volume):
                 volume.rbd_image.discard(offset, length)
+            elif self._zero_file_range(volume, offset, length):
+                volume.seek(offset + length)
             else:
-                zeroes = '\0' * length
+                zeroes = '\0' * min(length, self.chunk_size)
                 chunks = int(length / self.chunk_size)
                 for chunk in xrange(0, chunks):
                     LOG.debug("Writing zeroes chunk %d" % chunk)
@@ -293,12 +317,31 @@ class CephBackupDriver(BackupDriver):
 
                 rem = int(length % self.chunk_size)
                 if rem:
-                    zeroes = '\0' * rem
-                    volume.write(zeroes)
+                    volume.write(zeroes[:rem])
                     volume.flush()
 
-    def _transfer_data(self, src, src_name, dest, dest_name, length):
-        """Transfer data between files (Python IO objects)."""
+    def _zero_file_range(self, volume, offset, length):
+        """Zero a range of a file without writing zeroes if possible."""
+        try:
+            fileno = volume.fileno()
+        except IOError:
+            return False
+        volume.flush()
+        if not blockcopy.zero_range(fileno, offset, length):
+            return False
+        # Holes punched at the end don't extend files
+        st = os.fstat(fileno)
+        if stat.S_ISREG(st.st_mode) and st.st_size < offset + length:
+            os.ftruncate(fileno, offset + length)
+        return True
+
+    def _transfer_data(self, src, src_name, dest, dest_name, length,
+                       on_progress=None):
+        """Transfer data between files (Python IO objects).
+
+        :param on_progress: called with the position of dest after each
+                            chunk written to it
+        """
         LOG.debug("Transferring data between '%(src)s' and '%(dest)s'" %
                   {'src': src_name, 'dest': dest_name})
 
@@ -320,6 +363,8 @@ class CephBackupDriver(BackupDriver):
 
             dest.write(data)
             dest.flush()
+            if on_progress is not None:
+                on_progress(dest.tell())
             delta = (time.time() - before)
             rate = (self.chunk_size / delta) / 1024
             LOG.debug((_("Transferred chunk %(chunk)s of %(chunks)s "
@@ -524,6 +569,11 @@ class CephBackupDriver(BackupDriver):
                   "'%(dest)s'" %
                   {'src': src_name, 'dest': dest_name})
 
+        if CONF.backup_ceph_diff_engine == 'native':
+            return self._rbd_diff_transfer_native(
+                src_name, src_pool, dest_name, dest_pool, src_user, src_conf,
+                dest_user, dest_conf, src_snap=src_snap, from_snap=from_snap)
+
         # NOTE(dosaboy): Need to be tolerant of clusters/clients that do
         # not support these operations since at the time of writing they
         # were very new.
@@ -553,6 +603,122 @@ class CephBackupDriver(BackupDriver):
             LOG.info(msg)
             raise exception.BackupRBDOperationFailed(msg)
 
+    @contextlib.contextmanager
+    def _open_rbd_image(self, user, conf, pool, name, snapshot=None,
+                        read_only=False):
+        """Open an RBD image with its own connection to its cluster."""
+        client = self.rados.Rados(rados_id=user, conffile=conf)
+        client.connect()
+        try:
+            ioctx = client.open_ioctx(strutils.safe_encode(pool))
+            try:
+                if snapshot is not None:
+                    snapshot = strutils.safe_encode(snapshot)
+                image = self.rbd.Image(ioctx, strutils.safe_encode(name),
+                                       snapshot=snapshot,
+                                       read_only=read_only)
+                try:
+                    yield image
+                finally:
+                    image.close()
+            finally:
+                ioctx.close()
+        finally:
+            client.shutdown()
+
+    def _rbd_diff_transfer_native(self, src_name, src_pool, dest_name,
+                                  dest_pool, src_user, src_conf, dest_user,
+                                  dest_conf, src_snap=None, from_snap=None):
+        """Copy the extents changed between two points with librbd.
+
+        Does what rbd import-diff does with the output of export-diff: the
+        destination is resized to the source, the extents which changed are
+        written, those discarded are discarded, and src_snap is created on
+        the destination.
+        """
+        before = time.time()
+        try:
+            with self._open_rbd_image(src_user, src_conf, src_pool, src_name,
+                                      snapshot=src_snap,
+                                      read_only=True) as src_image:
+                with self._open_rbd_image(dest_user, dest_conf, dest_pool,
+                                          dest_name) as dest_image:
+                    size = tpool.execute(src_image.size)
+                    if tpool.execute(dest_image.size) != size:
+                        tpool.execute(dest_image.resize, size)
+
+                    extents = []
+
+                    def iter_cb(offset, length, exists):
+                        extents.append((offset, length, exists))
+
+                    tpool.execute(src_image.diff_iterate, 0, size,
+                                  from_snap, iter_cb)
+                    stats = self._transfer_extents(src_image, dest_image,
+                                                   extents)
+                    if src_snap:
+                        tpool.execute(dest_image.create_snap,
+                                      strutils.safe_encode(src_snap))
+        except Exception as e:
+            msg = (_("RBD diff op failed - %s") % unicode(e))
+            LOG.info(msg)
+            raise exception.BackupRBDOperationFailed(msg)
+
+        delta = max(time.time() - before, 0.001)
+        LOG.info(_("Transferred %(bytes)d bytes in %(extents)d changed "
+                   "extents and discarded %(discarded)d bytes from "
+                   "'%(src)s' to '%(dest)s' in %(time).2fs (%(rate)dK/s)") %
+                 {'bytes': stats['bytes'], 'extents': stats['extents'],
+                  'discarded': stats['discarded'], 'src': src_name,
+                  'dest': dest_name, 'time': delta,
+                  'rate': (stats['bytes'] / delta) / 1024})
+        return stats
+
+    def _transfer_extents(self, src_image, dest_image, extents):
+        """Copy extents between RBD images, backup_ceph_diff_queue_depth
+        reads and writes at a time.
+
+        :param extents: list of (offset, length, exists) of the extents to
+                        copy, or discard if they don't exist
+        """
+        io_size = min(self.chunk_size, DIFF_IO_SIZE)
+        total = sum(length for (offset, length, exists) in extents if exists)
+        stats = {'bytes': 0, 'discarded': 0, 'extents': 0}
+        errors = []
+
+        def _copy(offset, length):
+            if errors:
+                return
+            try:
+                data = tpool.execute(src_image.read, offset, length)
+                tpool.execute(dest_image.write, data, offset)
+            except Exception as e:
+                errors.append(e)
+                return
+            done = stats['bytes'] * 10 / total
+            stats['bytes'] += length
+            if stats['bytes'] * 10 / total > done:
+                LOG.debug("Transferred %(bytes)d of %(total)d bytes of "
+                          "changed extents" %
+                          {'bytes': stats['bytes'], 'total': total})
+
+        pool = eventlet.GreenPool(CONF.backup_ceph_diff_queue_depth)
+        for offset, length, exists in extents:
+            if errors:
+                break
+            if not exists:
+                tpool.execute(dest_image.discard, offset, length)
+                stats['discarded'] += length
+                continue
+            stats['extents'] += 1
+            for piece in xrange(offset, offset + length, io_size):
+                pool.spawn_n(_copy, piece,
+                             min(io_size, offset + length - piece))
+        pool.waitall()
+        if errors:
+            raise errors[0]
+        return stats
+
     def _rbd_image_exists(self, name, volume_id, client,
                           try_diff_format=False):
         """Return tuple (exists, name)."""
@@ -686,28 +852,40 @@ class CephBackupDriver(BackupDriver):
         """Returns True if the volume_file is actually an RBD image."""
         return hasattr(volume_file, 'rbd_image')
 
-    def _full_backup(self, backup_id, volume_id, src_volume, src_name, length):
+    def _full_backup(self, backup_id, volume_id, src_volume, src_name, length,
+                     backup=None, offset=0):
         """Perform a full backup of src volume.
 
         First creates a base backup image in our backup location then performs
         an chunked copy of all data from source volume to a new backup rbd
         image.
+
+        :param backup: backup to save checkpoints of the copy in
+        :param offset: offset to resume the copy from, into the image
+                       created by the interrupted backup
         """
         backup_name = self._get_backup_base_name(volume_id, backup_id)
+        timer = CheckpointTimer()
+
+        def _checkpoint(position):
+            if backup is not None and timer.due():
+                self.save_checkpoint(backup, {'operation': 'backup',
+                                              'offset': position})
 
         with rbd_driver.RADOSClient(self, self._ceph_backup_pool) as client:
-            # First create base backup image
-            old_format, features = self._get_rbd_support()
-            LOG.debug("Creating backup base image='%(name)s' for volume "
-                      "%(volume)s."
-                      % {'name': backup_name, 'volume': volume_id})
-            self.rbd.RBD().create(ioctx=client.ioctx,
-                                  name=backup_name,
-                                  size=length,
-                                  old_format=old_format,
-                                  features=features,
-                                  stripe_unit=self.rbd_stripe_unit,
-                                  stripe_count=self.rbd_stripe_count)
+            if not offset:
+                # First create base backup image
+                old_format, features = self._get_rbd_support()
+                LOG.debug("Creating backup base image='%(name)s' for volume "
+                          "%(volume)s."
+                          % {'name': backup_name, 'volume': volume_id})
+                self.rbd.RBD().create(ioctx=client.ioctx,
+                                      name=backup_name,
+                                      size=length,
+                                      old_format=old_format,
+                                      features=features,
+                                      stripe_unit=self.rbd_stripe_unit,
+                                      stripe_count=self.rbd_stripe_count)
 
             LOG.debug("Copying data from volume %s." % volume_id)
             dest_rbd = self.rbd.Image(client.ioctx, backup_name)
@@ -717,8 +895,14 @@ class CephBackupDriver(BackupDriver):
                                                        self._ceph_backup_user,
                                                        self._ceph_backup_conf)
                 rbd_fd = rbd_driver.RBDImageIOWrapper(rbd_meta)
+                if offset:
+                    LOG.info(_("Resuming backup of volume %(volume)s at "
+                               "offset %(offset)d.") %
+                             {'volume': volume_id, 'offset': offset})
+                    src_volume.seek(offset)
+                    rbd_fd.seek(offset)
                 self._transfer_data(src_volume, src_name, rbd_fd, backup_name,
-                                    length)
+                                    length - offset, on_progress=_checkpoint)
             finally:
                 dest_rbd.close()
 
@@ -804,6 +988,10 @@ class CephBackupDriver(BackupDriver):
 
         return backup_snaps[0]['name']
 
+    def can_resume(self, backup):
+        checkpoint = self.get_checkpoint(backup)
+        return checkpoint is not None and checkpoint['operation'] == 'backup'
+
     def _get_volume_size_gb(self, volume):
         """Return the size in gigabytes of the given volume.
 
@@ -857,8 +1045,16 @@ class CephBackupDriver(BackupDriver):
         volume_file.seek(0)
         length = self._get_volume_size_gb(volume)
 
+        checkpoint = self.get_checkpoint(backup)
+        offset = 0
+        if checkpoint and checkpoint['operation'] == 'backup':
+            # Only full backups save checkpoints
+            offset = checkpoint['offset']
+
         do_full_backup = False
-        if self._file_is_rbd(volume_file):
+        if offset:
+            do_full_backup = True
+        elif self._file_is_rbd(volume_file):
             # If volume an RBD, attempt incremental backup.
             try:
                 self._backup_rbd(backup_id, volume_id, volume_file,
@@ -871,10 +1067,12 @@ class CephBackupDriver(BackupDriver):
 
         if do_full_backup:
             self._full_backup(backup_id, volume_id, volume_file,
-                              volume_name, length)
+                              volume_name, length, backup=backup,
+                              offset=offset)
 
         self.db.backup_update(self.context, backup_id,
-                              {'container': self._ceph_backup_pool})
+                              {'container': self._ceph_backup_pool,
+                               'checkpoint': None})
 
         if backup_metadata:
             try:
@@ -28,23 +28,61 @@
 :backup_compression_algorithm: Compression algorithm to use for volume
                                backups. Supported options are:
                                None (to disable), zlib and bz2 (default: zlib)
+:backup_swift_pipeline_depth: The number of Swift objects being compressed
+                              and uploaded, or downloaded ahead, at the
+                              same time (default: 4).
+:backup_swift_connections: The number of Swift objects uploaded or
+                           downloaded at the same time (default: 4).
+:backup_compression_workers: The number of native threads compressing or
+                             decompressing objects at the same time
+                             (default: 2).
+:backup_swift_incremental: Whether to only upload the objects which changed
+                           since the last backup of the volume
+                           (default: False).
+
+Version 1.1.0 backups record the SHA-256 of the data of each object. An
+incremental backup compares them with the ones of the last available backup
+of the volume in the same container, its parent, and lists the objects of
+the parent which didn't change in its own metadata instead of uploading
+them again. Every backup thus lists all the objects it is restored from,
+and objects are only deleted with the last backup listing them. Backups
+record their parent in their checkpoint before they start, so that its
+objects are also kept while they are being created.
+
+Version 1.2.0 backups don't upload the objects which are all zeros. They
+are marked as holes in the metadata, and are zeroed on restore without
+writing zeros where the volume allows it.
+
+Backups and restores save checkpoints of their progress, and resume from
+them after a restart of the service when it uses single_user auth. The
+objects a backup uploaded up to its checkpoint are listed in a
+<prefix>_checkpoint-<count> object. Restores only resume onto block
+devices, file backed volumes are truncated when they are reopened and are
+restored from the beginning.
 """
 
+import collections
 import hashlib
 import json
 import os
 import six
 import socket
+import stat
 
 import eventlet
+from eventlet import pools
+from eventlet import semaphore
+from eventlet import tpool
 from oslo.config import cfg
 
 from cinder.backup.driver import BackupDriver
+from cinder.backup.driver import CheckpointTimer
 from cinder import exception
 from cinder.openstack.common import excutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import timeutils
 from cinder.openstack.common import units
+from cinder.volume import blockcopy
 from swiftclient import client as swift
 
 
@@ -78,6 +116,26 @@ swiftbackup_service_opts = [
     cfg.StrOpt('backup_compression_algorithm',
                default='zlib',
                help='Compression algorithm (None to disable)'),
+    cfg.IntOpt('backup_swift_pipeline_depth',
+               default=4,
+               help='The number of Swift objects of a backup being '
+                    'compressed and uploaded, or downloaded ahead during a '
+                    'restore, at the same time. Up to this many objects are '
+                    'held in memory. 1 handles one object at a time'),
+    cfg.IntOpt('backup_swift_connections',
+               default=4,
+               help='The number of connections to Swift used to upload or '
+                    'download the objects of a backup at the same time'),
+    cfg.IntOpt('backup_compression_workers',
+               default=2,
+               help='The number of native threads compressing or '
+                    'decompressing the objects of a backup at the same '
+                    'time'),
+    cfg.BoolOpt('backup_swift_incremental',
+                default=False,
+                help='Only upload the objects of a backup which changed '
+                     'since the last backup of the volume, and reference '
+                     'the unchanged ones from it'),
 ]
 
 CONF = cfg.CONF
@@ -87,8 +145,15 @@ CONF.register_opts(swiftbackup_service_opts)
 class SwiftBackupDriver(BackupDriver):
     """Provides backup, restore and delete of backup objects within Swift."""
 
-    DRIVER_VERSION = '1.0.0'
-    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1'}
+    DRIVER_VERSION = '1.2.0'
+    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1',
+                              '1.1.0': '_restore_v1',
+                              '1.2.0': '_restore_v1'}
+
+    def can_resume(self, backup):
+        # The token of the user who started the operation can't be renewed
+        return (CONF.backup_swift_auth == 'single_user' and
+                self.get_checkpoint(backup) is not None)
 
     def _get_compressor(self, algorithm):
         try:
@@ -124,16 +189,26 @@ class SwiftBackupDriver(BackupDriver):
                             "but %(param)s not set")
                           % {'param': 'backup_swift_user'})
                 raise exception.ParameterNotFound(param='backup_swift_user')
-            self.conn = swift.Connection(authurl=CONF.backup_swift_url,
-                                         user=CONF.backup_swift_user,
-                                         key=CONF.backup_swift_key,
-                                         retries=self.swift_attempts,
-                                         starting_backoff=self.swift_backoff)
-        else:
-            self.conn = swift.Connection(retries=self.swift_attempts,
-                                         preauthurl=self.swift_url,
-                                         preauthtoken=self.context.auth_token,
-                                         starting_backoff=self.swift_backoff)
+        self.conn = self._connect()
+        self.pipeline_depth = max(1, CONF.backup_swift_pipeline_depth)
+        # A connection can't be shared by concurrent requests
+        self._conns = pools.Pool(max_size=max(1,
+                                              CONF.backup_swift_connections),
+                                 create=self._connect)
+        self._compression = semaphore.Semaphore(
+            max(1, CONF.backup_compression_workers))
+
+    def _connect(self):
+        if CONF.backup_swift_auth == 'single_user':
+            return swift.Connection(authurl=CONF.backup_swift_url,
+                                    user=CONF.backup_swift_user,
+                                    key=CONF.backup_swift_key,
+                                    retries=self.swift_attempts,
+                                    starting_backoff=self.swift_backoff)
+        return swift.Connection(retries=self.swift_attempts,
+                                preauthurl=self.swift_url,
+                                preauthtoken=self.context.auth_token,
+                                starting_backoff=self.swift_backoff)
 
     def _create_container(self, context, backup):
         backup_id = backup['id']
@@ -175,7 +250,7 @@ class SwiftBackupDriver(BackupDriver):
         return filename
 
     def _write_metadata(self, backup, volume_id, container, object_list,
-                        volume_meta):
+                        volume_meta, parent_id=None):
         filename = self._metadata_filename(backup)
         LOG.debug('_write_metadata started, container name: %(container)s,'
                   ' metadata filename: %(filename)s' %
@@ -189,6 +264,7 @@ class SwiftBackupDriver(BackupDriver):
         metadata['created_at'] = str(backup['created_at'])
         metadata['objects'] = object_list
         metadata['volume_meta'] = volume_meta
+        metadata['parent_id'] = parent_id
         metadata_json = json.dumps(metadata, sort_keys=True, indent=2)
         reader = six.StringIO(metadata_json)
         etag = self.conn.put_object(container, filename, reader,
@@ -245,49 +321,198 @@ class SwiftBackupDriver(BackupDriver):
                       'availability_zone': availability_zone,
                   })
         object_meta = {'id': 1, 'list': [], 'prefix': object_prefix,
-                       'volume_meta': None}
+                       'volume_meta': None, 'parent_id': None,
+                       'parent_list': [], 'checkpoint': None}
+        if CONF.backup_swift_incremental:
+            parent = self._get_parent(backup, container)
+            if parent is not None:
+                parent = self._record_parent(backup, parent)
+            if parent is not None:
+                object_meta['parent_id'] = parent['backup_id']
+                object_meta['parent_list'] = parent['objects']
+                LOG.info(_('Backup %(backup_id)s is incremental to backup '
+                           '%(parent_id)s') %
+                         {'backup_id': backup_id,
+                          'parent_id': parent['backup_id']})
         return object_meta, container
 
-    def _backup_chunk(self, backup, container, data, data_offset, object_meta):
-        """Backup data chunk based on the object metadata and offset."""
-        object_prefix = object_meta['prefix']
+    def _record_parent(self, backup, parent):
+        """Record the parent of a backup in its checkpoint before using its
+        objects, and return it, or None if it is being deleted.
+
+        Deletes of the parent started after the record keep the objects
+        the backup is restored from.
+        """
+        self.save_checkpoint(backup, {'operation': 'backup',
+                                      'offset': 0,
+                                      'objects': None,
+                                      'parent_id': parent['backup_id']})
+        status = self.db.backup_get(self.context,
+                                    parent['backup_id'])['status']
+        if status != 'available':
+            LOG.warn(_('Backup %(parent_id)s is %(status)s, making a full '
+                       'backup') % {'parent_id': parent['backup_id'],
+                                    'status': status})
+            self.save_checkpoint(backup, None)
+            return None
+        return parent
+
+    def _resume_backup(self, backup, volume_file, checkpoint):
+        """Return the backup metadata of an interrupted backup at its
+        checkpoint, and seek the volume there.
+        """
+        container = backup['container']
+        object_list = []
+        # Backups interrupted before their first object only recorded
+        # their parent
+        if checkpoint['objects'] is not None:
+            try:
+                (resp, body) = self.conn.get_object(container,
+                                                    checkpoint['objects'])
+            except socket.error as err:
+                raise exception.SwiftConnectionFailed(reason=err)
+            object_list = json.loads(body)
+        object_meta = {'id': len(object_list) + 1, 'list': object_list,
+                       'prefix': backup['service_metadata'],
+                       'volume_meta': None,
+                       'parent_id': checkpoint['parent_id'],
+                       'parent_list': [],
+                       'checkpoint': checkpoint['objects']}
+        if checkpoint['parent_id']:
+            parent = self.db.backup_get(self.context, checkpoint['parent_id'])
+            object_meta['parent_list'] = self._read_metadata(parent)['objects']
+        volume_file.seek(checkpoint['offset'])
+        LOG.info(_('Resuming backup %(backup_id)s at offset %(offset)d') %
+                 {'backup_id': backup['id'], 'offset': checkpoint['offset']})
+        return object_meta, container
+
+    def _checkpoint_backup(self, backup, container, object_meta):
+        """Save the objects uploaded so far to resume the backup from.
+
+        Failing to save a checkpoint doesn't fail the backup.
+        """
         object_list = object_meta['list']
-        object_id = object_meta['id']
-        object_name = '%s-%05d' % (object_prefix, object_id)
-        obj = {}
-        obj[object_name] = {}
-        obj[object_name]['offset'] = data_offset
-        obj[object_name]['length'] = len(data)
-        LOG.debug('reading chunk of data from volume')
+        name = '%s_checkpoint-%05d' % (object_meta['prefix'],
+                                       len(object_list))
+        data = json.dumps(object_list)
+        try:
+            self.conn.put_object(container, name, six.StringIO(data),
+                                 content_length=len(data))
+            self.save_checkpoint(backup, {
+                'operation': 'backup',
+                'offset': object_list[-1].values()[0]['offset'],
+                'objects': name,
+                'parent_id': object_meta['parent_id']})
+        except Exception:
+            LOG.exception(_('Failed to save a checkpoint of backup %s')
+                          % backup['id'])
+            return
+        self._delete_checkpoint(container, object_meta['checkpoint'])
+        object_meta['checkpoint'] = name
+
+    def _delete_checkpoint(self, container, name):
+        if name is None:
+            return
+        try:
+            self.conn.delete_object(container, name)
+        except Exception:
+            LOG.warn(_('swift error while deleting checkpoint %s')
+                     % name)
+
+    def _get_parent(self, backup, container):
+        """Return the metadata of the backup an incremental backup is
+        based on, or None to make a full backup.
+        """
+        backups = self.db.backup_get_all_by_project(
+            self.context, backup['project_id'],
+            filters={'volume_id': backup['volume_id'],
+                     'container': container,
+                     'status': 'available'},
+            sort_key='created_at', sort_dir='desc')
+        backups = [b for b in backups if b['id'] != backup['id']]
+        if not backups:
+            return None
+        try:
+            metadata = self._read_metadata(backups[0])
+        except Exception:
+            LOG.warn(_('Failed to read the metadata of backup %s, making a '
+                       'full backup') % backups[0]['id'])
+            return None
+        # Backups made before version 1.1.0 have no fingerprints
+        if not all('sha256' in obj.values()[0]
+                   for obj in metadata['objects']):
+            return None
+        return metadata
+
+    def _compress_chunk(self, data, parent_sha256=None):
+        """Compress a chunk and return it with its compression, MD5 and
+        SHA-256, or None if its SHA-256 is parent_sha256. The data is None
+        if the chunk is all zeros.
+
+        This runs in a native thread, zlib, bz2 and hashlib releasing the
+        GIL on large buffers.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        if sha256 == parent_sha256:
+            return None
+        if data.count('\0') == len(data):
+            return None, 'none', None, sha256
+        algorithm = 'none'
         if self.compressor is not None:
             algorithm = CONF.backup_compression_algorithm.lower()
-            obj[object_name]['compression'] = algorithm
-            data_size_bytes = len(data)
             data = self.compressor.compress(data)
-            comp_size_bytes = len(data)
-            LOG.debug('compressed %(data_size_bytes)d bytes of data '
-                      'to %(comp_size_bytes)d bytes using '
-                      '%(algorithm)s' %
-                      {
-                          'data_size_bytes': data_size_bytes,
-                          'comp_size_bytes': comp_size_bytes,
-                          'algorithm': algorithm,
-                      })
-        else:
-            LOG.debug('not compressing data')
-            obj[object_name]['compression'] = 'none'
+        return data, algorithm, hashlib.md5(data).hexdigest(), sha256
+
+    def _backup_chunk(self, container, object_name, data, data_offset,
+                      parent_object=None):
+        """Compress and upload a chunk, return its object metadata.
+
+        :param parent_object: the object of the parent backup at the same
+                              offset, returned instead if the chunk didn't
+                              change
+        """
+        data_size_bytes = len(data)
+        parent_sha256 = None
+        if parent_object is not None:
+            parent_name, parent_meta = parent_object.items()[0]
+            if (parent_meta['offset'] == data_offset and
+                    parent_meta['length'] == data_size_bytes):
+                parent_sha256 = parent_meta['sha256']
+        with self._compression:
+            chunk = tpool.execute(self._compress_chunk, data, parent_sha256)
+        if chunk is None:
+            LOG.debug('%(object_name)s unchanged, using %(parent_name)s of '
+                      'the parent backup' %
+                      {'object_name': object_name,
+                       'parent_name': parent_name})
+            return parent_object
+        data, algorithm, md5, sha256 = chunk
+        if data is None:
+            LOG.debug('%s is all zeros, not uploading it' % object_name)
+            return {object_name: {'offset': data_offset,
+                                  'length': data_size_bytes,
+                                  'compression': 'none',
+                                  'hole': True,
+                                  'sha256': sha256}}
+        LOG.debug('compressed %(data_size_bytes)d bytes of data '
+                  'to %(comp_size_bytes)d bytes using '
+                  '%(algorithm)s' %
+                  {
+                      'data_size_bytes': data_size_bytes,
+                      'comp_size_bytes': len(data),
+                      'algorithm': algorithm,
+                  })
 
         reader = six.StringIO(data)
         LOG.debug('About to put_object')
-        try:
-            etag = self.conn.put_object(container, object_name, reader,
-                                        content_length=len(data))
-        except socket.error as err:
-            raise exception.SwiftConnectionFailed(reason=err)
+        with self._conns.item() as conn:
+            try:
+                etag = conn.put_object(container, object_name, reader,
+                                       content_length=len(data))
+            except socket.error as err:
+                raise exception.SwiftConnectionFailed(reason=err)
         LOG.debug('swift MD5 for %(object_name)s: %(etag)s' %
                   {'object_name': object_name, 'etag': etag, })
-        md5 = hashlib.md5(data).hexdigest()
-        obj[object_name]['md5'] = md5
         LOG.debug('backup MD5 for %(object_name)s: %(md5)s' %
                   {'object_name': object_name, 'md5': md5})
         if etag != md5:
@@ -295,12 +520,58 @@ class SwiftBackupDriver(BackupDriver):
                     'swift %(etag)s is not the same as MD5 of object sent '
                     'to swift %(md5)s') % {'etag': etag, 'md5': md5}
             raise exception.InvalidBackup(reason=err)
-        object_list.append(obj)
-        object_id += 1
-        object_meta['list'] = object_list
-        object_meta['id'] = object_id
-        LOG.debug('Calling eventlet.sleep(0)')
-        eventlet.sleep(0)
+        return {object_name: {'offset': data_offset,
+                              'length': data_size_bytes,
+                              'compression': algorithm,
+                              'md5': md5,
+                              'sha256': sha256}}
+
+    def _backup_chunks(self, backup, container, volume_file, object_meta):
+        """Backup the data of volume_file in chunks, in a pipeline.
+
+        The volume is read in this thread while up to pipeline_depth chunks
+        are compressed and uploaded by other threads. The chunks are added
+        to the object list in order as their upload completes.
+        """
+        object_prefix = object_meta['prefix']
+        object_list = object_meta['list']
+        parent_list = object_meta['parent_list']
+        pending = collections.deque()
+        timer = CheckpointTimer()
+
+        def _commit(obj):
+            object_list.append(obj)
+            if timer.due():
+                self._checkpoint_backup(backup, container, object_meta)
+
+        try:
+            while True:
+                LOG.debug('reading chunk of data from volume')
+                data = volume_file.read(self.data_block_size_bytes)
+                data_offset = volume_file.tell()
+                if data == '':
+                    break
+                index = object_meta['id'] - 1
+                object_name = '%s-%05d' % (object_prefix, object_meta['id'])
+                object_meta['id'] += 1
+                parent_object = None
+                if index < len(parent_list):
+                    parent_object = parent_list[index]
+                pending.append(eventlet.spawn(self._backup_chunk, container,
+                                              object_name, data,
+                                              data_offset, parent_object))
+                data = None
+                if len(pending) >= self.pipeline_depth:
+                    _commit(pending.popleft().wait())
+            while pending:
+                _commit(pending.popleft().wait())
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for chunk in pending:
+                    try:
+                        chunk.wait()
+                    except Exception:
+                        pass
 
     def _finalize_backup(self, backup, container, object_meta):
         """Finalize the backup by updating its metadata on Swift."""
@@ -312,11 +583,14 @@ class SwiftBackupDriver(BackupDriver):
                                  backup['volume_id'],
                                  container,
                                  object_list,
-                                 volume_meta)
+                                 volume_meta,
+                                 parent_id=object_meta['parent_id'])
         except socket.error as err:
             raise exception.SwiftConnectionFailed(reason=err)
         self.db.backup_update(self.context, backup['id'],
-                              {'object_count': object_id})
+                              {'object_count': object_id,
+                               'checkpoint': None})
+        self._delete_checkpoint(container, object_meta['checkpoint'])
         LOG.debug('backup %s finished.' % backup['id'])
 
     def _backup_metadata(self, backup, object_meta):
@@ -337,14 +611,13 @@ class SwiftBackupDriver(BackupDriver):
     def backup(self, backup, volume_file, backup_metadata=True):
         """Backup the given volume to Swift."""
 
-        object_meta, container = self._prepare_backup(backup)
-        while True:
-            data = volume_file.read(self.data_block_size_bytes)
-            data_offset = volume_file.tell()
-            if data == '':
-                break
-            self._backup_chunk(backup, container, data,
-                               data_offset, object_meta)
+        checkpoint = self.get_checkpoint(backup)
+        if checkpoint and checkpoint['operation'] == 'backup':
+            object_meta, container = self._resume_backup(backup, volume_file,
+                                                         checkpoint)
+        else:
+            object_meta, container = self._prepare_backup(backup)
+        self._backup_chunks(backup, container, volume_file, object_meta)
 
         if backup_metadata:
             try:
@@ -358,65 +631,175 @@ class SwiftBackupDriver(BackupDriver):
 
         self._finalize_backup(backup, container, object_meta)
 
+    def _restore_chunk(self, container, object_name, compression_algorithm):
+        """Download and decompress an object, return its data."""
+        with self._conns.item() as conn:
+            try:
+                (resp, body) = conn.get_object(container, object_name)
+            except socket.error as err:
+                raise exception.SwiftConnectionFailed(reason=err)
+        decompressor = self._get_compressor(compression_algorithm)
+        if decompressor is not None:
+            LOG.debug('decompressing data using %s algorithm' %
+                      compression_algorithm)
+            with self._compression:
+                body = tpool.execute(decompressor.decompress, body)
+        return body
+
+    def _is_block_device(self, volume_file):
+        """Return True if volume_file is a block device.
+
+        Volume drivers open file backed volumes with 'wb' to restore to
+        them, which truncates what a previous restore wrote, so only
+        restores to block devices can resume.
+        """
+        try:
+            return stat.S_ISBLK(os.fstat(volume_file.fileno()).st_mode)
+        except (AttributeError, IOError, OSError):
+            return False
+
+    def _restore_hole(self, volume_file, length):
+        """Zero length bytes of the volume from its position.
+
+        The blocks are discarded or holes punched when the volume is a
+        block device or file, and zeros written otherwise.
+        """
+        volume_file.flush()
+        offset = volume_file.tell()
+        try:
+            fileno = volume_file.fileno()
+        except IOError:
+            fileno = None
+        if fileno is not None and blockcopy.zero_range(fileno, offset,
+                                                       length):
+            volume_file.seek(offset + length)
+            # Holes punched at the end don't extend files
+            st = os.fstat(fileno)
+            if stat.S_ISREG(st.st_mode) and st.st_size < offset + length:
+                os.ftruncate(fileno, offset + length)
+            return
+
+        zeros = '\0' * min(length, self.data_block_size_bytes)
+        while length > 0:
+            volume_file.write(zeros[:length])
+            length -= len(zeros)
+
     def _restore_v1(self, backup, volume_id, metadata, volume_file):
         """Restore a v1 swift volume backup from swift."""
         backup_id = backup['id']
         LOG.debug('v1 swift volume backup restore of %s started', backup_id)
         container = backup['container']
         metadata_objects = metadata['objects']
-        metadata_object_names = sum((obj.keys() for obj in metadata_objects),
+        # Holes have no object
+        metadata_object_names = sum((obj.keys() for obj in metadata_objects
+                                     if not obj.values()[0].get('hole')),
                                     [])
+        if metadata.get('parent_id'):
+            # Only the objects which changed are under the prefix of an
+            # incremental backup, the other ones are checked as they are
+            # restored
+            object_prefix = backup['service_metadata']
+            metadata_object_names = [name for name in metadata_object_names
+                                     if name.startswith(object_prefix)]
         LOG.debug('metadata_object_names = %s' % metadata_object_names)
         prune_list = [self._metadata_filename(backup)]
+        checkpoint_prefix = '%s_checkpoint-' % backup['service_metadata']
         swift_object_names = [swift_object_name for swift_object_name in
                               self._generate_object_names(backup)
-                              if swift_object_name not in prune_list]
+                              if swift_object_name not in prune_list and
+                              not swift_object_name.startswith(
+                                  checkpoint_prefix)]
         if sorted(swift_object_names) != sorted(metadata_object_names):
             err = _('restore_backup aborted, actual swift object list in '
                     'swift does not match object list stored in metadata')
             raise exception.InvalidBackup(reason=err)
 
-        for metadata_object in metadata_objects:
-            object_name = metadata_object.keys()[0]
-            LOG.debug('restoring object from swift. backup: %(backup_id)s, '
-                      'container: %(container)s, swift object name: '
-                      '%(object_name)s, volume: %(volume_id)s' %
-                      {
-                          'backup_id': backup_id,
-                          'container': container,
-                          'object_name': object_name,
-                          'volume_id': volume_id,
-                      })
-            try:
-                (resp, body) = self.conn.get_object(container, object_name)
-            except socket.error as err:
-                raise exception.SwiftConnectionFailed(reason=err)
-            compression_algorithm = metadata_object[object_name]['compression']
-            decompressor = self._get_compressor(compression_algorithm)
-            if decompressor is not None:
-                LOG.debug('decompressing data using %s algorithm' %
-                          compression_algorithm)
-                decompressed = decompressor.decompress(body)
-                volume_file.write(decompressed)
+        index = 0
+        checkpoint = self.get_checkpoint(backup)
+        if (checkpoint and checkpoint['operation'] == 'restore' and
+                checkpoint['volume_id'] == volume_id):
+            if self._is_block_device(volume_file):
+                index = checkpoint['index']
+                volume_file.seek(checkpoint['offset'])
+                LOG.info(_('Resuming restore of backup %(backup_id)s at '
+                           'offset %(offset)d') %
+                         {'backup_id': backup_id,
+                          'offset': checkpoint['offset']})
             else:
-                volume_file.write(body)
-
-            # force flush every write to avoid long blocking write on close
-            volume_file.flush()
+                LOG.info(_('Restarting restore of backup %s from the '
+                           'beginning, the volume is not a block device')
+                         % backup_id)
+        timer = CheckpointTimer()
+
+        # Objects are downloaded and decompressed ahead of the one being
+        # written
+        pending = collections.deque()
+        objects = iter(metadata_objects[index:])
+        try:
+            while True:
+                for metadata_object in objects:
+                    object_name = metadata_object.keys()[0]
+                    LOG.debug('restoring object from swift. backup: '
+                              '%(backup_id)s, container: %(container)s, '
+                              'swift object name: %(object_name)s, '
+                              'volume: %(volume_id)s' %
+                              {
+                                  'backup_id': backup_id,
+                                  'container': container,
+                                  'object_name': object_name,
+                                  'volume_id': volume_id,
+                              })
+                    object_info = metadata_object[object_name]
+                    chunk = None
+                    if not object_info.get('hole'):
+                        chunk = eventlet.spawn(self._restore_chunk,
+                                               container, object_name,
+                                               object_info['compression'])
+                    pending.append((object_info, chunk))
+                    if len(pending) >= self.pipeline_depth:
+                        break
+                if not pending:
+                    break
+                object_info, chunk = pending.popleft()
+                if chunk is None:
+                    self._restore_hole(volume_file, object_info['length'])
+                else:
+                    volume_file.write(chunk.wait())
 
-            # Be tolerant to IO implementations that do not support fileno()
-            try:
-                fileno = volume_file.fileno()
-            except IOError:
-                LOG.info("volume_file does not support fileno() so skipping "
-                         "fsync()")
-            else:
-                os.fsync(fileno)
+                # force flush every write to avoid long blocking write on
+                # close
+                volume_file.flush()
 
-            # Restoring a backup to a volume can take some time. Yield so other
-            # threads can run, allowing for among other things the service
-            # status to be updated
-            eventlet.sleep(0)
+                # Be tolerant to IO implementations that do not support
+                # fileno()
+                try:
+                    fileno = volume_file.fileno()
+                except IOError:
+                    LOG.info("volume_file does not support fileno() so "
+                             "skipping fsync()")
+                else:
+                    os.fsync(fileno)
+
+                index += 1
+                if timer.due():
+                    self.save_checkpoint(backup, {
+                        'operation': 'restore',
+                        'volume_id': volume_id,
+                        'index': index,
+                        'offset': volume_file.tell()})
+
+                # Restoring a backup to a volume can take some time. Yield
+                # so other threads can run, allowing for among other things
+                # the service status to be updated
+                eventlet.sleep(0)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for object_info, chunk in pending:
+                    try:
+                        if chunk is not None:
+                            chunk.wait()
+                    except Exception:
+                        pass
         LOG.debug('v1 swift volume backup restore of %s finished',
                   backup_id)
 
@@ -448,6 +831,8 @@ class SwiftBackupDriver(BackupDriver):
                    % metadata_version)
             raise exception.InvalidBackup(reason=err)
         restore_func(backup, volume_id, metadata, volume_file)
+        if self.get_checkpoint(backup):
+            self.save_checkpoint(backup, None)
 
         volume_meta = metadata.get('volume_meta', None)
         try:
@@ -463,8 +848,54 @@ class SwiftBackupDriver(BackupDriver):
         LOG.debug('restore %(backup_id)s to %(volume_id)s finished.' %
                   {'backup_id': backup_id, 'volume_id': volume_id})
 
+    def _get_referenced_objects(self, backup):
+        """Return the names of the objects other backups are restored from.
+
+        These are the objects listed by the other backups of the volume in
+        the same container. Backups being created have no metadata yet and
+        use the objects of the parent recorded in their checkpoint.
+
+        :raises: InvalidBackup if the objects used by another backup aren't
+                 known
+        """
+        backups = self.db.backup_get_all_by_project(
+            self.context, backup['project_id'],
+            filters={'volume_id': backup['volume_id'],
+                     'container': backup['container']})
+        referenced = set()
+        for other in backups:
+            if other['id'] == backup['id'] or other['status'] == 'error':
+                continue
+            if other['status'] == 'creating':
+                checkpoint = self.get_checkpoint(other)
+                if not checkpoint or not checkpoint.get('parent_id'):
+                    continue
+                if checkpoint['parent_id'] == backup['id']:
+                    err = (_('backup %s is being created from it') %
+                           other['id'])
+                    raise exception.InvalidBackup(reason=err)
+                used_id = checkpoint['parent_id']
+            else:
+                used_id = other['id']
+            try:
+                if used_id != other['id']:
+                    other = self.db.backup_get(self.context, used_id)
+                metadata = self._read_metadata(other)
+            except Exception:
+                err = (_('failed to read the metadata of backup %s, which '
+                         'may use its objects') % used_id)
+                LOG.exception(err)
+                raise exception.InvalidBackup(reason=err)
+            for obj in metadata['objects']:
+                referenced.update(obj.keys())
+        return referenced
+
     def delete(self, backup):
-        """Delete the given backup from swift."""
+        """Delete the given backup from swift.
+
+        The objects other backups are restored from are kept. The delete
+        is refused when they aren't known.
+        """
         container = backup['container']
         LOG.debug('delete started, backup: %s, container: %s, prefix: %s',
                   backup['id'], container, backup['service_metadata'])
@@ -477,6 +908,26 @@ class SwiftBackupDriver(BackupDriver):
                 LOG.warn(_('swift error while listing objects, continuing'
                            ' with delete'))
 
+            # Objects of the parent backups this one was restored from may
+            # be left to it
+            metadata_filename = self._metadata_filename(backup)
+            if metadata_filename in swift_object_names:
+                try:
+                    metadata = self._read_metadata(backup)
+                except Exception:
+                    LOG.warn(_('swift error while reading metadata, '
+                               'continuing with delete'))
+                else:
+                    for obj in metadata['objects']:
+                        object_name, info = obj.items()[0]
+                        if (not info.get('hole') and
+                                object_name not in swift_object_names):
+                            swift_object_names.append(object_name)
+
+            referenced = self._get_referenced_objects(backup)
+            swift_object_names = [name for name in swift_object_names
+                                  if name not in referenced]
+
             for swift_object_name in swift_object_names:
                 try:
                     self.conn.delete_object(container, swift_object_name)
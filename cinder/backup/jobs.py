@@ -0,0 +1,206 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Scheduling of the backup and restore jobs of a backup service.
+
+Jobs wait in a queue until they fit under the limits on the number of jobs
+running in the service and on the volumes of each volume backend. Restores
+are started before backups, and among jobs of the same type those of the
+tenants with the fewest jobs running first, in the order they were queued.
+
+Jobs are spawned in green threads of their own, so that the RPC handlers
+receiving them return at once and don't wait in the queue, where they would
+hold up the other requests to the service.
+
+The queue itself is unbounded: every request received is queued, whatever
+the number of jobs already waiting. Each queued job only holds a green
+thread and its place in the queue. A volume is backed up or restored to by
+one job at a time, so their number is bound by that of the volumes of the
+backends served, and thus by the volume quotas of the tenants.
+"""
+
+
+import contextlib
+import itertools
+import time
+
+import eventlet
+from eventlet import event
+from oslo.config import cfg
+
+from cinder.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+backup_job_opts = [
+    cfg.IntOpt('backup_max_concurrent_jobs',
+               default=0,
+               help='Maximum number of backups and restores run at once by '
+                    'the backup service, the others wait in a queue. '
+                    '0 => unlimited'),
+    cfg.IntOpt('backup_max_concurrent_jobs_per_backend',
+               default=0,
+               help='Maximum number of backups and restores run at once on '
+                    'the volumes of each volume backend. 0 => unlimited'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(backup_job_opts)
+
+# Jobs of a lower priority are started first
+PRIORITIES = {'restore': 0, 'backup': 1}
+
+
+class _Job(object):
+
+    def __init__(self, seq, kind, backend, project_id):
+        self.seq = seq
+        self.kind = kind
+        self.backend = backend
+        self.project_id = project_id
+        self.queued_at = time.time()
+        self.started = event.Event()
+
+
+class JobScheduler(object):
+    """Queue of backup and restore jobs run under concurrency limits."""
+
+    def __init__(self, max_jobs=0, max_jobs_per_backend=0):
+        self.max_jobs = max_jobs
+        self.max_jobs_per_backend = max_jobs_per_backend
+        self._seq = itertools.count()
+        self._queue = []
+        self._running = 0
+        # backend : number of jobs running on it
+        self._running_by_backend = {}
+        # project id : number of jobs of the tenant running
+        self._running_by_project = {}
+        self._threads = set()
+        self.jobs_started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def spawn(self, kind, backend, project_id, func, *args, **kwargs):
+        """Queue a job and return at once.
+
+        func is called with args and kwargs in a green thread of its own
+        once the job is scheduled, see run().
+        """
+        def _run():
+            try:
+                with self.run(kind, backend, project_id):
+                    func(*args, **kwargs)
+            except Exception:
+                LOG.exception(_('Unexpected error in %s job.') % kind)
+
+        thread = eventlet.spawn(_run)
+        self._threads.add(thread)
+        thread.link(lambda thread: self._threads.discard(thread))
+        return thread
+
+    def wait(self):
+        """Wait for the jobs spawned to finish."""
+        while self._threads:
+            for thread in list(self._threads):
+                thread.wait()
+
+    @contextlib.contextmanager
+    def run(self, kind, backend, project_id):
+        """Wait for the job to be scheduled, and hold its slot while it runs.
+
+        :param kind: 'backup' or 'restore'
+        :param backend: volume backend of the volume of the job
+        :param project_id: tenant of the job
+        """
+        job = _Job(next(self._seq), kind, backend, project_id)
+        self._queue.append(job)
+        self._dispatch()
+        try:
+            job.started.wait()
+        except BaseException:
+            if job in self._queue:
+                self._queue.remove(job)
+            else:
+                self._finish(job)
+            raise
+        try:
+            yield
+        finally:
+            self._finish(job)
+
+    def _can_start(self, job):
+        if self.max_jobs and self._running >= self.max_jobs:
+            return False
+        if (self.max_jobs_per_backend and
+                self._running_by_backend.get(job.backend, 0) >=
+                self.max_jobs_per_backend):
+            return False
+        return True
+
+    def _next(self):
+        jobs = [job for job in self._queue if self._can_start(job)]
+        if not jobs:
+            return None
+        return min(jobs, key=lambda job: (
+            PRIORITIES[job.kind],
+            self._running_by_project.get(job.project_id, 0),
+            job.seq))
+
+    def _dispatch(self):
+        while True:
+            job = self._next()
+            if job is None:
+                break
+            self._queue.remove(job)
+            self._running += 1
+            self._running_by_backend[job.backend] = \
+                self._running_by_backend.get(job.backend, 0) + 1
+            self._running_by_project[job.project_id] = \
+                self._running_by_project.get(job.project_id, 0) + 1
+            wait = time.time() - job.queued_at
+            self.jobs_started += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            LOG.debug('Starting %(kind)s job on backend %(backend)s after '
+                      'waiting %(wait).2fs, %(queued)d jobs queued' %
+                      {'kind': job.kind, 'backend': job.backend,
+                       'wait': wait, 'queued': len(self._queue)})
+            job.started.send()
+
+    def _finish(self, job):
+        self._running -= 1
+        for counts, key in ((self._running_by_backend, job.backend),
+                            (self._running_by_project, job.project_id)):
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+        self._dispatch()
+
+    def get_stats(self):
+        """Return the depth of the queue, jobs running and wait times."""
+        queued = {}
+        for job in self._queue:
+            queued[job.kind] = queued.get(job.kind, 0) + 1
+        wait_avg = 0.0
+        if self.jobs_started:
+            wait_avg = self.total_wait / self.jobs_started
+        return {'queued': len(self._queue),
+                'queued_by_type': queued,
+                'running': self._running,
+                'running_by_backend': dict(self._running_by_backend),
+                'jobs_started': self.jobs_started,
+                'wait_time_avg': round(wait_avg, 2),
+                'wait_time_max': round(self.max_wait, 2)}
@@ -33,9 +33,11 @@ Volume backups can be created, restored, deleted and listed.
 
 """
 
+import eventlet
 from oslo.config import cfg
 from oslo import messaging
 
+from cinder.backup import jobs
 from cinder.backup import rpcapi as backup_rpcapi
 from cinder import context
 from cinder import exception
@@ -43,6 +45,7 @@ from cinder import manager
 from cinder.openstack.common import excutils
 from cinder.openstack.common import importutils
 from cinder.openstack.common import log as logging
+from cinder.openstack.common import periodic_task
 from cinder import utils
 
 LOG = logging.getLogger(__name__)
@@ -76,6 +79,9 @@ class BackupManager(manager.SchedulerDependentManager):
         self.volume_managers = {}
         self._setup_volume_drivers()
         self.backup_rpcapi = backup_rpcapi.BackupAPI()
+        self.jobs = jobs.JobScheduler(
+            CONF.backup_max_concurrent_jobs,
+            CONF.backup_max_concurrent_jobs_per_backend)
         super(BackupManager, self).__init__(service_name='backup',
                                             *args, **kwargs)
 
@@ -187,9 +193,19 @@ class BackupManager(manager.SchedulerDependentManager):
             self._init_volume_driver(ctxt, mgr.driver)
 
         LOG.info(_("Cleaning up incomplete backup operations."))
+        backups = self.db.backup_get_all_by_host(ctxt, self.host)
+        # Operations with a checkpoint are resumed rather than reset
+        resumed = {}
+        for backup in backups:
+            volume_id = self._get_resumable_volume_id(ctxt, backup)
+            if volume_id is not None:
+                resumed[backup['id']] = volume_id
+
         volumes = self.db.volume_get_all_by_host(ctxt, self.host)
         for volume in volumes:
             backend = self._get_volume_backend(host=volume['host'])
+            if volume['id'] in resumed.values():
+                continue
             if volume['status'] == 'backing-up':
                 LOG.info(_('Resetting volume %s to available '
                            '(was backing-up).') % volume['id'])
@@ -203,10 +219,18 @@ class BackupManager(manager.SchedulerDependentManager):
                 self.db.volume_update(ctxt, volume['id'],
                                       {'status': 'error_restoring'})
 
-        # TODO(smulcahy) implement full resume of backup and restore
-        # operations on restart (rather than simply resetting)
-        backups = self.db.backup_get_all_by_host(ctxt, self.host)
         for backup in backups:
+            if backup['id'] in resumed:
+                LOG.info(_('Resuming %(status)s backup %(backup_id)s from '
+                           'its checkpoint.') %
+                         {'status': backup['status'],
+                          'backup_id': backup['id']})
+                if backup['status'] == 'creating':
+                    eventlet.spawn_n(self.create_backup, ctxt, backup['id'])
+                else:
+                    eventlet.spawn_n(self.restore_backup, ctxt,
+                                     backup['id'], resumed[backup['id']])
+                continue
             if backup['status'] == 'creating':
                 LOG.info(_('Resetting backup %s to error (was creating).')
                          % backup['id'])
@@ -222,6 +246,24 @@ class BackupManager(manager.SchedulerDependentManager):
                 LOG.info(_('Resuming delete on backup: %s.') % backup['id'])
                 self.delete_backup(ctxt, backup['id'])
 
+    def _get_resumable_volume_id(self, context, backup):
+        """Return the volume an interrupted operation on backup resumes
+        on, or None if it can't be resumed.
+        """
+        if backup['status'] not in ('creating', 'restoring'):
+            return None
+        if not backup['checkpoint']:
+            return None
+        if (self._map_service_to_driver(backup['service']) !=
+                self.driver_name):
+            return None
+        backup_service = self.service.get_backup_driver(context)
+        if not backup_service.can_resume(backup):
+            return None
+        if backup['status'] == 'creating':
+            return backup['volume_id']
+        return backup_service.get_checkpoint(backup).get('volume_id')
+
     def create_backup(self, context, backup_id):
         """Create volume backups using configured backup service."""
         backup = self.db.backup_get(context, backup_id)
@@ -261,6 +303,13 @@ class BackupManager(manager.SchedulerDependentManager):
                                                        'fail_reason': err})
             raise exception.InvalidBackup(reason=err)
 
+        self.jobs.spawn('backup', backend, backup['project_id'],
+                        self._run_backup, context, backup, volume, backend)
+
+    def _run_backup(self, context, backup, volume, backend):
+        """Back up the volume once the job is scheduled."""
+        backup_id = backup['id']
+        volume_id = volume['id']
         try:
             # NOTE(flaper87): Verify the driver is enabled
             # before going forward. The exception will be caught,
@@ -272,12 +321,13 @@ class BackupManager(manager.SchedulerDependentManager):
             self._get_driver(backend).backup_volume(context, backup,
                                                     backup_service)
         except Exception as err:
-            with excutils.save_and_reraise_exception():
-                self.db.volume_update(context, volume_id,
-                                      {'status': 'available'})
-                self.db.backup_update(context, backup_id,
-                                      {'status': 'error',
-                                       'fail_reason': unicode(err)})
+            LOG.exception(_('Create backup failed, backup: %s.') % backup_id)
+            self.db.volume_update(context, volume_id,
+                                  {'status': 'available'})
+            self.db.backup_update(context, backup_id,
+                                  {'status': 'error',
+                                   'fail_reason': unicode(err)})
+            return
 
         self.db.volume_update(context, volume_id, {'status': 'available'})
         self.db.backup_update(context, backup_id, {'status': 'available',
@@ -340,6 +390,13 @@ class BackupManager(manager.SchedulerDependentManager):
             self.db.volume_update(context, volume_id, {'status': 'error'})
             raise exception.InvalidBackup(reason=err)
 
+        self.jobs.spawn('restore', backend, backup['project_id'],
+                        self._run_restore, context, backup, volume, backend)
+
+    def _run_restore(self, context, backup, volume, backend):
+        """Restore the backup once the job is scheduled."""
+        backup_id = backup['id']
+        volume_id = volume['id']
         try:
             # NOTE(flaper87): Verify the driver is enabled
             # before going forward. The exception will be caught,
@@ -352,11 +409,13 @@ class BackupManager(manager.SchedulerDependentManager):
                                                      volume,
                                                      backup_service)
         except Exception:
-            with excutils.save_and_reraise_exception():
-                self.db.volume_update(context, volume_id,
-                                      {'status': 'error_restoring'})
-                self.db.backup_update(context, backup_id,
-                                      {'status': 'available'})
+            LOG.exception(_('Restore backup failed, backup: %s.') %
+                          backup_id)
+            self.db.volume_update(context, volume_id,
+                                  {'status': 'error_restoring'})
+            self.db.backup_update(context, backup_id,
+                                  {'status': 'available'})
+            return
 
         self.db.volume_update(context, volume_id, {'status': 'available'})
         self.db.backup_update(context, backup_id, {'status': 'available'})
@@ -571,3 +630,16 @@ class BackupManager(manager.SchedulerDependentManager):
 
             LOG.info(_('Import record id %s metadata from driver '
                        'finished.') % backup_id)
+
+    @periodic_task.periodic_task
+    def _report_job_stats(self, context):
+        stats = self.jobs.get_stats()
+        if stats['queued'] or stats['running']:
+            LOG.info(_('Backup jobs: %(running)d running %(by_backend)s, '
+                       '%(queued)d queued, waited %(wait_avg).2fs on '
+                       'average and %(wait_max).2fs at most.') %
+                     {'running': stats['running'],
+                      'by_backend': stats['running_by_backend'],
+                      'queued': stats['queued'],
+                      'wait_avg': stats['wait_time_avg'],
+                      'wait_max': stats['wait_time_max']})
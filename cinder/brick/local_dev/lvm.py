@@ -17,8 +17,10 @@
 LVM class for performing LVM operations.
 """
 
+import collections
 import math
 import re
+import time
 
 import itertools
 
@@ -36,7 +38,7 @@ class LVM(executor.Executor):
 
     def __init__(self, vg_name, root_helper, create_vg=False,
                  physical_volumes=None, lvm_type='default',
-                 executor=putils.execute):
+                 executor=putils.execute, lv_cache_ttl=0):
 
         """Initialize the LVM object.
 
@@ -50,6 +52,9 @@ class LVM(executor.Executor):
         :param physical_volumes: List of PVs to build VG on
         :param lvm_type: VG and Volume type (default, or thin)
         :param executor: Execute method to use, None uses common/processutils
+        :param lv_cache_ttl: Seconds the inventory of the LVs of the VG is
+                             trusted for before being read again, 0 disables
+                             the inventory cache
 
         """
         super(LVM, self).__init__(execute=executor, root_helper=root_helper)
@@ -65,6 +70,9 @@ class LVM(executor.Executor):
         self.vg_thin_pool_free_space = 0.0
         self._supports_snapshot_lv_activation = None
         self._supports_lvchange_ignoreskipactivation = None
+        self.lv_cache_ttl = lv_cache_ttl
+        self._lv_cache = None
+        self._lv_cache_time = 0
 
         if create_vg and physical_volumes is not None:
             self.pv_list = physical_volumes
@@ -233,11 +241,13 @@ class LVM(executor.Executor):
         return self._supports_lvchange_ignoreskipactivation
 
     @staticmethod
-    def get_all_volumes(root_helper, vg_name=None):
+    def get_all_volumes(root_helper, vg_name=None, lv_name=None):
         """Static method to get all LV's on a system.
 
         :param root_helper: root_helper to use for execute
         :param vg_name: optional, gathers info for only the specified VG
+        :param lv_name: optional, gathers info for only the specified LV of
+                        the specified VG
         :returns: List of Dictionaries with LV info
 
         """
@@ -245,12 +255,25 @@ class LVM(executor.Executor):
         cmd = ['env', 'LC_ALL=C', 'lvs', '--noheadings', '--unit=g',
                '-o', 'vg_name,name,size', '--nosuffix']
 
-        if vg_name is not None:
+        if vg_name is not None and lv_name is not None:
+            cmd.append('%s/%s' % (vg_name, lv_name))
+        elif vg_name is not None:
             cmd.append(vg_name)
 
-        (out, err) = putils.execute(*cmd,
-                                    root_helper=root_helper,
-                                    run_as_root=True)
+        try:
+            (out, err) = putils.execute(*cmd,
+                                        root_helper=root_helper,
+                                        run_as_root=True)
+        except putils.ProcessExecutionError as err:
+            # lvs fails when asked for an LV which does not exist, the
+            # message depends on the version of LVM2
+            stderr = err.stderr or ''
+            if lv_name is not None and (
+                    'One or more specified logical volume(s) not found'
+                    in stderr or
+                    'Failed to find logical volume' in stderr):
+                return []
+            raise
 
         lv_list = []
         if out is not None:
@@ -260,25 +283,73 @@ class LVM(executor.Executor):
 
         return lv_list
 
+    def _lv_cache_valid(self):
+        return (self._lv_cache is not None and
+                time.time() - self._lv_cache_time < self.lv_cache_ttl)
+
+    def _lv_cache_set(self, name, size):
+        """Write an LV created or changed by this object to the cache.
+
+        :param name: Name of the LV
+        :param size: Size of the LV in GB, None when it is not known, in
+                     which case the LV is dropped from the cache and looked
+                     up again when next asked for
+        """
+        if self._lv_cache is None:
+            return
+        if size is None:
+            self._lv_cache.pop(name, None)
+        else:
+            self._lv_cache[name] = {'vg': self.vg_name, 'name': name,
+                                    'size': '%.2f' % size}
+
+    @staticmethod
+    def _size_str_to_gb(size_str):
+        """Convert an lvcreate size string like '10g' or '100m' to GB."""
+        match = re.match(r'^(\d+(?:\.\d+)?)([mgt])$', str(size_str).lower())
+        if match is None:
+            return None
+        factor = {'m': 1.0 / 1024, 'g': 1, 't': 1024}[match.group(2)]
+        return float(match.group(1)) * factor
+
     def get_volumes(self):
         """Get all LV's associated with this instantiation (VG).
 
+        The LVs are read with a single lvs call and kept as the inventory
+        used by get_volume for lv_cache_ttl seconds.
+
         :returns: List of Dictionaries with LV info
 
         """
-        self.lv_list = self.get_all_volumes(self._root_helper, self.vg_name)
+        if not self._lv_cache_valid():
+            lv_list = self.get_all_volumes(self._root_helper, self.vg_name)
+            self._lv_cache = collections.OrderedDict(
+                (lv['name'], lv) for lv in lv_list)
+            self._lv_cache_time = time.time()
+        self.lv_list = self._lv_cache.values()
         return self.lv_list
 
     def get_volume(self, name):
         """Get reference object of volume specified by name.
 
+        LVs missing from the inventory are looked up with lvs for this one
+        LV rather than by reading the whole VG.
+
         :returns: dict representation of Logical Volume if exists
 
         """
-        ref_list = self.get_volumes()
+        if self._lv_cache_valid() and name in self._lv_cache:
+            return self._lv_cache[name]
+
+        ref_list = self.get_all_volumes(self._root_helper, self.vg_name,
+                                        name)
         for r in ref_list:
             if r['name'] == name:
+                if self._lv_cache is not None:
+                    self._lv_cache[name] = r
                 return r
+        if self._lv_cache is not None:
+            self._lv_cache.pop(name, None)
 
     @staticmethod
     def get_all_physical_volumes(root_helper, vg_name=None):
@@ -376,12 +447,12 @@ class LVM(executor.Executor):
         self.vg_uuid = vg_list[0]['uuid']
 
         if self.vg_thin_pool is not None:
-            for lv in self.get_all_volumes(self._root_helper, self.vg_name):
-                if lv['name'] == self.vg_thin_pool:
-                    self.vg_thin_pool_size = lv['size']
-                    tpfs = self._get_thin_pool_free_space(self.vg_name,
-                                                          self.vg_thin_pool)
-                    self.vg_thin_pool_free_space = tpfs
+            lv = self.get_volume(self.vg_thin_pool)
+            if lv is not None:
+                self.vg_thin_pool_size = lv['size']
+                tpfs = self._get_thin_pool_free_space(self.vg_name,
+                                                      self.vg_thin_pool)
+                self.vg_thin_pool_free_space = tpfs
 
     def _calculate_thin_pool_size(self):
         """Calculates the correct size for a thin pool.
@@ -439,6 +510,7 @@ class LVM(executor.Executor):
         self._execute(*cmd,
                       root_helper=self._root_helper,
                       run_as_root=True)
+        self._lv_cache_set(name, self._size_str_to_gb(size_str))
 
         self.vg_thin_pool = name
         return size_str
@@ -479,6 +551,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        self._lv_cache_set(name, self._size_str_to_gb(size_str))
 
     def create_lv_snapshot(self, name, source_lv_name, lv_type='default'):
         """Creates a snapshot of a logical volume.
@@ -509,6 +582,8 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        if self._lv_cache is not None:
+            self._lv_cache[name] = dict(source_lvref, name=name)
 
     def _mangle_lv_name(self, name):
         # Linux LVM reserves name that starts with snapshot, so that
@@ -597,6 +672,9 @@ class LVM(executor.Executor):
                 '-f',
                 '%s/%s' % (self.vg_name, name),
                 root_helper=self._root_helper, run_as_root=True)
+        finally:
+            if self._lv_cache is not None:
+                self._lv_cache.pop(name, None)
 
     def revert(self, snapshot_name):
         """Revert an LV from snapshot.
@@ -619,6 +697,22 @@ class LVM(executor.Executor):
                 return True
         return False
 
+    def get_snapshot_usage(self, name):
+        """Return the percentage of the COW of a snapshot LV in use.
+
+        :param name: name of the snapshot LV
+        :returns: float percentage, None if it isn't known
+
+        """
+        out, err = self._execute(
+            'env', 'LC_ALL=C', 'lvs', '--noheadings', '-o', 'snap_percent',
+            '%s/%s' % (self.vg_name, name),
+            root_helper=self._root_helper, run_as_root=True)
+        try:
+            return float(out.strip())
+        except (AttributeError, ValueError):
+            return None
+
     def extend_volume(self, lv_name, new_size):
         """Extend the size of an existing volume."""
 
@@ -633,6 +727,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        self._lv_cache_set(lv_name, self._size_str_to_gb(new_size))
 
     def vg_mirror_free_space(self, mirror_count):
         free_capacity = 0.0
@@ -671,3 +766,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        if self._lv_cache is not None:
+            lv = self._lv_cache.pop(lv_name, None)
+            if lv is not None:
+                self._lv_cache[new_name] = dict(lv, name=new_name)
@@ -29,7 +29,7 @@ LOG = logging.getLogger(__name__)
 
 # copied from glance/db/sqlalchemy/api.py
 def paginate_query(query, model, limit, sort_keys, marker=None,
-                   sort_dir=None, sort_dirs=None):
+                   sort_dir=None, sort_dirs=None, offset=None):
     """Returns a query with sorting / pagination criteria added.
 
     Pagination works by requiring a unique sort_key, specified by sort_keys.
@@ -55,6 +55,7 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
                     results after this value.
     :param sort_dir: direction in which results should be sorted (asc, desc)
     :param sort_dirs: per-column array of sort_dirs, corresponding to sort_keys
+    :param offset: number of items to skip from the marker, or the start
 
     :rtype: sqlalchemy.orm.query.Query
     :return: The query with sorting/pagination added.
@@ -120,6 +121,9 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
         f = sqlalchemy.sql.or_(*criteria_list)
         query = query.filter(f)
 
+    if offset:
+        query = query.offset(offset)
+
     if limit is not None:
         query = query.limit(limit)
 
@@ -222,6 +222,15 @@ def volume_data_get_for_host(context, host, count_only=False):
                                          count_only)
 
 
+def volume_count_get_all_by_host(context, hosts):
+    """Get the number of volumes of each of the given hosts.
+
+    Returns a dict mapping host names to volume counts; hosts without
+    volumes are left out.
+    """
+    return IMPL.volume_count_get_all_by_host(context, hosts)
+
+
 def volume_data_get_for_project(context, project_id):
     """Get (volume_count, gigabytes) for project."""
     return IMPL.volume_data_get_for_project(context, project_id)
@@ -248,10 +257,10 @@ def volume_get(context, volume_id):
 
 
 def volume_get_all(context, marker, limit, sort_key, sort_dir,
-                   filters=None):
+                   filters=None, columns=None):
     """Get all volumes."""
     return IMPL.volume_get_all(context, marker, limit, sort_key, sort_dir,
-                               filters=filters)
+                               filters=filters, columns=columns)
 
 
 def volume_get_all_by_host(context, host):
@@ -260,10 +269,11 @@ def volume_get_all_by_host(context, host):
 
 
 def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
-                              sort_dir, filters=None):
+                              sort_dir, filters=None, columns=None):
     """Get all volumes belonging to a project."""
     return IMPL.volume_get_all_by_project(context, project_id, marker, limit,
-                                          sort_key, sort_dir, filters=filters)
+                                          sort_key, sort_dir, filters=filters,
+                                          columns=columns)
 
 
 def volume_get_iscsi_target_num(context, volume_id):
@@ -280,6 +290,16 @@ def volume_update(context, volume_id, values):
     return IMPL.volume_update(context, volume_id, values)
 
 
+def volume_update_hosts(context, volume_hosts, values=None):
+    """Set the host of several volumes in one transaction.
+
+    :param volume_hosts: dict mapping volume ids to their new host
+    :param values: other properties to set on all of the volumes
+    :returns: the updated volumes; volumes that do not exist are skipped.
+    """
+    return IMPL.volume_update_hosts(context, volume_hosts, values=values)
+
+
 ####################
 
 
@@ -298,14 +318,20 @@ def snapshot_get(context, snapshot_id):
     return IMPL.snapshot_get(context, snapshot_id)
 
 
-def snapshot_get_all(context):
+def snapshot_get_all(context, marker=None, limit=None, sort_key='created_at',
+                     sort_dir='asc', filters=None, offset=None):
     """Get all snapshots."""
-    return IMPL.snapshot_get_all(context)
+    return IMPL.snapshot_get_all(context, marker, limit, sort_key, sort_dir,
+                                 filters=filters, offset=offset)
 
 
-def snapshot_get_all_by_project(context, project_id):
+def snapshot_get_all_by_project(context, project_id, marker=None, limit=None,
+                                sort_key='created_at', sort_dir='asc',
+                                filters=None, offset=None):
     """Get all snapshots belonging to a project."""
-    return IMPL.snapshot_get_all_by_project(context, project_id)
+    return IMPL.snapshot_get_all_by_project(context, project_id, marker,
+                                            limit, sort_key, sort_dir,
+                                            filters=filters, offset=offset)
 
 
 def snapshot_get_all_for_volume(context, volume_id):
@@ -449,6 +475,15 @@ def volume_type_destroy(context, id):
     return IMPL.volume_type_destroy(context, id)
 
 
+def volume_type_generation_get(context):
+    """Get the generation of the set of volume types.
+
+    The generation is incremented each time a volume type is created or
+    destroyed.
+    """
+    return IMPL.volume_type_generation_get(context)
+
+
 def volume_get_active_by_window(context, begin, end=None, project_id=None):
     """Get all the volumes inside the window.
 
@@ -594,6 +629,11 @@ def volume_glance_metadata_get(context, volume_id):
     return IMPL.volume_glance_metadata_get(context, volume_id)
 
 
+def volume_glance_metadata_get_by_volume_ids(context, volume_ids):
+    """Return the glance metadata for the given volumes."""
+    return IMPL.volume_glance_metadata_get_by_volume_ids(context, volume_ids)
+
+
 def volume_snapshot_glance_metadata_get(context, snapshot_id):
     """Return the Glance metadata for the specified snapshot."""
     return IMPL.volume_snapshot_glance_metadata_get(context, snapshot_id)
@@ -764,9 +804,12 @@ def backup_get(context, backup_id):
     return IMPL.backup_get(context, backup_id)
 
 
-def backup_get_all(context, filters=None):
+def backup_get_all(context, filters=None, marker=None, limit=None,
+                   sort_key='created_at', sort_dir='asc', offset=None):
     """Get all backups."""
-    return IMPL.backup_get_all(context, filters=filters)
+    return IMPL.backup_get_all(context, filters=filters, marker=marker,
+                               limit=limit, sort_key=sort_key,
+                               sort_dir=sort_dir, offset=offset)
 
 
 def backup_get_all_by_host(context, host):
@@ -779,10 +822,14 @@ def backup_create(context, values):
     return IMPL.backup_create(context, values)
 
 
-def backup_get_all_by_project(context, project_id, filters=None):
+def backup_get_all_by_project(context, project_id, filters=None, marker=None,
+                              limit=None, sort_key='created_at',
+                              sort_dir='asc', offset=None):
     """Get all backups belonging to a project."""
     return IMPL.backup_get_all_by_project(context, project_id,
-                                          filters=filters)
+                                          filters=filters, marker=marker,
+                                          limit=limit, sort_key=sort_key,
+                                          sort_dir=sort_dir, offset=offset)
 
 
 def backup_update(context, backup_id, values):
@@ -19,15 +19,18 @@
 """Implementation of SQLAlchemy backend."""
 
 
+import functools
 import sys
 import threading
+import time
 import uuid
 import warnings
 
 from oslo.config import cfg
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
-from sqlalchemy.orm import joinedload, joinedload_all
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import joinedload, joinedload_all, subqueryload
 from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.sql.expression import literal_column
 from sqlalchemy.sql import func
@@ -76,6 +79,11 @@ def get_session(**kwargs):
 
 _DEFAULT_QUOTA_NAME = 'default'
 
+# Number of attempts, and base interval in seconds between them, of the
+# calls retried on deadlock.
+_DEADLOCK_RETRIES = 5
+_DEADLOCK_RETRY_INTERVAL = 0.5
+
 
 def get_backend():
     """The backend is this module itself."""
@@ -190,6 +198,31 @@ def require_snapshot_exists(f):
     return wrapper
 
 
+def _retry_on_deadlock(f):
+    """Decorator to retry a DB API call if a deadlock was detected.
+
+    The wrapped call must run in its own transaction, so that a retry
+    starts over from a clean state.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        attempt = 1
+        while True:
+            try:
+                return f(*args, **kwargs)
+            except db_exc.DBDeadlock:
+                if attempt >= _DEADLOCK_RETRIES:
+                    raise
+                LOG.warn(_("Deadlock detected when running "
+                           "'%(func_name)s', attempt %(attempt)d: "
+                           "retrying..."),
+                         {'func_name': f.__name__, 'attempt': attempt})
+                time.sleep(_DEADLOCK_RETRY_INTERVAL * attempt)
+                attempt += 1
+    return wrapper
+
+
 def model_query(context, *args, **kwargs):
     """Query helper that accounts for context's `read_deleted` field.
 
@@ -665,17 +698,25 @@ def _quota_usage_create(context, project_id, resource, in_use, reserved,
 ###################
 
 
-def _reservation_create(context, uuid, usage, project_id, resource, delta,
-                        expire, session=None):
-    reservation_ref = models.Reservation()
-    reservation_ref.uuid = uuid
-    reservation_ref.usage_id = usage['id']
-    reservation_ref.project_id = project_id
-    reservation_ref.resource = resource
-    reservation_ref.delta = delta
-    reservation_ref.expire = expire
-    reservation_ref.save(session=session)
-    return reservation_ref
+def _reservations_create(context, session, usages, project_id, deltas,
+                         expire):
+    """Create the reservations for deltas with a single batched insert.
+
+    Returns the uuids of the reservations.
+    """
+    now = timeutils.utcnow()
+    rows = [{'created_at': now,
+             'deleted': False,
+             'uuid': str(uuid.uuid4()),
+             'usage_id': usages[resource]['id'],
+             'project_id': project_id,
+             'resource': resource,
+             'delta': delta,
+             'expire': expire}
+            for resource, delta in deltas.items()]
+    if rows:
+        session.execute(models.Reservation.__table__.insert(), rows)
+    return [row['uuid'] for row in rows]
 
 
 ###################
@@ -686,18 +727,61 @@ def _reservation_create(context, uuid, usage, project_id, resource, delta,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
-def _get_quota_usages(context, session, project_id):
+def _get_quota_usages(context, session, project_id, resources=None,
+                      lock=True):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-        filter_by(project_id=project_id).\
-        with_lockmode('update').\
-        all()
-    return dict((row.resource, row) for row in rows)
-
-
-@require_context
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+        filter_by(project_id=project_id)
+    if resources is not None:
+        query = query.filter(models.QuotaUsage.resource.in_(resources))
+    if lock:
+        # The session may hold the rows read without the lock, which
+        # would be returned as they were then
+        query = query.order_by(models.QuotaUsage.resource).\
+            with_lockmode('update').populate_existing()
+    return dict((row.resource, row) for row in query.all())
+
+
+def _quota_usage_reserve(context, session, usage, delta, hard_limit):
+    """Add delta to the reserved count of a usage if it fits the limit.
+
+    The limit is checked by the UPDATE statement itself, so the usage
+    row is only locked for the duration of the statement rather than
+    read with a lock first.  Returns whether the usage was updated.
+    """
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+        filter_by(id=usage['id'])
+    if hard_limit >= 0:
+        query = query.filter(models.QuotaUsage.in_use +
+                             models.QuotaUsage.reserved +
+                             delta <= hard_limit)
+    rows = query.update({'reserved': models.QuotaUsage.reserved + delta},
+                        synchronize_session=False)
+    return rows == 1
+
+
+def _quota_usage_needs_refresh(usage, until_refresh, max_age):
+    """Whether a usage has to be refreshed by reserving against it."""
+    if usage is None:
+        return True
+    # Negative in_use count indicates a desync, so try to heal from that.
+    if usage.in_use < 0:
+        return True
+    # The countdown to the next refresh is updated by every reservation.
+    if usage.until_refresh is not None:
+        return True
+    if max_age and usage.updated_at is not None and (
+            (usage.updated_at - timeutils.utcnow()).seconds >= max_age):
+        return True
+    return False
+
+
+@require_context
+@_retry_on_deadlock
 def quota_reserve(context, resources, quotas, deltas, expire,
                   until_refresh, max_age, project_id=None):
     elevated = context.elevated()
@@ -706,11 +790,19 @@ def quota_reserve(context, resources, quotas, deltas, expire,
         if project_id is None:
             project_id = context.project_id
 
-        # Get the current usages
-        usages = _get_quota_usages(context, session, project_id)
+        # Get the current usages of the resources being reserved.  The
+        # reservation itself is made by conditional updates, so the rows
+        # are only locked here if some usage has to be refreshed.
+        usages = _get_quota_usages(context, session, project_id,
+                                   resources=deltas.keys(), lock=False)
+        work = set(resource for resource in deltas
+                   if _quota_usage_needs_refresh(usages.get(resource),
+                                                 until_refresh, max_age))
+        if work:
+            usages.update(_get_quota_usages(context, session, project_id,
+                                            resources=work))
 
         # Handle usage refresh
-        work = set(deltas.keys())
         while work:
             resource = work.pop()
 
@@ -777,18 +869,41 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                     #            for.  We don't check, because this is
                     #            a best-effort mechanism.
 
+        # The conditional updates below must see the refreshed usages
+        session.flush()
+
         # Check for deltas that would go negative
         unders = [r for r, delta in deltas.items()
                   if delta < 0 and delta + usages[r].in_use < 0]
 
-        # Now, let's check the quotas
+        # Now, let's check the quotas and update the reserved quantities
         # NOTE(Vek): We're only concerned about positive increments.
         #            If a project has gone over quota, we want them to
         #            be able to reduce their usage without any
         #            problems.
-        overs = [r for r, delta in deltas.items()
-                 if quotas[r] >= 0 and delta >= 0 and
-                 quotas[r] < delta + usages[r].total]
+        #            Here, though, we're also worried about the
+        #            following scenario:
+        #
+        #            1) User initiates resize down.
+        #            2) User allocates a new instance.
+        #            3) Resize down fails or is reverted.
+        #            4) User is now over quota.
+        #
+        #            To prevent this, we only update the reserved value
+        #            if the delta is positive.
+        # NOTE: The usages are updated in a fixed order, so concurrent
+        #       reservations lock their rows in the same order.
+        overs = []
+        reserved = []
+        for resource in sorted(deltas):
+            delta = deltas[resource]
+            if delta < 0:
+                continue
+            if _quota_usage_reserve(elevated, session, usages[resource],
+                                    delta, quotas[resource]):
+                reserved.append(resource)
+            else:
+                overs.append(resource)
 
         # NOTE(Vek): The quota check needs to be in the transaction,
         #            but the transaction doesn't fail just because
@@ -796,33 +911,15 @@ def quota_reserve(context, resources, quotas, deltas, expire,
         #            outside the transaction.  If we did the raise
         #            here, our usage updates would be discarded, but
         #            they're not invalidated by being over-quota.
-
-        # Create the reservations
-        if not overs:
-            reservations = []
-            for resource, delta in deltas.items():
-                reservation = _reservation_create(elevated,
-                                                  str(uuid.uuid4()),
-                                                  usages[resource],
-                                                  project_id,
-                                                  resource, delta, expire,
-                                                  session=session)
-                reservations.append(reservation.uuid)
-
-                # Also update the reserved quantity
-                # NOTE(Vek): Again, we are only concerned here about
-                #            positive increments.  Here, though, we're
-                #            worried about the following scenario:
-                #
-                #            1) User initiates resize down.
-                #            2) User allocates a new instance.
-                #            3) Resize down fails or is reverted.
-                #            4) User is now over quota.
-                #
-                #            To prevent this, we only update the
-                #            reserved value if the delta is positive.
-                if delta > 0:
-                    usages[resource].reserved += delta
+        if overs:
+            # Give back what was reserved before hitting the limit
+            for resource in reserved:
+                _quota_usage_reserve(elevated, session, usages[resource],
+                                     -deltas[resource], -1)
+        else:
+            # Create the reservations
+            reservations = _reservations_create(elevated, session, usages,
+                                                project_id, deltas, expire)
 
     if unders:
         LOG.warning(_("Change will make usage less than 0 for the following "
@@ -849,6 +946,7 @@ def _quota_reservations(session, context, reservations):
 
 
 @require_context
+@_retry_on_deadlock
 def reservation_commit(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
@@ -864,6 +962,7 @@ def reservation_commit(context, reservations, project_id=None):
 
 
 @require_context
+@_retry_on_deadlock
 def reservation_rollback(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
@@ -1009,6 +1108,20 @@ def volume_data_get_for_host(context, host, count_only=False):
         return (result[0] or 0, result[1] or 0)
 
 
+@require_admin_context
+def volume_count_get_all_by_host(context, hosts):
+    if not hosts:
+        return {}
+    result = model_query(context,
+                         models.Volume.host,
+                         func.count(models.Volume.id),
+                         read_deleted="no").\
+        filter(models.Volume.host.in_(hosts)).\
+        group_by(models.Volume.host).\
+        all()
+    return dict(result)
+
+
 @require_admin_context
 def _volume_data_get_for_project(context, project_id, volume_type_id=None,
                                  session=None):
@@ -1119,6 +1232,28 @@ def _volume_get_query(context, session=None, project_only=False):
             options(joinedload('volume_type'))
 
 
+def _volume_list_query(context, session=None, columns=None):
+    """Query for lists of volumes.
+
+    :param columns: names of the only columns of the volumes to fetch, the
+                    full volumes are fetched if not given
+    """
+    if columns:
+        return model_query(context,
+                           *[getattr(models.Volume, column)
+                             for column in columns],
+                           session=session)
+
+    # The metadata collections are loaded by one more query each, rather
+    # than joined into the query and multiplying its rows.
+    query = model_query(context, models.Volume, session=session).\
+        options(subqueryload('volume_metadata')).\
+        options(joinedload('volume_type'))
+    if is_admin_context(context):
+        query = query.options(subqueryload('volume_admin_metadata'))
+    return query
+
+
 @require_context
 def _volume_get(context, volume_id, session=None):
     result = _volume_get_query(context, session=session, project_only=True).\
@@ -1138,7 +1273,7 @@ def volume_get(context, volume_id):
 
 @require_admin_context
 def volume_get_all(context, marker, limit, sort_key, sort_dir,
-                   filters=None):
+                   filters=None, columns=None):
     """Retrieves all volumes.
 
     :param context: context to query under
@@ -1151,17 +1286,20 @@ def volume_get_all(context, marker, limit, sort_key, sort_dir,
                     'no_migration_targets'=True causes volumes with either
                     a NULL 'migration_status' or a 'migration_status' that
                     does not start with 'target:' to be retrieved.
+    :param columns: names of the only columns to fetch, in which case the
+                    volumes are returned as dicts of those columns
     :returns: list of matching volumes
     """
     session = get_session()
     with session.begin():
         # Generate the query
         query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_key, sort_dir, filters)
+                                         sort_key, sort_dir, filters,
+                                         columns=columns)
         # No volumes would match, return empty list
         if query == None:
             return []
-        return query.all()
+        return _volume_list_results(query, columns)
 
 
 @require_admin_context
@@ -1171,7 +1309,7 @@ def volume_get_all_by_host(context, host):
 
 @require_context
 def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
-                              sort_dir, filters=None):
+                              sort_dir, filters=None, columns=None):
     """"Retrieves all volumes in a project.
 
     :param context: context to query under
@@ -1185,6 +1323,8 @@ def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
                     'no_migration_targets'=True causes volumes with either
                     a NULL 'migration_status' or a 'migration_status' that
                     does not start with 'target:' to be retrieved.
+    :param columns: names of the only columns to fetch, in which case the
+                    volumes are returned as dicts of those columns
     :returns: list of matching volumes
     """
     session = get_session()
@@ -1195,15 +1335,22 @@ def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
         filters['project_id'] = project_id
         # Generate the query
         query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_key, sort_dir, filters)
+                                         sort_key, sort_dir, filters,
+                                         columns=columns)
         # No volumes would match, return empty list
         if query == None:
             return []
-        return query.all()
+        return _volume_list_results(query, columns)
+
+
+def _volume_list_results(query, columns):
+    if columns:
+        return [row._asdict() for row in query.all()]
+    return query.all()
 
 
 def _generate_paginate_query(context, session, marker, limit, sort_key,
-                             sort_dir, filters):
+                             sort_dir, filters, columns=None):
     """Generate the query to include the filters and the paginate options.
 
     Returns a query with sorting / pagination criteria added or None
@@ -1220,9 +1367,10 @@ def _generate_paginate_query(context, session, marker, limit, sort_key,
                     tuples, sets, or frozensets cause an 'IN' test to
                     be performed, while exact matching ('==' operator)
                     is used for other values
+    :param columns: names of the only columns of the volumes to fetch
     :returns: updated query or None
     """
-    query = _volume_get_query(context, session=session)
+    query = _volume_list_query(context, session=session, columns=columns)
 
     if filters:
         filters = filters.copy()
@@ -1303,6 +1451,67 @@ def _generate_paginate_query(context, session, marker, limit, sort_key,
                                           sort_dir=sort_dir)
 
 
+def _generate_model_paginate_query(context, session, query, model,
+                                   get_marker, marker, limit, sort_key,
+                                   sort_dir, filters, offset=None):
+    """Add exact match filters and the paginate options to a model query.
+
+    Returns the query with filtering / sorting / pagination criteria added,
+    or None if the given filters will not yield any results.
+
+    :param context: context to query under
+    :param session: the session to use
+    :param query: query on model to add the criteria to
+    :param model: the ORM model class
+    :param get_marker: called with context, marker and session to get the
+                       item the marker refers to
+    :param marker: the last item of the previous page; we returns the next
+                    results after this value.
+    :param limit: maximum number of items to return
+    :param sort_key: single attributes by which results should be sorted
+    :param sort_dir: direction in which results should be sorted (asc, desc)
+    :param filters: dictionary of filters on the columns of model; values
+                    that are lists, tuples, sets, or frozensets cause an
+                    'IN' test to be performed, while exact matching ('=='
+                    operator) is used for other values
+    :param offset: number of items to skip
+    :returns: updated query or None
+    """
+    if filters:
+        # Holds the simple exact matches
+        filter_dict = {}
+
+        for key, value in filters.iteritems():
+            # Ensure that the filter value exists on the model and is not
+            # a relationship, since those require schema specific knowledge
+            column_attr = getattr(model, key, None)
+            if not isinstance(getattr(column_attr, 'property', None),
+                              ColumnProperty):
+                LOG.debug("'%s' filter key is not valid.", key)
+                return None
+
+            if isinstance(value, (list, tuple, set, frozenset)):
+                # Looking for values in a list; apply to query directly
+                query = query.filter(column_attr.in_(value))
+            else:
+                # OK, simple exact match; save for later
+                filter_dict[key] = value
+
+        # Apply simple exact matches
+        if filter_dict:
+            query = query.filter_by(**filter_dict)
+
+    marker_item = None
+    if marker is not None:
+        marker_item = get_marker(context, marker, session)
+
+    return sqlalchemyutils.paginate_query(query, model, limit,
+                                          [sort_key, 'created_at', 'id'],
+                                          marker=marker_item,
+                                          sort_dir=sort_dir,
+                                          offset=offset)
+
+
 @require_admin_context
 def volume_get_iscsi_target_num(context, volume_id):
     result = model_query(context, models.IscsiTarget, read_deleted="yes").\
@@ -1341,6 +1550,31 @@ def volume_update(context, volume_id, values):
         return volume_ref
 
 
+@require_context
+def volume_update_hosts(context, volume_hosts, values=None):
+    if not volume_hosts:
+        return []
+
+    volume_ids_by_host = {}
+    for volume_id, host in volume_hosts.iteritems():
+        volume_ids_by_host.setdefault(host, []).append(volume_id)
+
+    session = get_session()
+    with session.begin():
+        for host, volume_ids in volume_ids_by_host.iteritems():
+            host_values = dict(values or {})
+            host_values['host'] = host
+            model_query(context, models.Volume, session=session,
+                        project_only=True).\
+                filter(models.Volume.id.in_(volume_ids)).\
+                update(host_values, synchronize_session=False)
+
+        return _volume_get_query(context, session=session,
+                                 project_only=True).\
+            filter(models.Volume.id.in_(volume_hosts.keys())).\
+            all()
+
+
 ####################
 
 def _volume_x_metadata_get_query(context, volume_id, model, session=None):
@@ -1575,11 +1809,40 @@ def snapshot_get(context, snapshot_id):
     return _snapshot_get(context, snapshot_id)
 
 
+def _snapshot_get_all(context, marker, limit, sort_key, sort_dir, filters,
+                      offset):
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.Snapshot, session=session).\
+            options(joinedload('snapshot_metadata'))
+        # Generate the query
+        query = _generate_model_paginate_query(context, session, query,
+                                               models.Snapshot, _snapshot_get,
+                                               marker, limit, sort_key,
+                                               sort_dir, filters, offset)
+        # No snapshots would match, return empty list
+        if query is None:
+            return []
+        return query.all()
+
+
 @require_admin_context
-def snapshot_get_all(context):
-    return model_query(context, models.Snapshot).\
-        options(joinedload('snapshot_metadata')).\
-        all()
+def snapshot_get_all(context, marker=None, limit=None, sort_key='created_at',
+                     sort_dir='asc', filters=None, offset=None):
+    """Retrieves all snapshots.
+
+    :param context: context to query under
+    :param marker: the last item of the previous page, used to determine the
+                   next page of results to return
+    :param limit: maximum number of items to return
+    :param sort_key: single attributes by which results should be sorted
+    :param sort_dir: direction in which results should be sorted (asc, desc)
+    :param filters: exact match filters for the query
+    :param offset: number of items to skip
+    :returns: list of matching snapshots
+    """
+    return _snapshot_get_all(context, marker, limit, sort_key, sort_dir,
+                             filters, offset)
 
 
 @require_context
@@ -1592,12 +1855,28 @@ def snapshot_get_all_for_volume(context, volume_id):
 
 
 @require_context
-def snapshot_get_all_by_project(context, project_id):
+def snapshot_get_all_by_project(context, project_id, marker=None, limit=None,
+                                sort_key='created_at', sort_dir='asc',
+                                filters=None, offset=None):
+    """Retrieves all snapshots in a project.
+
+    :param context: context to query under
+    :param project_id: project for all snapshots being retrieved
+    :param marker: the last item of the previous page, used to determine the
+                   next page of results to return
+    :param limit: maximum number of items to return
+    :param sort_key: single attributes by which results should be sorted
+    :param sort_dir: direction in which results should be sorted (asc, desc)
+    :param filters: exact match filters for the query
+    :param offset: number of items to skip
+    :returns: list of matching snapshots
+    """
     authorize_project_context(context, project_id)
-    return model_query(context, models.Snapshot).\
-        filter_by(project_id=project_id).\
-        options(joinedload('snapshot_metadata')).\
-        all()
+    # Add in the project filter without modifying the given filters
+    filters = filters.copy() if filters else {}
+    filters['project_id'] = project_id
+    return _snapshot_get_all(context, marker, limit, sort_key, sort_dir,
+                             filters, offset)
 
 
 @require_context
@@ -1750,6 +2029,7 @@ def volume_type_create(context, values):
     if not values.get('id'):
         values['id'] = str(uuid.uuid4())
 
+    _resource_generation_ensure(context, 'volume_types')
     session = get_session()
     with session.begin():
         try:
@@ -1770,6 +2050,7 @@ def volume_type_create(context, values):
             session.add(volume_type_ref)
         except Exception as e:
             raise db_exc.DBError(e)
+        _resource_generation_bump(context, 'volume_types', session)
         return volume_type_ref
 
 
@@ -1924,6 +2205,7 @@ def volume_type_qos_specs_get(context, type_id):
 
 @require_admin_context
 def volume_type_destroy(context, id):
+    _resource_generation_ensure(context, 'volume_types')
     session = get_session()
     with session.begin():
         _volume_type_get(context, id, session)
@@ -1943,6 +2225,49 @@ def volume_type_destroy(context, id):
             update({'deleted': True,
                     'deleted_at': timeutils.utcnow(),
                     'updated_at': literal_column('updated_at')})
+        _resource_generation_bump(context, 'volume_types', session)
+
+
+def _resource_generation_ensure(context, resource):
+    """Insert the generation row of a set of resources if it is missing.
+
+    Must be called before the transaction changing the set, so that an
+    insert racing with another one only fails on its own.
+    """
+    if model_query(context, models.ResourceGeneration.id,
+                   read_deleted="no").\
+            filter_by(resource=resource).\
+            first():
+        return
+    generation_ref = models.ResourceGeneration()
+    generation_ref.update({'resource': resource, 'generation': 0})
+    try:
+        generation_ref.save(get_session())
+    except db_exc.DBDuplicateEntry:
+        pass
+
+
+def _resource_generation_bump(context, resource, session):
+    """Increment the generation of a set of resources.
+
+    Must be called within the transaction changing the set, so that the
+    new generation becomes visible along with the change, once the row
+    was ensured by _resource_generation_ensure().
+    """
+    model_query(context, models.ResourceGeneration,
+                session=session, read_deleted="no").\
+        filter_by(resource=resource).\
+        update({'generation': models.ResourceGeneration.generation + 1},
+               synchronize_session=False)
+
+
+@require_context
+def volume_type_generation_get(context):
+    result = model_query(context, models.ResourceGeneration.generation,
+                         read_deleted="no").\
+        filter_by(resource='volume_types').\
+        first()
+    return result[0] if result else 0
 
 
 @require_context
@@ -2412,6 +2737,24 @@ def volume_glance_metadata_get_all(context):
     return _volume_glance_metadata_get_all(context)
 
 
+@require_context
+def volume_glance_metadata_get_by_volume_ids(context, volume_ids):
+    """Return the Glance metadata for the given volumes.
+
+    The metadata of all the volumes is read with one query, volumes without
+    Glance metadata, or which are not visible to the context, are skipped.
+    """
+    if not volume_ids:
+        return []
+    query = model_query(context, models.VolumeGlanceMetadata).\
+        filter(models.VolumeGlanceMetadata.volume_id.in_(volume_ids))
+    if is_user_context(context):
+        query = query.join(models.Volume,
+                           models.VolumeGlanceMetadata.volume).\
+            filter(models.Volume.project_id == context.project_id)
+    return query.all()
+
+
 @require_context
 @require_volume_exists
 def _volume_glance_metadata_get(context, volume_id, session=None):
@@ -2579,8 +2922,9 @@ def volume_glance_metadata_delete_by_snapshot(context, snapshot_id):
 
 
 @require_context
-def backup_get(context, backup_id):
-    result = model_query(context, models.Backup, project_only=True).\
+def _backup_get(context, backup_id, session=None):
+    result = model_query(context, models.Backup, session=session,
+                         project_only=True).\
         filter_by(id=backup_id).\
         first()
 
@@ -2590,20 +2934,32 @@ def backup_get(context, backup_id):
     return result
 
 
-def _backup_get_all(context, filters=None):
+@require_context
+def backup_get(context, backup_id):
+    return _backup_get(context, backup_id)
+
+
+def _backup_get_all(context, filters=None, marker=None, limit=None,
+                    sort_key='created_at', sort_dir='asc', offset=None):
     session = get_session()
     with session.begin():
         # Generate the query
-        query = model_query(context, models.Backup)
-        if filters:
-            query = query.filter_by(**filters)
-
+        query = model_query(context, models.Backup, session=session)
+        query = _generate_model_paginate_query(context, session, query,
+                                               models.Backup, _backup_get,
+                                               marker, limit, sort_key,
+                                               sort_dir, filters, offset)
+        # No backups would match, return empty list
+        if query is None:
+            return []
         return query.all()
 
 
 @require_admin_context
-def backup_get_all(context, filters=None):
-    return _backup_get_all(context, filters)
+def backup_get_all(context, filters=None, marker=None, limit=None,
+                   sort_key='created_at', sort_dir='asc', offset=None):
+    return _backup_get_all(context, filters, marker, limit, sort_key,
+                           sort_dir, offset)
 
 
 @require_admin_context
@@ -2612,7 +2968,9 @@ def backup_get_all_by_host(context, host):
 
 
 @require_context
-def backup_get_all_by_project(context, project_id, filters=None):
+def backup_get_all_by_project(context, project_id, filters=None, marker=None,
+                              limit=None, sort_key='created_at',
+                              sort_dir='asc', offset=None):
 
     authorize_project_context(context, project_id)
     if not filters:
@@ -2622,7 +2980,8 @@ def backup_get_all_by_project(context, project_id, filters=None):
 
     filters['project_id'] = project_id
 
-    return _backup_get_all(context, filters)
+    return _backup_get_all(context, filters, marker, limit, sort_key,
+                           sort_dir, offset)
 
 
 @require_context
@@ -0,0 +1,66 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Integer
+from sqlalchemy import MetaData, String, Table
+
+from cinder.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # New table
+    resource_generations = Table(
+        'resource_generations', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('resource', String(length=255), nullable=False, unique=True),
+        Column('generation', Integer, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+
+    try:
+        resource_generations.create()
+    except Exception:
+        LOG.error(_("Table |%s| not created!"), repr(resource_generations))
+        raise
+
+    try:
+        resource_generations.insert().execute(
+            {'created_at': datetime.datetime.utcnow(),
+             'resource': 'volume_types',
+             'generation': 0,
+             'deleted': False, })
+    except Exception:
+        LOG.error(_("volume_types generation not inserted into the DB."))
+        raise
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    resource_generations = Table('resource_generations', meta, autoload=True)
+    try:
+        resource_generations.drop()
+    except Exception:
+        LOG.error(_("resource_generations table not dropped"))
+        raise
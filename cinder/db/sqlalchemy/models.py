@@ -334,6 +334,21 @@ class Reservation(BASE, CinderBase):
                     'QuotaUsage.deleted == 0)')
 
 
+class ResourceGeneration(BASE, CinderBase):
+    """Represents the generation of a set of resources.
+
+    The generation is incremented each time the set changes, so that
+    processes caching something derived from it can tell their copy is
+    stale with a single row lookup.
+    """
+
+    __tablename__ = 'resource_generations'
+    id = Column(Integer, primary_key=True)
+
+    resource = Column(String(255), nullable=False, unique=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
 class Snapshot(BASE, CinderBase):
     """Represents a snapshot of volume."""
     __tablename__ = 'snapshots'
@@ -424,6 +439,8 @@ class Backup(BASE, CinderBase):
     service = Column(String(255))
     size = Column(Integer)
     object_count = Column(Integer)
+    # JSON progress of an interrupted backup or restore, to resume it
+    checkpoint = Column(Text)
 
 
 class Encryption(BASE, CinderBase):
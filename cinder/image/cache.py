@@ -0,0 +1,215 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+On-disk cache of the images volumes are created from.
+
+Entries are keyed by image id and checksum, so an image updated in glance
+never hits a stale entry. Both the image as fetched from glance and the
+forms it was converted to for volumes are kept, and the least recently
+used entries are evicted once the cache grows over its size limit.
+
+Entries in use hold a shared flock() on their file, which eviction by any
+process sharing the cache directory honors.
+"""
+
+
+import contextlib
+import errno
+import fcntl
+import os
+import tempfile
+
+from oslo.config import cfg
+
+from cinder.openstack.common import fileutils
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import units
+from cinder import utils
+
+LOG = logging.getLogger(__name__)
+
+image_cache_opts = [
+    cfg.StrOpt('image_cache_dir',
+               default='$state_path/image-cache',
+               help='Directory where the images volumes are created from '
+                    'are cached'),
+    cfg.IntOpt('image_cache_max_size_gb',
+               default=0,
+               help='Maximum size of the image cache in GB, the least '
+                    'recently used images are evicted beyond it. 0 disables '
+                    'the cache'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_cache_opts)
+
+_TMP_PREFIX = 'tmp'
+
+_cache = None
+
+
+class ImageCache(object):
+    """Size bounded LRU cache of image files."""
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Lookups of the images as fetched from glance, one per volume
+        # created from an image
+        self.hits = 0
+        self.misses = 0
+        # Lookups of the forms images were converted to
+        self.converted_hits = 0
+        self.converted_misses = 0
+
+    def _entry_path(self, image_id, checksum, disk_format=None):
+        name = '%s-%s' % (image_id, checksum)
+        if disk_format:
+            name = '%s.%s' % (name, disk_format)
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def _entry_lock(path):
+        return 'image-cache-%s' % os.path.basename(path)
+
+    @contextlib.contextmanager
+    def get(self, image_id, checksum, fill, disk_format=None):
+        """Yield the path of a cached image, filling the entry on a miss.
+
+        Concurrent requests for the same entry wait for a single fill.
+
+        :param image_id: id of the image in glance
+        :param checksum: checksum of the image in glance
+        :param fill: callable writing the entry to the path it is given
+        :param disk_format: format the image was converted to, None for the
+                            image as fetched from glance
+        """
+        path = self._entry_path(image_id, checksum, disk_format)
+
+        @utils.synchronized(self._entry_lock(path), external=True)
+        def _open_entry():
+            hit = os.path.exists(path)
+            if disk_format:
+                if hit:
+                    self.converted_hits += 1
+                else:
+                    self.converted_misses += 1
+            elif hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            if hit:
+                os.utime(path, None)
+            else:
+                fileutils.ensure_tree(self.cache_dir)
+                fd, tmp = tempfile.mkstemp(dir=self.cache_dir,
+                                           prefix=_TMP_PREFIX)
+                os.close(fd)
+                with fileutils.remove_path_on_error(tmp):
+                    fill(tmp)
+                os.rename(tmp, path)
+
+            # The lock is taken before the entry lock is released, so that
+            # the entry can't be evicted in between
+            entry = open(path, 'rb')
+            fcntl.flock(entry, fcntl.LOCK_SH)
+            return entry, not hit
+
+        entry, filled = _open_entry()
+        try:
+            if filled:
+                LOG.debug('Cached image %(image_id)s at %(path)s' %
+                          {'image_id': image_id, 'path': path})
+                self._evict()
+            yield path
+        finally:
+            entry.close()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(_TMP_PREFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Remove the least recently used entries over the size limit."""
+
+        @utils.synchronized('image-cache', external=True)
+        def _evict_entries():
+            entries = sorted(self._entries())
+            size = sum(entry[1] for entry in entries)
+            for mtime, entry_size, path in entries:
+                if size <= self.max_size:
+                    break
+                if self._remove_entry(path):
+                    size -= entry_size
+
+        _evict_entries()
+
+    def _remove_entry(self, path):
+        """Remove an entry unless it is in use, return if it was removed."""
+
+        @utils.synchronized(self._entry_lock(path), external=True)
+        def _remove():
+            try:
+                entry = open(path, 'rb')
+            except IOError:
+                return False
+            with entry:
+                try:
+                    fcntl.flock(entry, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    if e.errno not in (errno.EACCES, errno.EAGAIN):
+                        raise
+                    return False
+                LOG.debug('Evicting %s from the image cache' % path)
+                fileutils.delete_if_exists(path)
+                return True
+
+        return _remove()
+
+    def get_stats(self):
+        """Return the hits, misses and size of the cache."""
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'converted_hits': self.converted_hits,
+                'converted_misses': self.converted_misses,
+                'entries': len(entries),
+                'size_gb': round(float(size) / units.Gi, 2),
+                'max_size_gb': self.max_size / units.Gi}
+
+
+def get_cache():
+    """Return the image cache, or None if it is disabled."""
+    global _cache
+    if not CONF.image_cache_max_size_gb:
+        return None
+    if _cache is None:
+        _cache = ImageCache(CONF.image_cache_dir,
+                            CONF.image_cache_max_size_gb * units.Gi)
+    return _cache
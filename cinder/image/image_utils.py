@@ -31,6 +31,7 @@ import tempfile
 from oslo.config import cfg
 
 from cinder import exception
+from cinder.image import cache as image_cache
 from cinder.openstack.common import fileutils
 from cinder.openstack.common import imageutils
 from cinder.openstack.common import log as logging
@@ -44,7 +45,13 @@ LOG = logging.getLogger(__name__)
 image_helper_opt = [cfg.StrOpt('image_conversion_dir',
                                default='$state_path/conversion',
                                help='Directory used for temporary storage '
-                                    'during image conversion'), ]
+                                    'during image conversion'),
+                    cfg.BoolOpt('image_stream_raw',
+                                default=True,
+                                help='Write raw images to raw volumes as '
+                                     'they are downloaded, without going '
+                                     'through a temporary file and '
+                                     'qemu-img convert'), ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_helper_opt)
@@ -139,6 +146,11 @@ def fetch_to_volume_format(context, image_service,
     qemu_img = True
     image_meta = image_service.show(context, image_id)
 
+    if _can_stream_to_volume(image_meta, volume_format):
+        stream_to_volume(context, image_service, image_id, image_meta, dest,
+                         size)
+        return
+
     # NOTE(avishay): I'm not crazy about creating temp files which may be
     # large and cause disk full errors which would confuse users.
     # Unfortunately it seems that you can't pipe to 'qemu-img convert' because
@@ -170,6 +182,14 @@ def fetch_to_volume_format(context, image_service,
                              "can be used if qemu-img is not installed."),
                     image_id=image_id)
 
+        cache = image_cache.get_cache()
+        if qemu_img and cache and image_meta and image_meta.get('checksum'):
+            _fetch_cached_to_volume_format(cache, context, image_service,
+                                           image_id, image_meta, dest,
+                                           volume_format, user_id,
+                                           project_id, size)
+            return
+
         fetch(context, image_service, image_id, tmp, user_id, project_id)
 
         if is_xenserver_image(context, image_service, image_id):
@@ -186,50 +206,206 @@ def fetch_to_volume_format(context, image_service,
             return
 
         data = qemu_img_info(tmp)
-        virt_size = data.virtual_size / units.Gi
+        _check_image_info(image_id, data, size)
 
-        # NOTE(xqueralt): If the image virtual size doesn't fit in the
-        # requested volume there is no point on resizing it because it will
-        # generate an unusable image.
-        if size is not None and virt_size > size:
-            params = {'image_size': virt_size, 'volume_size': size}
-            reason = _("Size is %(image_size)dGB and doesn't fit in a "
-                       "volume of size %(volume_size)dGB.") % params
-            raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
-
-        fmt = data.file_format
-        if fmt is None:
-            raise exception.ImageUnacceptable(
-                reason=_("'qemu-img info' parsing failed."),
-                image_id=image_id)
+        # NOTE(jdg): I'm using qemu-img convert to write
+        # to the volume regardless if it *needs* conversion or not.
+        # Raw images are streamed to raw volumes by stream_to_volume()
+        # instead, which checks their header for other formats.
+        LOG.debug("%s was %s, converting to %s " % (image_id,
+                                                    data.file_format,
+                                                    volume_format))
+        convert_image(tmp, dest, volume_format,
+                      bps_limit=CONF.volume_copy_bps_limit)
+        _check_converted_image(image_id, dest, volume_format)
+
+
+# Magic numbers of the image formats qemu-img would not treat as raw, and
+# their offsets
+_IMAGE_MAGICS = ((0, 'QFI\xfb'),  # qcow, qcow2
+                 (0, 'QED\x00'),  # qed
+                 (0, 'KDMV'),  # vmdk
+                 (0, 'COWD'),  # vmdk
+                 (0, 'conectix'),  # vpc
+                 (0, 'vhdxfile'),  # vhdx
+                 (64, '\x7f\x10\xda\xbe'),  # vdi
+                 (0, 'WithoutFreeSpace'),  # parallels
+                 (0, 'WithouFreSpacExt'),  # parallels
+                 (0, 'OOOM'),  # cow
+                 (0, 'CXSB'),  # cloop
+                 (0, '#!/bin/sh\n#V2.0 Format\nmodprobe cloop'),  # cloop
+                 (0, 'Bochs Virtual HD Image'))  # bochs
+_IMAGE_HEADER_SIZE = 512
+
+
+def _can_stream_to_volume(image_meta, volume_format):
+    if not (CONF.image_stream_raw and image_meta and volume_format == 'raw'
+            and image_meta.get('disk_format') == 'raw'
+            and image_meta.get('size') is not None):
+        return False
+    if is_xenserver_format(image_meta):
+        return False
+    # Cached images are written from the cache instead
+    return not (image_cache.get_cache() and image_meta.get('checksum'))
+
+
+class _RawImageWriter(object):
+    """File-like object writing a raw image to a volume as it is read.
+
+    The data is only written once its header is known not to belong to an
+    image format qemu-img could have been handed as raw.
+    """
+
+    def __init__(self, image_id, volume_file):
+        self.image_id = image_id
+        self.volume_file = volume_file
+        self.header = ''
+        self.written = 0
+
+    def _check_header(self):
+        for offset, magic in _IMAGE_MAGICS:
+            if self.header[offset:offset + len(magic)] == magic:
+                raise exception.ImageUnacceptable(
+                    image_id=self.image_id,
+                    reason=_("Image claims to be raw but its content is "
+                             "not."))
 
-        backing_file = data.backing_file
-        if backing_file is not None:
-            raise exception.ImageUnacceptable(
-                image_id=image_id,
-                reason=_("fmt=%(fmt)s backed by:%(backing_file)s")
-                % {'fmt': fmt, 'backing_file': backing_file, })
+    def _write(self, data):
+        self.volume_file.write(data)
+        self.written += len(data)
 
-        # NOTE(jdg): I'm using qemu-img convert to write
-        # to the volume regardless if it *needs* conversion or not
-        # TODO(avishay): We can speed this up by checking if the image is raw
-        # and if so, writing directly to the device. However, we need to keep
-        # check via 'qemu-img info' that what we copied was in fact a raw
-        # image and not a different format with a backing file, which may be
-        # malicious.
+    def write(self, data):
+        if self.header is None:
+            self._write(data)
+            return
+        self.header += data
+        if len(self.header) >= _IMAGE_HEADER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.header is not None:
+            self._check_header()
+            header, self.header = self.header, None
+            self._write(header)
+        self.volume_file.flush()
+
+
+def stream_to_volume(context, image_service, image_id, image_meta, dest,
+                     size=None):
+    """Write a raw image to a volume as it is downloaded.
+
+    :param image_meta: metadata of the image, with a 'raw' disk_format
+    :param dest: path of the volume
+    :param size: size of the volume in GB
+    """
+    image_size = image_meta['size']
+    if size is not None and image_size > size * units.Gi:
+        params = {'image_size': image_size / units.Gi, 'volume_size': size}
+        reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                   "volume of size %(volume_size)dGB.") % params
+        raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
+
+    LOG.debug('Streaming raw image %(image_id)s to volume %(dest)s - '
+              'size: %(size)s' % {'image_id': image_id, 'dest': dest,
+                                  'size': image_size})
+
+    def _stream():
+        # NOTE: r+b doesn't truncate volumes backed by files
+        with fileutils.file_open(dest, 'r+b') as volume_file:
+            writer = _RawImageWriter(image_id, volume_file)
+            image_service.download(context, image_id, writer)
+            writer.flush()
+            os.fsync(volume_file.fileno())
+        return writer.written
+
+    if os.name == 'nt' or os.access(dest, os.W_OK):
+        written = _stream()
+    else:
+        with utils.temporary_chown(dest):
+            written = _stream()
+
+    if written != image_size:
+        raise exception.ImageUnacceptable(
+            image_id=image_id,
+            reason=_("Wrote %(written)d bytes of an image of %(size)d "
+                     "bytes.") % {'written': written, 'size': image_size})
+
+
+def _check_image_info(image_id, data, size=None):
+    """Check that a fetched image can be written to a volume of size GB."""
+    virt_size = data.virtual_size / units.Gi
+
+    # NOTE(xqueralt): If the image virtual size doesn't fit in the
+    # requested volume there is no point on resizing it because it will
+    # generate an unusable image.
+    if size is not None and virt_size > size:
+        params = {'image_size': virt_size, 'volume_size': size}
+        reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                   "volume of size %(volume_size)dGB.") % params
+        raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
+
+    fmt = data.file_format
+    if fmt is None:
+        raise exception.ImageUnacceptable(
+            reason=_("'qemu-img info' parsing failed."),
+            image_id=image_id)
+
+    backing_file = data.backing_file
+    if backing_file is not None:
+        raise exception.ImageUnacceptable(
+            image_id=image_id,
+            reason=_("fmt=%(fmt)s backed by:%(backing_file)s")
+            % {'fmt': fmt, 'backing_file': backing_file, })
+
+
+def _check_converted_image(image_id, path, volume_format):
+    data = qemu_img_info(path)
+    if data.file_format != volume_format:
+        raise exception.ImageUnacceptable(
+            image_id=image_id,
+            reason=_("Converted to %(vol_format)s, but format is "
+                     "now %(file_format)s") % {'vol_format': volume_format,
+                                               'file_format': data.
+                                               file_format})
+
+
+def _fetch_cached_to_volume_format(cache, context, image_service, image_id,
+                                   image_meta, dest, volume_format,
+                                   user_id=None, project_id=None, size=None):
+    """Write an image to a volume through the image cache.
+
+    The image is only fetched from glance, and converted to the format of
+    the volume, if the cache doesn't hold it yet.
+    """
+    checksum = image_meta['checksum']
+
+    def _fetch(path):
+        fetch(context, image_service, image_id, path, user_id, project_id)
+        if is_xenserver_format(image_meta):
+            replace_xenserver_image_with_coalesced_vhd(path)
+        _check_image_info(image_id, qemu_img_info(path))
+
+    def _write(path, fmt):
         LOG.debug("%s was %s, converting to %s " % (image_id, fmt,
                                                     volume_format))
-        convert_image(tmp, dest, volume_format,
+        convert_image(path, dest, volume_format,
                       bps_limit=CONF.volume_copy_bps_limit)
+        _check_converted_image(image_id, dest, volume_format)
 
-        data = qemu_img_info(dest)
-        if data.file_format != volume_format:
-            raise exception.ImageUnacceptable(
-                image_id=image_id,
-                reason=_("Converted to %(vol_format)s, but format is "
-                         "now %(file_format)s") % {'vol_format': volume_format,
-                                                   'file_format': data.
-                                                   file_format})
+    with cache.get(image_id, checksum, _fetch) as fetched:
+        data = qemu_img_info(fetched)
+        _check_image_info(image_id, data, size)
+        if data.file_format == volume_format:
+            _write(fetched, data.file_format)
+            return
+
+        def _convert(path):
+            convert_image(fetched, path, volume_format)
+            _check_converted_image(image_id, path, volume_format)
+
+        with cache.get(image_id, checksum, _convert,
+                       disk_format=volume_format) as converted:
+            _write(converted, volume_format)
 
 
 def upload_volume(context, image_service, image_meta, volume_path,
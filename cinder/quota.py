@@ -57,7 +57,14 @@ quota_opts = [
     cfg.BoolOpt('use_default_quota_class',
                 default=True,
                 help='Enables or disables use of default quota class '
-                     'with default quota.'), ]
+                     'with default quota.'),
+    cfg.IntOpt('quota_resources_cache_ttl',
+               default=10,
+               help='Number of seconds the quota resources built from the '
+                    'volume types are used for before checking whether '
+                    'volume types were created or destroyed. Resources '
+                    'which aren\'t known yet are always checked for. 0 => '
+                    'check on every use'), ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
@@ -847,12 +854,49 @@ class QuotaEngine(object):
 
 
 class VolumeTypeQuotaEngine(QuotaEngine):
-    """Represent the set of all quotas."""
+    """Represent the set of all quotas.
+
+    The resources are built from the volume types and kept along with the
+    generation of the volume types they were built from.  They are only
+    rebuilt once that generation, which is bumped in the database whenever
+    a volume type is created or destroyed, has moved.  The generation is
+    checked at most once every quota_resources_cache_ttl seconds, or when
+    a reservation or limit check names a resource which isn't known.
+    """
+
+    def __init__(self, quota_driver_class=None):
+        super(VolumeTypeQuotaEngine, self).__init__(quota_driver_class)
+        # (<volume types generation>, <checked at>, <resources>)
+        self._resources_cache = None
 
     @property
     def resources(self):
         """Fetches all possible quota resources."""
 
+        return self._get_resources()
+
+    def _get_resources(self, names=()):
+        """Return the resources, checking the generation of the volume
+        types if it is due or if any of the given names isn't known.
+        """
+        cached = self._resources_cache
+        if (cached is not None and
+                not timeutils.is_older_than(
+                    cached[1], CONF.quota_resources_cache_ttl) and
+                all(name in cached[2] for name in names)):
+            return cached[2]
+
+        admin_context = context.get_admin_context()
+        checked_at = timeutils.utcnow()
+        generation = db.volume_type_generation_get(admin_context)
+        if cached is None or cached[0] != generation:
+            resources = self._build_resources(admin_context)
+        else:
+            resources = cached[2]
+        self._resources_cache = (generation, checked_at, resources)
+        return resources
+
+    def _build_resources(self, admin_context):
         result = {}
         # Global quotas.
         argses = [('volumes', '_sync_volumes', 'quota_volumes'),
@@ -863,14 +907,28 @@ class VolumeTypeQuotaEngine(QuotaEngine):
             result[resource.name] = resource
 
         # Volume type quotas.
-        volume_types = db.volume_type_get_all(context.get_admin_context(),
-                                              False)
+        volume_types = db.volume_type_get_all(admin_context, False)
         for volume_type in volume_types.values():
             for part_name in ('volumes', 'gigabytes', 'snapshots'):
                 resource = VolumeTypeResource(part_name, volume_type)
                 result[resource.name] = resource
         return result
 
+    def invalidate_resources(self):
+        """Drop the cached resources, they are rebuilt on next access."""
+
+        self._resources_cache = None
+
+    def limit_check(self, context, project_id=None, **values):
+        self._get_resources(values)
+        return super(VolumeTypeQuotaEngine, self).limit_check(
+            context, project_id=project_id, **values)
+
+    def reserve(self, context, expire=None, project_id=None, **deltas):
+        self._get_resources(deltas)
+        return super(VolumeTypeQuotaEngine, self).reserve(
+            context, expire=expire, project_id=project_id, **deltas)
+
     def register_resource(self, resource):
         raise NotImplementedError(_("Cannot register resource"))
 
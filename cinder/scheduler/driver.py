@@ -19,9 +19,12 @@
 Scheduler base class that all Schedulers should inherit from
 """
 
+import copy
+
 from oslo.config import cfg
 
 from cinder import db
+from cinder import exception
 from cinder.openstack.common import importutils
 from cinder.openstack.common import timeutils
 from cinder.volume import rpcapi as volume_rpcapi
@@ -50,6 +53,18 @@ def volume_update_db(context, volume_id, host):
     return db.volume_update(context, volume_id, values)
 
 
+def volumes_update_db(context, volume_hosts):
+    '''Set the host and the scheduled_at field of several volumes at once.
+
+    :param volume_hosts: dict mapping volume ids to their new host
+    :returns: A dict of the updated Volumes keyed by volume id.
+    '''
+    now = timeutils.utcnow()
+    volumes = db.volume_update_hosts(context, volume_hosts,
+                                     {'scheduled_at': now})
+    return dict((volume['id'], volume) for volume in volumes)
+
+
 class Scheduler(object):
     """The base class that all Scheduler classes should inherit from."""
 
@@ -80,3 +95,29 @@ class Scheduler(object):
     def schedule_create_volume(self, context, request_spec, filter_properties):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement schedule_create_volume"))
+
+    def schedule_create_volumes(self, context, request_specs,
+                                filter_properties, dispatched=None):
+        """Place a batch of volumes.
+
+        The default implementation schedules the volumes one at a time.
+
+        :param dispatched: optional list the request_specs cast to a
+                           volume host are appended to, for the caller to
+                           tell them apart from the others if an
+                           exception is raised.
+        :returns: a list of (request_spec, exception) tuples for the
+                  volumes that could not be placed.
+        """
+        failures = []
+        for request_spec in request_specs:
+            try:
+                self.schedule_create_volume(
+                    context, request_spec,
+                    copy.deepcopy(filter_properties or {}))
+            except exception.NoValidHost as ex:
+                failures.append((request_spec, ex))
+                continue
+            if dispatched is not None:
+                dispatched.append(request_spec)
+        return failures
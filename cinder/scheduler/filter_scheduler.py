@@ -20,6 +20,8 @@ You can customize this scheduler by specifying your own volume Filters and
 Weighing Functions.
 """
 
+import copy
+
 from oslo.config import cfg
 
 from cinder import exception
@@ -85,6 +87,126 @@ class FilterScheduler(driver.Scheduler):
                                          snapshot_id=snapshot_id,
                                          image_id=image_id)
 
+    def schedule_create_volumes(self, context, request_specs,
+                                filter_properties, dispatched=None):
+        """Place a batch of volumes with one filter pass per group.
+
+        Requests are grouped by volume type, availability zone and size
+        class.  The filters run once per group, against its largest
+        volume, and each volume of the group then goes to the best weighed
+        candidate that still passes the filters once the volumes placed
+        before it have been consumed from the host states.  The candidates
+        are weighed once per group, and only the host chosen for a volume
+        is weighed again.  The host assignments are written back with a
+        single database update.
+
+        :param dispatched: optional list the request_specs cast to a
+                           volume host are appended to, for the caller to
+                           tell them apart from the others if an
+                           exception is raised.
+        :returns: a list of (request_spec, exception) tuples for the
+                  volumes that could not be placed.
+        """
+        elevated = context.elevated()
+        failures = []
+        groups = {}
+        group_keys = []
+        for request_spec in request_specs:
+            properties = copy.deepcopy(filter_properties or {})
+            try:
+                self._prepare_filter_properties(context, request_spec,
+                                                properties)
+            except exception.NoValidHost as ex:
+                failures.append((request_spec, ex))
+                continue
+            key = self._batch_group_key(request_spec)
+            if key not in groups:
+                groups[key] = []
+                group_keys.append(key)
+            groups[key].append((request_spec, properties))
+
+        hosts = list(self.host_manager.get_all_host_states(elevated))
+        placements = []
+        for key in group_keys:
+            group = groups[key]
+            largest = max(group, key=lambda item: item[1]['size'])
+            candidates = self.host_manager.get_filtered_hosts(hosts,
+                                                              largest[1])
+            LOG.debug("Filtered %s" % candidates)
+            weights = self.host_manager.get_host_weights(candidates,
+                                                         largest[1])
+            for request_spec, properties in group:
+                host_state = self._choose_batch_host(weights, request_spec,
+                                                     properties)
+                if host_state is None:
+                    msg = (_('No valid host for volume %s in batch') %
+                           request_spec['volume_id'])
+                    failures.append((request_spec,
+                                     exception.NoValidHost(reason=msg)))
+                    continue
+                placements.append((request_spec, properties, host_state))
+
+        if not placements:
+            return failures
+
+        volume_hosts = dict((request_spec['volume_id'], host_state.host)
+                            for request_spec, _props, host_state
+                            in placements)
+        updated_volumes = driver.volumes_update_db(context, volume_hosts)
+
+        for request_spec, properties, host_state in placements:
+            volume_id = request_spec['volume_id']
+            updated_volume = updated_volumes.get(volume_id)
+            if updated_volume is None:
+                LOG.warn(_("Volume %s was deleted while it was being "
+                           "scheduled.") % volume_id)
+                continue
+            self._post_select_populate_filter_properties(properties,
+                                                         host_state)
+
+            # context is not serializable
+            properties.pop('context', None)
+
+            self.volume_rpcapi.create_volume(
+                context, updated_volume, host_state.host, request_spec,
+                properties, allow_reschedule=True,
+                snapshot_id=request_spec['snapshot_id'],
+                image_id=request_spec['image_id'])
+            if dispatched is not None:
+                dispatched.append(request_spec)
+        return failures
+
+    @staticmethod
+    def _batch_group_key(request_spec):
+        """Return the key batched requests sharing a filter pass use.
+
+        Sizes are bucketed by powers of two so a group's filter pass, done
+        for its largest volume, stays representative for the others.
+        """
+        volume_properties = request_spec['volume_properties']
+        size = max(int(volume_properties['size']), 1)
+        return (volume_properties.get('volume_type_id'),
+                volume_properties.get('availability_zone'),
+                (size - 1).bit_length())
+
+    def _choose_batch_host(self, weights, request_spec, filter_properties):
+        """Pick and consume the best candidate that still fits a volume.
+
+        :param weights: HostWeights of the candidates, the chosen host is
+                        weighed again once the volume is consumed from it.
+        """
+        for weighed_host in weights.get_weighed_objects():
+            host_state = weighed_host.obj
+            # Earlier placements of the batch may have used up the host.
+            if not self.host_manager.get_filtered_hosts([host_state],
+                                                        filter_properties):
+                continue
+            LOG.debug("Choosing %s" % host_state.host)
+            host_state.consume_from_volume(request_spec['volume_properties'])
+            weights.reweigh(host_state)
+            return host_state
+        return None
+
     def host_passes_filters(self, context, host, request_spec,
                             filter_properties):
         """Check if the specified host passes the filters."""
@@ -212,34 +334,15 @@ class FilterScheduler(driver.Scheduler):
             raise exception.NoValidHost(reason=msg)
 
     def _get_weighted_candidates(self, context, request_spec,
-                                 filter_properties=None):
+                                 filter_properties=None, top=None):
         """Returns a list of hosts that meet the required specs,
-        ordered by their fitness.
+        ordered by their fitness; only the top fittest ones if top is given.
         """
         elevated = context.elevated()
 
-        volume_properties = request_spec['volume_properties']
-        # Since Cinder is using mixed filters from Oslo and it's own, which
-        # takes 'resource_XX' and 'volume_XX' as input respectively, copying
-        # 'volume_XX' to 'resource_XX' will make both filters happy.
-        resource_properties = volume_properties.copy()
-        volume_type = request_spec.get("volume_type", None)
-        resource_type = request_spec.get("volume_type", None)
-        request_spec.update({'resource_properties': resource_properties})
-
-        config_options = self._get_configuration_options()
-
         if filter_properties is None:
             filter_properties = {}
-        self._populate_retry(filter_properties, resource_properties)
-
-        filter_properties.update({'context': context,
-                                  'request_spec': request_spec,
-                                  'config_options': config_options,
-                                  'volume_type': volume_type,
-                                  'resource_type': resource_type})
-
-        self.populate_filter_properties(request_spec,
+        self._prepare_filter_properties(context, request_spec,
                                         filter_properties)
 
         # Find our local list of acceptable hosts by filtering and
@@ -260,12 +363,39 @@ class FilterScheduler(driver.Scheduler):
         # weighted_host = WeightedHost() ... the best
         # host for the job.
         weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                                                            filter_properties)
+                                                            filter_properties,
+                                                            top=top)
         return weighed_hosts
 
+    def _prepare_filter_properties(self, context, request_spec,
+                                   filter_properties):
+        """Populate filter_properties for scheduling request_spec."""
+        volume_properties = request_spec['volume_properties']
+        # Since Cinder is using mixed filters from Oslo and it's own, which
+        # takes 'resource_XX' and 'volume_XX' as input respectively, copying
+        # 'volume_XX' to 'resource_XX' will make both filters happy.
+        resource_properties = volume_properties.copy()
+        volume_type = request_spec.get("volume_type", None)
+        resource_type = request_spec.get("volume_type", None)
+        request_spec.update({'resource_properties': resource_properties})
+
+        config_options = self._get_configuration_options()
+
+        self._populate_retry(filter_properties, resource_properties)
+
+        filter_properties.update({'context': context,
+                                  'request_spec': request_spec,
+                                  'config_options': config_options,
+                                  'volume_type': volume_type,
+                                  'resource_type': resource_type})
+
+        self.populate_filter_properties(request_spec,
+                                        filter_properties)
+
     def _schedule(self, context, request_spec, filter_properties=None):
         weighed_hosts = self._get_weighted_candidates(context, request_spec,
-                                                      filter_properties)
+                                                      filter_properties,
+                                                      top=1)
         if not weighed_hosts:
             return None
         return self._choose_top_host(weighed_hosts, request_spec)
@@ -0,0 +1,173 @@
+# Copyright (c) 2011 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import logging as base_logging
+import operator
+
+import six
+
+from cinder.openstack.common import log as logging
+from cinder.openstack.common.scheduler import filters
+from cinder.openstack.common.scheduler.filters import extra_specs_ops
+from cinder.openstack.common import strutils
+
+
+LOG = logging.getLogger(__name__)
+
+# Operators of extra_specs_ops comparing the capability as a float, for
+# which the operand can be converted once at compile time.
+_float_ops = {'=': operator.ge,
+              '==': operator.eq,
+              '!=': operator.ne,
+              '>=': operator.ge,
+              '<=': operator.le}
+
+
+def _compile_requirement(req):
+    """Return a predicate equivalent to extra_specs_ops.match(value, req)."""
+    words = req.split()
+    op = words.pop(0) if words else None
+
+    if op == '<or>':
+        # Ex: <or> v1 <or> v2 <or> v3
+        choices = tuple(words[0::2])
+        return lambda value: value is not None and value in choices
+
+    method = extra_specs_ops._op_methods.get(op)
+    if not method:
+        return lambda value: value == req
+    if not words:
+        return lambda value: False
+
+    operand = words[0]
+    if op in _float_ops:
+        try:
+            operand = float(operand)
+        except ValueError:
+            return lambda value: False
+        method = lambda x, y, cmp=_float_ops[op]: cmp(float(x), y)
+    elif op == '<is>':
+        operand = strutils.bool_from_string(operand)
+        method = lambda x, y: strutils.bool_from_string(x) is y
+
+    def predicate(value):
+        if value is None:
+            return False
+        try:
+            return bool(method(value, operand))
+        except ValueError:
+            return False
+    return predicate
+
+
+def compile_extra_specs(extra_specs):
+    """Compile volume type extra specs into capability matchers.
+
+    Returns a tuple of (path, requirement, predicate) tuples, one for each
+    extra spec in the capabilities scope, where path is the sequence of
+    keys leading to the capability in the host's capabilities.
+    """
+    matchers = []
+    for key, req in six.iteritems(extra_specs):
+        # Either not scope format, or in capabilities scope
+        scope = key.split(':')
+        if len(scope) > 1 and scope[0] != "capabilities":
+            continue
+        elif scope[0] == "capabilities":
+            del scope[0]
+        matchers.append((tuple(scope), req, _compile_requirement(req)))
+    return tuple(matchers)
+
+
+class CapabilitiesFilter(filters.BaseHostFilter):
+    """HostFilter to work with resource (instance & volume) type records.
+
+    The extra specs of a volume type are compiled once and the compiled
+    matchers are kept per volume type id; an entry is recompiled as soon
+    as the extra specs carried by a request differ from the ones it was
+    compiled from.  The matchers of the volume types used least recently
+    are dropped once those of max_compiled_specs types are kept.
+    """
+
+    max_compiled_specs = 256
+
+    # {<volume type id>: (<extra specs>, <matchers>)}, least recently used
+    # first
+    _compiled_specs = collections.OrderedDict()
+
+    def __init__(self):
+        super(CapabilitiesFilter, self).__init__()
+        # Filters are instantiated for each request, remember the matchers
+        # of the request's resource type so hosts are checked without
+        # looking them up again.
+        self._request_resource_type = None
+        self._request_matchers = ()
+
+    def _get_matchers(self, resource_type):
+        if resource_type is self._request_resource_type:
+            return self._request_matchers
+
+        extra_specs = None
+        if resource_type:
+            extra_specs = resource_type.get('extra_specs')
+        if not extra_specs:
+            matchers = ()
+        else:
+            type_id = resource_type.get('id')
+            cached = self._compiled_specs.pop(type_id, None)
+            if cached and cached[0] == extra_specs:
+                matchers = cached[1]
+            else:
+                matchers = compile_extra_specs(extra_specs)
+            if type_id:
+                self._compiled_specs[type_id] = (dict(extra_specs), matchers)
+                if len(self._compiled_specs) > self.max_compiled_specs:
+                    self._compiled_specs.popitem(last=False)
+
+        self._request_resource_type = resource_type
+        self._request_matchers = matchers
+        return matchers
+
+    def _satisfies_extra_specs(self, capabilities, resource_type):
+        """Check that the capabilities provided by the services satisfy
+        the extra specs associated with the resource type.
+        """
+        for path, req, predicate in self._get_matchers(resource_type):
+            cap = capabilities
+            for name in path:
+                try:
+                    cap = cap.get(name, None)
+                except AttributeError:
+                    return False
+                if cap is None:
+                    return False
+            if not predicate(cap):
+                if LOG.isEnabledFor(base_logging.DEBUG):
+                    LOG.debug("extra_spec requirement '%(req)s' does not "
+                              "match '%(cap)s'", {'req': req, 'cap': cap})
+                return False
+        return True
+
+    def host_passes(self, host_state, filter_properties):
+        """Return a list of hosts that can create resource_type."""
+        resource_type = filter_properties.get('resource_type')
+        if not self._satisfies_extra_specs(host_state.capabilities,
+                                           resource_type):
+            if LOG.isEnabledFor(base_logging.DEBUG):
+                LOG.debug("%(host_state)s fails resource_type extra_specs "
+                          "requirements", {'host_state': host_state})
+            return False
+        return True
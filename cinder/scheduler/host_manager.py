@@ -25,8 +25,8 @@ from cinder import db
 from cinder import exception
 from cinder.openstack.common import log as logging
 from cinder.openstack.common.scheduler import filters
-from cinder.openstack.common.scheduler import weights
 from cinder.openstack.common import timeutils
+from cinder.scheduler import weights
 from cinder import utils
 
 
@@ -43,7 +43,17 @@ host_manager_opts = [
                 default=[
                     'CapacityWeigher'
                 ],
-                help='Which weigher class names to use for weighing hosts.')
+                help='Which weigher class names to use for weighing hosts.'),
+    cfg.IntOpt('scheduler_host_state_cache_ttl',
+               default=30,
+               help='Maximum age in seconds of the cached volume service '
+                    'list used to build host states. Within this bound '
+                    'scheduling requests are served from memory; '
+                    'capability updates are applied to the cache as they '
+                    'arrive, and those of hosts not in it yet refresh it. '
+                    'Services disabled through the API are only dropped '
+                    'at the next refresh. Set to 0 to read the services '
+                    'table on every request.'),
 ]
 
 CONF = cfg.CONF
@@ -105,6 +115,9 @@ class HostState(object):
         self.allocated_capacity_gb = 0
         self.free_capacity_gb = None
         self.reserved_percentage = 0
+        # Number of volumes on the host, loaded by the weighers that need it
+        # at most once per scheduling request and reset for the next one.
+        self.volume_count = None
 
         self.updated = None
 
@@ -150,6 +163,8 @@ class HostState(object):
             pass
         else:
             self.free_capacity_gb -= volume_gb
+        if self.volume_count is not None:
+            self.volume_count += 1
         self.updated = timeutils.utcnow()
 
     def __repr__(self):
@@ -165,6 +180,13 @@ class HostManager(object):
     def __init__(self):
         self.service_states = {}  # { <host>: {<service>: {cap k : v}}}
         self.host_state_map = {}
+        # Host state cache bookkeeping: the time the services table was
+        # last read, whether a host which isn't cached reported since and
+        # hit/miss counters for get_all_host_states().
+        self._services_refreshed_at = None
+        self._unknown_host_reported = False
+        self._cache_hits = 0
+        self._cache_misses = 0
         self.filter_handler = filters.HostFilterHandler('cinder.scheduler.'
                                                         'filters')
         self.filter_classes = self.filter_handler.get_all_classes()
@@ -253,12 +275,27 @@ class HostManager(object):
                                                         filter_properties)
 
     def get_weighed_hosts(self, hosts, weight_properties,
-                          weigher_class_names=None):
-        """Weigh the hosts."""
+                          weigher_class_names=None, top=None):
+        """Weigh the hosts.
+
+        Returns the weighed hosts, best first; only the best top hosts
+        when top is given.
+        """
         weigher_classes = self._choose_host_weighers(weigher_class_names)
         return self.weight_handler.get_weighed_objects(weigher_classes,
                                                        hosts,
-                                                       weight_properties)
+                                                       weight_properties,
+                                                       top=top)
+
+    def get_host_weights(self, hosts, weight_properties,
+                         weigher_class_names=None):
+        """Weigh the hosts, keeping their weights to re-weigh some later.
+
+        Returns a HostWeights.
+        """
+        weigher_classes = self._choose_host_weighers(weigher_class_names)
+        return self.weight_handler.get_weights(weigher_classes, hosts,
+                                               weight_properties)
 
     def update_service_capabilities(self, service_name, host, capabilities):
         """Update the per-service capabilities based on this notification."""
@@ -277,18 +314,77 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[host] = capab_copy
 
+        # Apply the update to the cached host state straight away, so the
+        # next scheduling request does not have to rebuild it.
+        host_state = self.host_state_map.get(host)
+        if host_state:
+            host_state.update_capabilities(capab_copy, host_state.service)
+            host_state.update_from_volume_capability(capab_copy)
+        else:
+            # The host was registered, enabled or came back up since the
+            # services table was read
+            self._unknown_host_reported = True
+
+    def get_host_state_cache_stats(self):
+        """Return hit/miss counters of the host state cache."""
+        return {'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'hosts': len(self.host_state_map),
+                'refreshed_at': self._services_refreshed_at}
+
+    def _host_state_cache_valid(self, context):
+        """Check whether cached host states can serve a request.
+
+        The cache is stale once it is older than
+        scheduler_host_state_cache_ttl, as soon as a host that was up at
+        the last refresh looks down: its heartbeat may only be missing from
+        our copy of the services table, so it has to be re-read before the
+        host is dropped, and once a host which isn't cached reports its
+        capabilities, see update_service_capabilities(). The services
+        table isn't read for cache hits.
+        """
+        ttl = CONF.scheduler_host_state_cache_ttl
+        if (ttl <= 0 or self._services_refreshed_at is None or
+                self._unknown_host_reported):
+            return False
+        if timeutils.is_older_than(self._services_refreshed_at, ttl):
+            return False
+        for host_state in self.host_state_map.itervalues():
+            if not utils.service_is_up(host_state.service):
+                return False
+        return True
+
     def get_all_host_states(self, context):
         """Returns a dict of all the hosts the HostManager knows about.
 
         Each of the consumable resources in HostState are
         populated with capabilities scheduler received from RPC.
 
+        Host states are cached between requests and only rebuilt from the
+        services table when the cache is stale, see
+        _host_state_cache_valid().
+
         For example:
           {'192.168.1.100': HostState(), ...}
         """
+        if self._host_state_cache_valid(context):
+            self._cache_hits += 1
+        else:
+            self._cache_misses += 1
+            self._refresh_host_states(context)
 
+        # Volume counts only live for the duration of a scheduling request.
+        for host_state in self.host_state_map.itervalues():
+            host_state.volume_count = None
+        return self.host_state_map.itervalues()
+
+    def _refresh_host_states(self, context):
+        """Rebuild the host state cache from the services table."""
         # Get resource usage across the available volume nodes:
         topic = CONF.volume_topic
+        refreshed_at = timeutils.utcnow()
+        # Hosts reporting while the table is read refresh the cache again
+        self._unknown_host_reported = False
         volume_services = db.service_get_all_by_topic(context,
                                                       topic,
                                                       disabled=False)
@@ -298,12 +394,16 @@ class HostManager(object):
             if not utils.service_is_up(service):
                 LOG.warn(_("volume service is down. (host: %s)") % host)
                 continue
+            updated_at = service['updated_at']
             capabilities = self.service_states.get(host, None)
             host_state = self.host_state_map.get(host)
             if host_state:
-                # copy capabilities to host_state.capabilities
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
+                # Only copy the service row again if it changed since it was
+                # cached; capabilities are kept current by
+                # update_service_capabilities().
+                if host_state.service.get('updated_at') != updated_at:
+                    host_state.update_capabilities(capabilities,
+                                                   dict(service.iteritems()))
             else:
                 host_state = self.host_state_cls(host,
                                                  capabilities=capabilities,
@@ -321,4 +421,4 @@ class HostManager(object):
                        "scheduler cache.") % {'host': host})
             del self.host_state_map[host]
 
-        return self.host_state_map.itervalues()
+        self._services_refreshed_at = refreshed_at
@@ -52,7 +52,7 @@ LOG = logging.getLogger(__name__)
 class SchedulerManager(manager.Manager):
     """Chooses a host to create volumes."""
 
-    RPC_API_VERSION = '1.5'
+    RPC_API_VERSION = '1.6'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -106,6 +106,36 @@ class SchedulerManager(manager.Manager):
         with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
             flow_engine.run()
 
+    def create_volumes(self, context, topic, request_specs,
+                       filter_properties=None):
+        """Schedule a batch of volumes in one pass.
+
+        Volumes that cannot be placed are set to error, like they are by
+        create_volume().  If scheduling fails partway through the batch,
+        the volumes already cast to a volume host are left alone.
+        """
+        volume_state = {'volume_state': {'status': 'error'}}
+        dispatched = []
+        try:
+            failures = self.driver.schedule_create_volumes(
+                context, request_specs, filter_properties,
+                dispatched=dispatched)
+        except Exception as ex:
+            with excutils.save_and_reraise_exception():
+                dispatched_ids = set(request_spec['volume_id']
+                                     for request_spec in dispatched)
+                for request_spec in request_specs:
+                    if request_spec['volume_id'] in dispatched_ids:
+                        continue
+                    self._set_volume_state_and_notify('create_volume',
+                                                      volume_state,
+                                                      context, ex,
+                                                      request_spec)
+
+        for request_spec, ex in failures:
+            self._set_volume_state_and_notify('create_volume', volume_state,
+                                              context, ex, request_spec)
+
     def request_service_capabilities(self, context):
         volume_rpcapi.VolumeAPI().publish_service_capabilities(context)
 
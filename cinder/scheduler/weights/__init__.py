@@ -0,0 +1,148 @@
+# Copyright (c) 2014 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Scheduler host weights
+
+Cinder weighers compute the weights of all candidate hosts in a single
+weigh_hosts() call.  HostWeightHandler scales the weights of each weigher
+to [0.0, 1.0] before applying the weigher's multiplier, so that weighers
+working on different units (gigabytes, volume counts, ...) can be combined
+predictably, and only sorts as many hosts as the caller asks for.
+"""
+
+import heapq
+
+from cinder.openstack.common.scheduler import weights
+
+
+def normalize(weight_list):
+    """Scale a list of weights linearly to [0.0, 1.0].
+
+    Infinite weights, as reported for 'infinite' or 'unknown' capacities,
+    are mapped to the bounds and left out of the scaling of the finite
+    ones, which are then scaled to [0.25, 0.75] on the side of the bound
+    taken, so that they stay strictly between the infinite weights.  Equal
+    finite weights are all mapped to the lowest value they can take.
+    """
+    inf = float('inf')
+    finite = [weight for weight in weight_list if -inf < weight < inf]
+    if finite:
+        minval = min(finite)
+        range_ = float(max(finite) - minval)
+    else:
+        minval = range_ = 0.0
+    low = 0.25 if -inf in weight_list else 0.0
+    high = 0.75 if inf in weight_list else 1.0
+
+    normalized = []
+    for weight in weight_list:
+        if weight == inf:
+            normalized.append(1.0)
+        elif weight == -inf:
+            normalized.append(0.0)
+        elif not range_:
+            normalized.append(low)
+        else:
+            normalized.append(low + (weight - minval) / range_ * (high - low))
+    return normalized
+
+
+class BaseHostWeigher(weights.BaseHostWeigher):
+    """Base class for Cinder host weighers."""
+
+    def weigh_hosts(self, host_states, weight_properties):
+        """Return the raw weights of host_states, in the same order.
+
+        Override in a subclass to compute all the weights in one pass, by
+        default _weigh_object() is called for every host.
+        """
+        return [self._weigh_object(host_state, weight_properties)
+                for host_state in host_states]
+
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        """Add the un-normalized weights computed by weigh_hosts()."""
+        multiplier = self._weight_multiplier()
+        raw_weights = self.weigh_hosts([weighed_obj.obj
+                                        for weighed_obj in weighed_obj_list],
+                                       weight_properties)
+        for weighed_obj, weight in zip(weighed_obj_list, raw_weights):
+            weighed_obj.weight += multiplier * weight
+
+
+class HostWeights(object):
+    """Raw weights of hosts, kept to re-weigh only the hosts that change.
+
+    The weights are normalized across all the hosts whenever the weighed
+    hosts are returned, so re-weighing one host takes one call of each
+    weigher for that host alone.
+    """
+
+    def __init__(self, object_class, weigher_classes, hosts,
+                 weighing_properties):
+        self.object_class = object_class
+        self.hosts = list(hosts)
+        self.weighing_properties = weighing_properties
+        self.weighers = [weigher_cls() for weigher_cls in weigher_classes]
+        self.raw_weights = [self._weigh(weigher, self.hosts)
+                            for weigher in self.weighers]
+
+    def _weigh(self, weigher, hosts):
+        if isinstance(weigher, BaseHostWeigher):
+            return weigher.weigh_hosts(hosts, self.weighing_properties)
+        return [weigher._weigh_object(host, self.weighing_properties)
+                for host in hosts]
+
+    def reweigh(self, host):
+        """Weigh a host again after its state changed."""
+        index = self.hosts.index(host)
+        for weigher, raw_weights in zip(self.weighers, self.raw_weights):
+            raw_weights[index] = self._weigh(weigher, [host])[0]
+
+    def get_weighed_objects(self, top=None):
+        """Return a sorted (highest score first) list of weighed hosts."""
+        totals = [0.0] * len(self.hosts)
+        for weigher, raw_weights in zip(self.weighers, self.raw_weights):
+            multiplier = weigher._weight_multiplier()
+            for index, weight in enumerate(normalize(raw_weights)):
+                totals[index] += multiplier * weight
+
+        weighed_objs = [self.object_class(obj, weight)
+                        for obj, weight in zip(self.hosts, totals)]
+        key = lambda weighed_obj: weighed_obj.weight
+        if top is None:
+            return sorted(weighed_objs, key=key, reverse=True)
+        return heapq.nlargest(top, weighed_objs, key=key)
+
+
+class HostWeightHandler(weights.HostWeightHandler):
+    def get_weights(self, weigher_classes, obj_list, weighing_properties):
+        """Return the HostWeights of obj_list."""
+        return HostWeights(self.object_class, weigher_classes, obj_list,
+                           weighing_properties)
+
+    def get_weighed_objects(self, weigher_classes, obj_list,
+                            weighing_properties, top=None):
+        """Return a sorted (highest score first) list of WeighedHosts.
+
+        The weights of every weigher are normalized before its multiplier
+        is applied.  When top is given only the best top hosts are
+        returned.
+        """
+        if not obj_list:
+            return []
+
+        return self.get_weights(weigher_classes, obj_list,
+                                weighing_properties).get_weighed_objects(top)
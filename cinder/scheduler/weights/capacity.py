@@ -37,7 +37,7 @@ import math
 
 from oslo.config import cfg
 
-from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import weights
 
 
 capacity_weight_opts = [
@@ -62,15 +62,23 @@ class CapacityWeigher(weights.BaseHostWeigher):
 
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
-        reserved = float(host_state.reserved_percentage) / 100
-        free_space = host_state.free_capacity_gb
-        if free_space == 'infinite' or free_space == 'unknown':
-            #(zhiteng) 'infinite' and 'unknown' are treated the same
-            # here, for sorting purpose.
-            free = float('inf')
-        else:
-            free = math.floor(host_state.free_capacity_gb * (1 - reserved))
-        return free
+        return self.weigh_hosts([host_state], weight_properties)[0]
+
+    def weigh_hosts(self, host_states, weight_properties):
+        """Higher weights win.  We want spreading to be the default."""
+        inf = float('inf')
+        floor = math.floor
+        weights = []
+        for host_state in host_states:
+            free_space = host_state.free_capacity_gb
+            if free_space == 'infinite' or free_space == 'unknown':
+                #(zhiteng) 'infinite' and 'unknown' are treated the same
+                # here, for sorting purpose.
+                weights.append(inf)
+            else:
+                reserved = float(host_state.reserved_percentage) / 100
+                weights.append(floor(free_space * (1 - reserved)))
+        return weights
 
 
 class AllocatedCapacityWeigher(weights.BaseHostWeigher):
@@ -83,3 +91,7 @@ class AllocatedCapacityWeigher(weights.BaseHostWeigher):
         # allocated_capacity first) to be the default.
         allocated_space = host_state.allocated_capacity_gb
         return allocated_space
+
+    def weigh_hosts(self, host_states, weight_properties):
+        return [host_state.allocated_capacity_gb
+                for host_state in host_states]
@@ -27,7 +27,7 @@ from oslo.config import cfg
 
 from cinder import db
 from cinder.openstack.common import log as logging
-from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import weights
 
 
 LOG = logging.getLogger(__name__)
@@ -49,12 +49,28 @@ class VolumeNumberWeigher(weights.BaseHostWeigher):
         """Override the weight multiplier."""
         return CONF.volume_number_multiplier
 
+    def weigh_hosts(self, host_states, weight_properties):
+        """Load the volume counts of all hosts with a single query.
+
+        Counts are kept on the host states for the rest of the scheduling
+        request, where consume_from_volume() keeps them up to date.
+        """
+        uncounted = [host_state.host for host_state in host_states
+                     if host_state.volume_count is None]
+        if uncounted:
+            counts = db.volume_count_get_all_by_host(
+                weight_properties['context'], uncounted)
+            for host_state in host_states:
+                if host_state.volume_count is None:
+                    host_state.volume_count = counts.get(host_state.host, 0)
+        return [host_state.volume_count for host_state in host_states]
+
     def _weigh_object(self, host_state, weight_properties):
         """Less volume number weights win.
         We want spreading to be the default.
         """
-        context = weight_properties['context']
-        volume_number = db.volume_data_get_for_host(context=context,
-                                                    host=host_state.host,
-                                                    count_only=True)
-        return volume_number
+        if host_state.volume_count is None:
+            context = weight_properties['context']
+            host_state.volume_count = db.volume_data_get_for_host(
+                context=context, host=host_state.host, count_only=True)
+        return host_state.volume_count
@@ -163,6 +163,29 @@ class BackupsAPITestCase(test.TestCase):
         db.backup_destroy(context.get_admin_context(), backup_id2)
         db.backup_destroy(context.get_admin_context(), backup_id1)
 
+    def test_list_backups_with_limit_offset_and_marker(self):
+        backup_id1 = self._create_backup()
+        backup_id2 = self._create_backup()
+        backup_id3 = self._create_backup()
+
+        def list_backup_ids(query):
+            req = webob.Request.blank('/v2/fake/backups?%s' % query)
+            req.method = 'GET'
+            req.headers['Content-Type'] = 'application/json'
+            res = req.get_response(fakes.wsgi_app())
+            self.assertEqual(res.status_int, 200)
+            return [backup['id'] for backup in json.loads(res.body)['backups']]
+
+        self.assertEqual([backup_id2], list_backup_ids('limit=1&offset=1'))
+        self.assertEqual([backup_id2, backup_id3],
+                         list_backup_ids('marker=%s' % backup_id1))
+        self.assertEqual([backup_id3, backup_id2],
+                         list_backup_ids('sort_dir=desc&limit=2'))
+
+        db.backup_destroy(context.get_admin_context(), backup_id3)
+        db.backup_destroy(context.get_admin_context(), backup_id2)
+        db.backup_destroy(context.get_admin_context(), backup_id1)
+
     def test_list_backups_xml(self):
         backup_id1 = self._create_backup()
         backup_id2 = self._create_backup()
@@ -45,7 +45,9 @@ def fake_snapshot_get(self, context, snapshot_id):
     return param
 
 
-def fake_snapshot_get_all(self, context, search_opts=None):
+def fake_snapshot_get_all(self, context, search_opts=None, marker=None,
+                          limit=None, sort_key='created_at', sort_dir='asc',
+                          offset=None):
     param = _get_default_snapshot_param()
     return [param]
 
@@ -96,6 +98,39 @@ class ExtendedSnapshotAttributesTest(test.TestCase):
                                           project_id='fake',
                                           progress='0%')
 
+    def test_show_reads_snapshot_once(self):
+        calls = []
+
+        def fake_snapshot_get_counted(self, context, snapshot_id):
+            calls.append(snapshot_id)
+            return fake_snapshot_get(self, context, snapshot_id)
+        self.stubs.Set(volume.api.API, 'get_snapshot',
+                       fake_snapshot_get_counted)
+
+        res = self._make_request('/v2/fake/snapshots/%s' % UUID1)
+
+        self.assertEqual(res.status_int, 200)
+        self.assertSnapshotAttributes(self._get_snapshot(res.body),
+                                      project_id='fake',
+                                      progress='0%')
+        self.assertEqual([UUID1], calls)
+
+    def test_detail_reads_snapshots_once(self):
+        calls = []
+
+        def fake_snapshot_get_all_counted(self, context, search_opts=None,
+                                          **kwargs):
+            calls.append(search_opts)
+            return fake_snapshot_get_all(self, context, search_opts,
+                                         **kwargs)
+        self.stubs.Set(volume.api.API, 'get_all_snapshots',
+                       fake_snapshot_get_all_counted)
+
+        res = self._make_request('/v2/fake/snapshots/detail')
+
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(1, len(calls))
+
 
 class ExtendedSnapshotAttributesXmlTest(ExtendedSnapshotAttributesTest):
     content_type = 'application/xml'
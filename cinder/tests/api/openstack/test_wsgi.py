@@ -105,6 +105,27 @@ class RequestTest(test.TestCase):
         request.headers.pop('Accept-Language')
         self.assertIsNone(request.best_match_language())
 
+    def test_cached_resources_by_ids(self):
+        request = wsgi.Request.blank('/foo')
+        loads = []
+
+        def load(resource_ids):
+            loads.append(resource_ids)
+            return dict((resource_id, {'id': resource_id})
+                        for resource_id in resource_ids
+                        if resource_id != 'r-missing')
+
+        resources = request.cached_resources_by_ids(['r-0', 'r-missing'],
+                                                    load, 'res')
+        self.assertEqual({'r-0': {'id': 'r-0'}}, resources)
+        resources = request.cached_resources_by_ids(
+            ['r-0', 'r-1', 'r-missing'], load, 'res')
+        self.assertEqual({'r-0': {'id': 'r-0'}, 'r-1': {'id': 'r-1'}},
+                         resources)
+        self.assertEqual([['r-0', 'r-missing'], ['r-1']], loads)
+        self.assertEqual({'id': 'r-1'},
+                         request.cached_resource_by_id('r-1', 'res'))
+
     def test_cache_and_retrieve_resources(self):
         request = wsgi.Request.blank('/foo')
         # Test that trying to retrieve a cached object on
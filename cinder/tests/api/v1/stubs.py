@@ -119,14 +119,31 @@ def stub_snapshot(id, **kwargs):
     return snapshot
 
 
-def stub_snapshot_get_all(self):
-    return [stub_snapshot(100, project_id='fake'),
-            stub_snapshot(101, project_id='superfake'),
-            stub_snapshot(102, project_id='superduperfake')]
-
-
-def stub_snapshot_get_all_by_project(self, context):
-    return [stub_snapshot(1)]
+def filter_snapshots(snapshots, filters=None, offset=None, limit=None):
+    """Apply the exact match filters and paging of the snapshot queries."""
+    if filters:
+        snapshots = [snapshot for snapshot in snapshots
+                     if all(snapshot.get(key) == value
+                            for key, value in filters.items())]
+    offset = offset or 0
+    if limit is None:
+        return snapshots[offset:]
+    return snapshots[offset:offset + limit]
+
+
+def stub_snapshot_get_all(self, marker=None, limit=None,
+                          sort_key='created_at', sort_dir='asc',
+                          filters=None, offset=None):
+    return filter_snapshots([stub_snapshot(100, project_id='fake'),
+                             stub_snapshot(101, project_id='superfake'),
+                             stub_snapshot(102, project_id='superduperfake')],
+                            filters, offset, limit)
+
+
+def stub_snapshot_get_all_by_project(self, context, marker=None, limit=None,
+                                     sort_key='created_at', sort_dir='asc',
+                                     filters=None, offset=None):
+    return filter_snapshots([stub_snapshot(1)], filters, offset, limit)
 
 
 def stub_snapshot_update(self, context, *args, **param):
@@ -68,7 +68,9 @@ def stub_snapshot_get(self, context, snapshot_id):
     return param
 
 
-def stub_snapshot_get_all(self, context, search_opts=None):
+def stub_snapshot_get_all(self, context, search_opts=None, marker=None,
+                          limit=None, sort_key='created_at', sort_dir='asc',
+                          offset=None):
     param = _get_default_snapshot_param()
     return [param]
 
@@ -235,8 +237,12 @@ class SnapshotApiTest(test.TestCase):
         self.assertEqual(resp_snapshot['id'], UUID)
 
     def test_snapshot_list_by_status(self):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            snapshots = [
                 stubs.stub_snapshot(1, display_name='backup1',
                                     status='available'),
                 stubs.stub_snapshot(2, display_name='backup2',
@@ -244,6 +250,8 @@ class SnapshotApiTest(test.TestCase):
                 stubs.stub_snapshot(3, display_name='backup3',
                                     status='creating'),
             ]
+            return stubs.filter_snapshots(snapshots, filters,
+                                          offset, limit)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -268,12 +276,18 @@ class SnapshotApiTest(test.TestCase):
         self.assertEqual(len(resp['snapshots']), 0)
 
     def test_snapshot_list_by_volume(self):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            snapshots = [
                 stubs.stub_snapshot(1, volume_id='vol1', status='creating'),
                 stubs.stub_snapshot(2, volume_id='vol1', status='available'),
                 stubs.stub_snapshot(3, volume_id='vol2', status='available'),
             ]
+            return stubs.filter_snapshots(snapshots, filters,
+                                          offset, limit)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -297,12 +311,18 @@ class SnapshotApiTest(test.TestCase):
         self.assertEqual(resp['snapshots'][0]['status'], 'available')
 
     def test_snapshot_list_by_name(self):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            snapshots = [
                 stubs.stub_snapshot(1, display_name='backup1'),
                 stubs.stub_snapshot(2, display_name='backup2'),
                 stubs.stub_snapshot(3, display_name='backup3'),
             ]
+            return stubs.filter_snapshots(snapshots, filters,
+                                          offset, limit)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -330,12 +350,18 @@ class SnapshotApiTest(test.TestCase):
 
     def test_list_snapshots_with_limit_and_offset(self):
         def list_snapshots_with_limit_and_offset(is_admin):
-            def stub_snapshot_get_all_by_project(context, project_id):
-                return [
+            def stub_snapshot_get_all_by_project(context, project_id,
+                                                 marker, limit,
+                                                 sort_key, sort_dir,
+                                                 filters=None,
+                                                 offset=None):
+                snapshots = [
                     stubs.stub_snapshot(1, display_name='backup1'),
                     stubs.stub_snapshot(2, display_name='backup2'),
                     stubs.stub_snapshot(3, display_name='backup3'),
                 ]
+                return stubs.filter_snapshots(snapshots, filters,
+                                              offset, limit)
 
             self.stubs.Set(db, 'snapshot_get_all_by_project',
                            stub_snapshot_get_all_by_project)
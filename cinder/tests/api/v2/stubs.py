@@ -112,7 +112,7 @@ def stub_volume_get_db(context, volume_id):
 
 def stub_volume_get_all(context, search_opts=None, marker=None, limit=None,
                         sort_key='created_at', sort_dir='desc', filters=None,
-                        viewable_admin_meta=False):
+                        viewable_admin_meta=False, columns=None):
     return [stub_volume(100, project_id='fake'),
             stub_volume(101, project_id='superfake'),
             stub_volume(102, project_id='superduperfake')]
@@ -120,7 +120,7 @@ def stub_volume_get_all(context, search_opts=None, marker=None, limit=None,
 
 def stub_volume_get_all_by_project(self, context, marker, limit, sort_key,
                                    sort_dir, filters={},
-                                   viewable_admin_meta=False):
+                                   viewable_admin_meta=False, columns=None):
     return [stub_volume_get(self, context, '1')]
 
 
@@ -138,14 +138,31 @@ def stub_snapshot(id, **kwargs):
     return snapshot
 
 
-def stub_snapshot_get_all(self):
-    return [stub_snapshot(100, project_id='fake'),
-            stub_snapshot(101, project_id='superfake'),
-            stub_snapshot(102, project_id='superduperfake')]
+def filter_snapshots(snapshots, filters=None, offset=None, limit=None):
+    """Apply the exact match filters and paging of the snapshot queries."""
+    if filters:
+        snapshots = [snapshot for snapshot in snapshots
+                     if all(snapshot.get(key) == value
+                            for key, value in filters.items())]
+    offset = offset or 0
+    if limit is None:
+        return snapshots[offset:]
+    return snapshots[offset:offset + limit]
 
 
-def stub_snapshot_get_all_by_project(self, context):
-    return [stub_snapshot(1)]
+def stub_snapshot_get_all(self, marker=None, limit=None,
+                          sort_key='created_at', sort_dir='asc',
+                          filters=None, offset=None):
+    return filter_snapshots([stub_snapshot(100, project_id='fake'),
+                             stub_snapshot(101, project_id='superfake'),
+                             stub_snapshot(102, project_id='superduperfake')],
+                            filters, offset, limit)
+
+
+def stub_snapshot_get_all_by_project(self, context, marker=None, limit=None,
+                                     sort_key='created_at', sort_dir='asc',
+                                     filters=None, offset=None):
+    return filter_snapshots([stub_snapshot(1)], filters, offset, limit)
 
 
 def stub_snapshot_update(self, context, *args, **param):
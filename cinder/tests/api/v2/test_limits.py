@@ -18,8 +18,10 @@ Tests dealing with HTTP rate-limiting.
 """
 
 import httplib
+import os
 
 from lxml import etree
+import mock
 import six
 import webob
 from xml.dom import minidom
@@ -564,6 +566,109 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class SharedMemoryLimiterTest(LimiterTest):
+
+    """Tests for the `limits.Limiter` class with a shared memory store."""
+
+    def setUp(self):
+        self.flags(rate_limit_store='shared_memory')
+        super(SharedMemoryLimiterTest, self).setUp()
+
+    def test_store(self):
+        self.assertIsInstance(self.limiter.store,
+                              limits.SharedMemoryLimiterStore)
+
+    def test_limiters_share_store(self):
+        """Limiters of different workers enforce the limits together."""
+        other_limiter = limits.Limiter(TEST_LIMITS, store=self.limiter.store)
+
+        expected = [None] * 10 + [6.0]
+        results = [limiter.check_for_delay("PUT", "/anything")[0]
+                   for limiter in [self.limiter, other_limiter] * 5]
+        results += list(self._check(1, "PUT", "/anything"))
+        self.assertEqual(expected, results)
+
+    def test_store_sized_from_limits(self):
+        many_limits = '; '.join('(GET, /path%d, ^/path%d$, 1, MINUTE)'
+                                % (i, i) for i in xrange(20))
+        limiter = limits.Limiter(limits.Limiter.parse_limits(many_limits))
+        self.assertEqual(20, limiter.store.max_limits)
+
+        limiter = limits.Limiter(TEST_LIMITS,
+                                 **{'limits.user1': many_limits})
+        self.assertEqual(20, limiter.store.max_limits)
+
+        # The last limit of the user is enforced
+        self.assertIsNone(limiter.check_for_delay("GET", "/path19",
+                                                  "user1")[0])
+        self.assertEqual(60.0, limiter.check_for_delay("GET", "/path19",
+                                                       "user1")[0])
+
+
+class LimiterStoreTest(test.TestCase):
+
+    """Tests for the `limits.LimiterStore` implementations."""
+
+    def _append(self, value):
+        def func(states):
+            states = (states or []) + [value]
+            return states, len(states)
+        return func
+
+    def test_memory_store_evicts_least_recently_used(self):
+        store = limits.MemoryLimiterStore(2)
+        store.update('a', self._append((1, 2, 3, 4)))
+        store.update('b', self._append(None))
+        store.update('a', self._append(None))
+        store.update('c', self._append(None))
+
+        self.assertEqual([(1, 2, 3, 4), None], store.get('a'))
+        self.assertIsNone(store.get('b'))
+        self.assertEqual([None], store.get('c'))
+
+    def test_shared_memory_store(self):
+        store = limits.SharedMemoryLimiterStore(16, max_limits=4)
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(1, store.update('a', self._append((0, None, 1.5,
+                                                            4))))
+        self.assertEqual(2, store.update('a', self._append(None)))
+        self.assertEqual(1, store.update(u'b\xe9', self._append(None)))
+
+        self.assertEqual([(0, None, 1.5, 4), None], store.get('a'))
+        self.assertEqual([None], store.get(u'b\xe9'))
+
+    @mock.patch.object(limits.LOG, 'warn')
+    def test_shared_memory_store_truncates_states(self, mock_warn):
+        store = limits.SharedMemoryLimiterStore(16, max_limits=1)
+        store.update('a', lambda states: ([None, (1, 2, 3, 4)], None))
+        store.update('a', lambda states: ([None, (1, 2, 3, 4)], None))
+
+        self.assertEqual([None], store.get('a'))
+        self.assertEqual(1, mock_warn.call_count)
+
+    def test_shared_memory_store_evicts_least_recently_used(self):
+        store = limits.SharedMemoryLimiterStore(1)
+        store.update('a', self._append(None))
+        store.update('b', self._append(None))
+
+        self.assertIsNone(store.get('a'))
+        self.assertEqual([None], store.get('b'))
+
+    def test_shared_memory_store_is_shared_with_forks(self):
+        store = limits.SharedMemoryLimiterStore(16)
+        store.update('a', self._append(None))
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                store.update('a', self._append((1, 2, 3, 4)))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual([None, (1, 2, 3, 4)], store.get('a'))
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
 
     """Tests for `limits.WsgiLimiter` class."""
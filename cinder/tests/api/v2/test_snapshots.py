@@ -70,7 +70,9 @@ def stub_snapshot_get(self, context, snapshot_id):
     return param
 
 
-def stub_snapshot_get_all(self, context, search_opts=None):
+def stub_snapshot_get_all(self, context, search_opts=None, marker=None,
+                          limit=None, sort_key='created_at', sort_dir='asc',
+                          offset=None):
     param = _get_default_snapshot_param()
     return [param]
 
@@ -246,8 +248,12 @@ class SnapshotApiTest(test.TestCase):
         self.assertEqual(resp_snapshot['id'], UUID)
 
     def test_snapshot_list_by_status(self):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            snapshots = [
                 stubs.stub_snapshot(1, display_name='backup1',
                                     status='available'),
                 stubs.stub_snapshot(2, display_name='backup2',
@@ -255,6 +261,8 @@ class SnapshotApiTest(test.TestCase):
                 stubs.stub_snapshot(3, display_name='backup3',
                                     status='creating'),
             ]
+            return stubs.filter_snapshots(snapshots, filters,
+                                          offset, limit)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -279,12 +287,18 @@ class SnapshotApiTest(test.TestCase):
         self.assertEqual(len(resp['snapshots']), 0)
 
     def test_snapshot_list_by_volume(self):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            snapshots = [
                 stubs.stub_snapshot(1, volume_id='vol1', status='creating'),
                 stubs.stub_snapshot(2, volume_id='vol1', status='available'),
                 stubs.stub_snapshot(3, volume_id='vol2', status='available'),
             ]
+            return stubs.filter_snapshots(snapshots, filters,
+                                          offset, limit)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -308,12 +322,18 @@ class SnapshotApiTest(test.TestCase):
         self.assertEqual(resp['snapshots'][0]['status'], 'available')
 
     def test_snapshot_list_by_name(self):
-        def stub_snapshot_get_all_by_project(context, project_id):
-            return [
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            snapshots = [
                 stubs.stub_snapshot(1, display_name='backup1'),
                 stubs.stub_snapshot(2, display_name='backup2'),
                 stubs.stub_snapshot(3, display_name='backup3'),
             ]
+            return stubs.filter_snapshots(snapshots, filters,
+                                          offset, limit)
         self.stubs.Set(db, 'snapshot_get_all_by_project',
                        stub_snapshot_get_all_by_project)
 
@@ -341,12 +361,18 @@ class SnapshotApiTest(test.TestCase):
 
     def test_list_snapshots_with_limit_and_offset(self):
         def list_snapshots_with_limit_and_offset(is_admin):
-            def stub_snapshot_get_all_by_project(context, project_id):
-                return [
+            def stub_snapshot_get_all_by_project(context, project_id,
+                                                 marker, limit,
+                                                 sort_key, sort_dir,
+                                                 filters=None,
+                                                 offset=None):
+                snapshots = [
                     stubs.stub_snapshot(1, display_name='backup1'),
                     stubs.stub_snapshot(2, display_name='backup2'),
                     stubs.stub_snapshot(3, display_name='backup3'),
                 ]
+                return stubs.filter_snapshots(snapshots, filters,
+                                              offset, limit)
 
             self.stubs.Set(db, 'snapshot_get_all_by_project',
                            stub_snapshot_get_all_by_project)
@@ -365,6 +391,29 @@ class SnapshotApiTest(test.TestCase):
         #non_admin case
         list_snapshots_with_limit_and_offset(is_admin=False)
 
+    def test_list_snapshots_paginate_options(self):
+        calls = []
+
+        def stub_snapshot_get_all_by_project(context, project_id,
+                                             marker, limit,
+                                             sort_key, sort_dir,
+                                             filters=None,
+                                             offset=None):
+            calls.append((marker, limit, sort_key, sort_dir, filters,
+                          offset))
+            return [stubs.stub_snapshot(1)]
+
+        self.stubs.Set(db, 'snapshot_get_all_by_project',
+                       stub_snapshot_get_all_by_project)
+
+        req = fakes.HTTPRequest.blank('/v2/snapshots?marker=1&limit=2'
+                                      '&sort_key=id&sort_dir=desc'
+                                      '&offset=3&status=available')
+        self.controller.index(req)
+
+        self.assertEqual([('1', 2, 'id', 'desc', {'status': 'available'},
+                           3)], calls)
+
     def test_admin_list_snapshots_all_tenants(self):
         req = fakes.HTTPRequest.blank('/v2/fake/snapshots?all_tenants=1',
                                       use_admin_context=True)
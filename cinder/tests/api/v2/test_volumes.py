@@ -590,6 +590,22 @@ class VolumeApiTest(test.TestCase):
         # Finally test that we cached the returned volumes
         self.assertEqual(1, len(req.cached_resource()))
 
+    def test_volume_list_summary_fetches_summary_columns(self):
+        def stub_volume_get_all_by_project(context, project_id, marker, limit,
+                                           sort_key, sort_dir, filters=None,
+                                           columns=None):
+            self.assertEqual(('id', 'display_name'), columns)
+            return [{'id': '1', 'display_name': 'vol1'}]
+        self.stubs.Set(db, 'volume_get_all_by_project',
+                       stub_volume_get_all_by_project)
+
+        req = fakes.HTTPRequest.blank('/v2/volumes')
+        res_dict = self.controller.index(req)
+        self.assertEqual(1, len(res_dict['volumes']))
+        self.assertEqual({'id': '1', 'name': 'vol1'},
+                         dict((key, res_dict['volumes'][0][key])
+                              for key in ('id', 'name')))
+
     def test_volume_list_detail(self):
         self.stubs.Set(volume_api.API, 'get_all',
                        stubs.stub_volume_get_all_by_project)
@@ -701,7 +717,8 @@ class VolumeApiTest(test.TestCase):
     def test_volume_index_with_marker(self):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_key, sort_dir, filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           columns=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -762,7 +779,8 @@ class VolumeApiTest(test.TestCase):
     def test_volume_index_limit_offset(self):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_key, sort_dir, filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           columns=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -790,7 +808,8 @@ class VolumeApiTest(test.TestCase):
     def test_volume_detail_with_marker(self):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_key, sort_dir, filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           columns=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -851,7 +870,8 @@ class VolumeApiTest(test.TestCase):
     def test_volume_detail_limit_offset(self):
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_key, sort_dir, filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           columns=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -910,7 +930,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all(context, marker, limit,
                                 sort_key, sort_dir,
                                 filters=None,
-                                viewable_admin_meta=False):
+                                viewable_admin_meta=False,
+                                columns=None):
             vols = [stubs.stub_volume(i)
                     for i in xrange(CONF.osapi_max_limit)]
             if limit == None or limit >= len(vols):
@@ -929,7 +950,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all2(context, marker, limit,
                                  sort_key, sort_dir,
                                  filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 columns=None):
             vols = [stubs.stub_volume(i)
                     for i in xrange(100)]
             if limit == None or limit >= len(vols):
@@ -947,7 +969,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all3(context, marker, limit,
                                  sort_key, sort_dir,
                                  filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 columns=None):
             vols = [stubs.stub_volume(i)
                     for i in xrange(CONF.osapi_max_limit + 100)]
             if limit == None or limit >= len(vols):
@@ -987,14 +1010,16 @@ class VolumeApiTest(test.TestCase):
         # Non-admin, project function should be called with no_migration_status
         def stub_volume_get_all_by_project(context, project_id, marker, limit,
                                            sort_key, sort_dir, filters=None,
-                                           viewable_admin_meta=False):
+                                           viewable_admin_meta=False,
+                                           columns=None):
             self.assertEqual(filters['no_migration_targets'], True)
             self.assertFalse('all_tenants' in filters)
             return [stubs.stub_volume(1, display_name='vol1')]
 
         def stub_volume_get_all(context, marker, limit,
                                 sort_key, sort_dir, filters=None,
-                                viewable_admin_meta=False):
+                                viewable_admin_meta=False,
+                                columns=None):
             return []
         self.stubs.Set(db, 'volume_get_all_by_project',
                        stub_volume_get_all_by_project)
@@ -1011,13 +1036,15 @@ class VolumeApiTest(test.TestCase):
         # without no_migration_status
         def stub_volume_get_all_by_project2(context, project_id, marker, limit,
                                             sort_key, sort_dir, filters=None,
-                                            viewable_admin_meta=False):
+                                            viewable_admin_meta=False,
+                                            columns=None):
             self.assertFalse('no_migration_targets' in filters)
             return [stubs.stub_volume(1, display_name='vol2')]
 
         def stub_volume_get_all2(context, marker, limit,
                                  sort_key, sort_dir, filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 columns=None):
             return []
         self.stubs.Set(db, 'volume_get_all_by_project',
                        stub_volume_get_all_by_project2)
@@ -1032,12 +1059,14 @@ class VolumeApiTest(test.TestCase):
         # without no_migration_status
         def stub_volume_get_all_by_project3(context, project_id, marker, limit,
                                             sort_key, sort_dir, filters=None,
-                                            viewable_admin_meta=False):
+                                            viewable_admin_meta=False,
+                                            columns=None):
             return []
 
         def stub_volume_get_all3(context, marker, limit,
                                  sort_key, sort_dir, filters=None,
-                                 viewable_admin_meta=False):
+                                 viewable_admin_meta=False,
+                                 columns=None):
             self.assertFalse('no_migration_targets' in filters)
             self.assertFalse('all_tenants' in filters)
             return [stubs.stub_volume(1, display_name='vol3')]
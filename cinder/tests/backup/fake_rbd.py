@@ -0,0 +1,172 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory stand-in for the rados and rbd modules."""
+
+import collections
+
+
+class Error(Exception):
+    pass
+
+
+class ImageNotFound(Error):
+    pass
+
+
+class ReadOnlyImage(Error):
+    pass
+
+
+class _Image(object):
+
+    def __init__(self, size):
+        self.data = bytearray(size)
+        # snapshot name : contents of the image at the snapshot
+        self.snaps = collections.OrderedDict()
+
+
+class FakeCluster(object):
+    """Images of all pools, used as both the rados and the rbd modules.
+
+    diff_iterate reports changes in blocks of block_size bytes.
+    """
+
+    Error = Error
+    ImageNotFound = ImageNotFound
+
+    def __init__(self, block_size=4096):
+        self.block_size = block_size
+        # (pool, name) : _Image
+        self.images = {}
+        self.reads = []
+        self.writes = []
+        self.discards = []
+
+    def create(self, pool, name, data):
+        image = _Image(len(data))
+        image.data[:] = data
+        self.images[(pool, name)] = image
+
+    def get(self, pool, name, snapshot=None):
+        image = self.images[(pool, name)]
+        if snapshot is not None:
+            return str(image.snaps[snapshot])
+        return str(image.data)
+
+    def Rados(self, rados_id=None, conffile=None):
+        return _Client(self)
+
+    def Image(self, ioctx, name, snapshot=None, read_only=False):
+        if (ioctx.pool, name) not in self.images:
+            raise ImageNotFound(name)
+        return FakeImage(self, self.images[(ioctx.pool, name)], snapshot,
+                         read_only)
+
+
+class _Client(object):
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def connect(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def open_ioctx(self, pool):
+        return _Ioctx(pool)
+
+
+class _Ioctx(object):
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def close(self):
+        pass
+
+
+class FakeImage(object):
+
+    def __init__(self, cluster, image, snapshot, read_only):
+        self.cluster = cluster
+        self.image = image
+        self.snapshot = snapshot
+        self.read_only = read_only or snapshot is not None
+
+    def _data(self, snapshot=None):
+        if snapshot is not None:
+            return self.image.snaps[snapshot]
+        return self.image.data
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ReadOnlyImage()
+
+    def size(self):
+        return len(self._data(self.snapshot))
+
+    def resize(self, size):
+        self._check_writable()
+        data = self.image.data
+        if size < len(data):
+            del data[size:]
+        else:
+            data.extend(bytearray(size - len(data)))
+
+    def read(self, offset, length):
+        self.cluster.reads.append((offset, length))
+        return str(self._data(self.snapshot)[offset:offset + length])
+
+    def write(self, data, offset):
+        self._check_writable()
+        self.cluster.writes.append((offset, len(data)))
+        self.image.data[offset:offset + len(data)] = data
+        return len(data)
+
+    def discard(self, offset, length):
+        self._check_writable()
+        self.cluster.discards.append((offset, length))
+        self.image.data[offset:offset + length] = bytearray(length)
+
+    def create_snap(self, name):
+        self.image.snaps[name] = bytearray(self.image.data)
+
+    def remove_snap(self, name):
+        del self.image.snaps[name]
+
+    def list_snaps(self):
+        return [{'name': name, 'size': len(data)}
+                for name, data in self.image.snaps.items()]
+
+    def diff_iterate(self, offset, length, from_snapshot, iterate_cb):
+        data = self._data(self.snapshot)
+        if from_snapshot is not None:
+            base = self.image.snaps[from_snapshot]
+        else:
+            base = bytearray(len(data))
+        block_size = self.cluster.block_size
+        for block in xrange(offset, offset + length, block_size):
+            new = data[block:block + block_size]
+            old = base[block:block + block_size]
+            if new == old:
+                continue
+            exists = new.count('\0') != len(new)
+            iterate_cb(block, len(new), exists)
+
+    def close(self):
+        pass
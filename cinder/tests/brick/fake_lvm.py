@@ -68,6 +68,9 @@ class FakeBrickLVM(object):
     def lv_has_snapshot(self, name):
         return False
 
+    def get_snapshot_usage(self, name):
+        return None
+
     def activate_lv(self, lv, is_snapshot=False):
         pass
 
@@ -105,6 +105,12 @@ class BrickLvmTestCase(test.TestCase):
         elif 'env, LC_ALL=C, lvs, --noheadings, --unit=g' \
              ', -o, size,data_percent, --separator, :' in cmd_string:
             data = "  9:12\n"
+        elif ('env, LC_ALL=C, lvs, --noheadings, -o, snap_percent' in
+              cmd_string):
+            if 'test-volumes' in cmd_string:
+                data = '  \n'
+            else:
+                data = '  12.50\n'
         elif 'lvcreate, -T, -L, ' in cmd_string:
             pass
         elif 'lvcreate, -T, -V, ' in cmd_string:
@@ -249,6 +255,10 @@ class BrickLvmTestCase(test.TestCase):
         self.assertTrue(self.vg.lv_has_snapshot('fake-vg'))
         self.assertFalse(self.vg.lv_has_snapshot('test-volumes'))
 
+    def test_get_snapshot_usage(self):
+        self.assertEqual(12.5, self.vg.get_snapshot_usage('snapshot-1'))
+        self.assertIsNone(self.vg.get_snapshot_usage('test-volumes'))
+
     def test_activate_lv(self):
         self._mox.StubOutWithMock(self.vg, '_execute')
         self.vg._supports_lvchange_ignoreskipactivation = True
@@ -265,3 +275,94 @@ class BrickLvmTestCase(test.TestCase):
 
     def test_get_mirrored_available_capacity(self):
         self.assertEqual(self.vg.vg_mirror_free_space(1), 2.0)
+
+
+class BrickLvmCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(BrickLvmCacheTestCase, self).setUp()
+        self.lvs = {'fake-1': '1.00', 'fake-2': '2.00'}
+        self.lvs_calls = []
+        self.not_found = ('  One or more specified logical volume(s) not '
+                          'found.')
+        self.stubs.Set(processutils, 'execute', self.fake_execute)
+        self.stubs.Set(brick.LVM, '_vg_exists', lambda x: True)
+        self.stubs.Set(brick.LVM, 'get_all_physical_volumes',
+                       staticmethod(lambda *args: []))
+        self.vg = brick.LVM('fake-vg', 'sudo', executor=self.fake_execute,
+                            lv_cache_ttl=60)
+
+    def fake_execute(self, *cmd, **kwargs):
+        if 'lvs' in cmd:
+            target = cmd[-1]
+            self.lvs_calls.append(target)
+            if '/' in target:
+                name = target.split('/')[1]
+                if name not in self.lvs:
+                    raise processutils.ProcessExecutionError(
+                        stderr=self.not_found, exit_code=5)
+                lvs = {name: self.lvs[name]}
+            else:
+                lvs = self.lvs
+            return (''.join('  fake-vg %s %s\n' % (name, size)
+                            for name, size in sorted(lvs.items())), '')
+        return ('', '')
+
+    def test_get_volume_uses_inventory(self):
+        self.assertEqual(2, len(self.vg.get_volumes()))
+        self.assertEqual('1.00', self.vg.get_volume('fake-1')['size'])
+        self.assertEqual('2.00', self.vg.get_volume('fake-2')['size'])
+        self.assertEqual(['fake-vg'], self.lvs_calls)
+
+    def test_get_volume_miss_queries_single_lv(self):
+        self.assertEqual('1.00', self.vg.get_volume('fake-1')['size'])
+        self.assertIsNone(self.vg.get_volume('fake-3'))
+        self.assertEqual(['fake-vg/fake-1', 'fake-vg/fake-3'],
+                         self.lvs_calls)
+
+    def test_get_volume_not_found_newer_lvm(self):
+        self.not_found = ('  Failed to find logical volume '
+                          '"fake-vg/fake-3"')
+        self.assertIsNone(self.vg.get_volume('fake-3'))
+
+    def test_get_volume_lvs_error(self):
+        self.not_found = '  Volume group "fake-vg" not available'
+        self.assertRaises(processutils.ProcessExecutionError,
+                          brick.LVM.get_all_volumes, 'sudo', 'fake-vg',
+                          'fake-3')
+
+    def test_get_volume_vg_not_found(self):
+        self.not_found = '  Volume group "fake-vg" not found'
+        self.assertRaises(processutils.ProcessExecutionError,
+                          brick.LVM.get_all_volumes, 'sudo', 'fake-vg',
+                          'fake-3')
+
+    def test_inventory_expires(self):
+        self.vg.get_volumes()
+        self.lvs['fake-3'] = '3.00'
+        self.assertEqual(2, len(self.vg.get_volumes()))
+
+        self.vg._lv_cache_time -= 61
+        self.assertEqual(3, len(self.vg.get_volumes()))
+        self.assertEqual(['fake-vg', 'fake-vg'], self.lvs_calls)
+
+    def test_inventory_disabled(self):
+        vg = brick.LVM('fake-vg', 'sudo', executor=self.fake_execute)
+        vg.get_volumes()
+        vg.get_volumes()
+        self.assertEqual(['fake-vg', 'fake-vg'], self.lvs_calls)
+
+    def test_write_through(self):
+        self.vg.get_volumes()
+
+        self.vg.create_volume('new-1', '10g')
+        self.assertEqual('10.00', self.vg.get_volume('new-1')['size'])
+        self.vg.extend_volume('new-1', '20g')
+        self.assertEqual('20.00', self.vg.get_volume('new-1')['size'])
+        self.vg.create_lv_snapshot('snap-1', 'new-1')
+        self.assertEqual('20.00', self.vg.get_volume('snap-1')['size'])
+        self.vg.rename_volume('fake-2', 'renamed-2')
+        self.assertEqual('2.00', self.vg.get_volume('renamed-2')['size'])
+        self.vg.delete('fake-1')
+        self.assertEqual(['new-1', 'snap-1', 'renamed-2'],
+                         [lv['name'] for lv in self.vg.get_volumes()])
+        self.assertEqual(['fake-vg'], self.lvs_calls)
@@ -0,0 +1,166 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Unit tests for the image cache."""
+
+import fcntl
+import os
+import shutil
+import tempfile
+
+import eventlet
+import mock
+
+from cinder.image import cache as image_cache
+from cinder import test
+
+
+class ImageCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.cache = image_cache.ImageCache(self.cache_dir, 10)
+        self.fills = []
+
+    def _fill(self, data='image'):
+        def _fill(path):
+            self.fills.append(path)
+            with open(path, 'w') as f:
+                f.write(data)
+        return _fill
+
+    def test_get_fills_once(self):
+        with self.cache.get('image-1', 'abc', self._fill()) as path:
+            self.assertEqual(os.path.join(self.cache_dir, 'image-1-abc'),
+                             path)
+            with open(path) as f:
+                self.assertEqual('image', f.read())
+        with self.cache.get('image-1', 'abc', self._fill()) as path:
+            self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(1, len(self.fills))
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_get_keyed_by_checksum_and_format(self):
+        with self.cache.get('image-1', 'abc', self._fill()):
+            pass
+        with self.cache.get('image-1', 'def', self._fill()):
+            pass
+        with self.cache.get('image-1', 'def', self._fill(),
+                            disk_format='raw') as path:
+            self.assertEqual(os.path.join(self.cache_dir, 'image-1-def.raw'),
+                             path)
+
+        self.assertEqual(3, len(self.fills))
+
+    def test_get_concurrent_fills_once(self):
+        def _slow_fill(path):
+            eventlet.sleep(0.01)
+            self._fill()(path)
+
+        def _get():
+            with self.cache.get('image-1', 'abc', _slow_fill) as path:
+                return path
+
+        pool = eventlet.GreenPool()
+        paths = list(pool.imap(lambda _: _get(), range(5)))
+
+        self.assertEqual(1, len(self.fills))
+        self.assertEqual(5 * [os.path.join(self.cache_dir, 'image-1-abc')],
+                         paths)
+
+    def test_get_failed_fill_not_cached(self):
+        def _fill(path):
+            raise IOError()
+
+        def _get():
+            with self.cache.get('image-1', 'abc', _fill):
+                pass
+
+        self.assertRaises(IOError, _get)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_evict_least_recently_used(self):
+        with self.cache.get('image-1', 'abc', self._fill()) as path1:
+            os.utime(path1, (1, 1))
+        with self.cache.get('image-2', 'abc', self._fill()) as path2:
+            os.utime(path2, (2, 2))
+        # image-1 is used again, image-2 becomes the least recently used
+        with self.cache.get('image-1', 'abc', self._fill()):
+            pass
+        with self.cache.get('image-3', 'abc', self._fill()) as path3:
+            pass
+
+        self.assertTrue(os.path.exists(path1))
+        self.assertFalse(os.path.exists(path2))
+        self.assertTrue(os.path.exists(path3))
+
+    def test_evict_skips_entries_in_use(self):
+        with self.cache.get('image-1', 'abc', self._fill()) as path1:
+            os.utime(path1, (1, 1))
+            with self.cache.get('image-2', 'abc', self._fill()):
+                pass
+            with self.cache.get('image-3', 'abc', self._fill()):
+                pass
+            self.assertTrue(os.path.exists(path1))
+
+    def test_evict_skips_entries_locked_by_other_processes(self):
+        with self.cache.get('image-1', 'abc', self._fill()) as path1:
+            os.utime(path1, (1, 1))
+        # Another process using the entry holds a shared lock on it
+        entry = open(path1, 'rb')
+        self.addCleanup(entry.close)
+        fcntl.flock(entry, fcntl.LOCK_SH)
+
+        with self.cache.get('image-2', 'abc', self._fill()):
+            pass
+        with self.cache.get('image-3', 'abc', self._fill()) as path3:
+            pass
+
+        self.assertTrue(os.path.exists(path1))
+        self.assertEqual(2, len(self.cache._entries()))
+        entry.close()
+        with self.cache.get('image-4', 'abc', self._fill()):
+            pass
+        self.assertFalse(os.path.exists(path1))
+        self.assertTrue(os.path.exists(path3))
+
+    def test_get_stats(self):
+        with self.cache.get('image-1', 'abc', self._fill()):
+            pass
+        with self.cache.get('image-1', 'abc', self._fill()):
+            pass
+        with self.cache.get('image-1', 'abc', self._fill(),
+                            disk_format='raw'):
+            pass
+
+        stats = self.cache.get_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0, stats['converted_hits'])
+        self.assertEqual(1, stats['converted_misses'])
+        self.assertEqual(2, stats['entries'])
+
+    def test_get_cache(self):
+        self.flags(image_cache_max_size_gb=0)
+        self.assertIsNone(image_cache.get_cache())
+
+        self.flags(image_cache_max_size_gb=1, image_cache_dir=self.cache_dir)
+        with mock.patch.object(image_cache, '_cache', None):
+            cache = image_cache.get_cache()
+            self.assertEqual(self.cache_dir, cache.cache_dir)
+            self.assertIs(cache, image_cache.get_cache())
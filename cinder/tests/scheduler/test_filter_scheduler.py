@@ -87,6 +87,126 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self.assertIsNotNone(weighed_host.obj)
         self.assertTrue(_mock_service_get_all_by_topic.called)
 
+    @mock.patch('cinder.scheduler.driver.volumes_update_db')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_schedule_create_volumes(self, _mock_service_get_all_by_topic,
+                                     _mock_volumes_update_db):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all_by_topic)
+        _mock_volumes_update_db.side_effect = (
+            lambda ctxt, volume_hosts: dict(
+                (volume_id, {'id': volume_id, 'host': host})
+                for volume_id, host in volume_hosts.iteritems()))
+
+        # host1 is the only host with room for 400G volumes and only has
+        # room for two of them.
+        request_specs = [{'volume_id': 'fake-id%s' % x,
+                          'snapshot_id': None,
+                          'image_id': None,
+                          'volume_type': {'name': 'LVM_iSCSI'},
+                          'volume_properties': {'project_id': 1,
+                                                'size': 400}}
+                         for x in xrange(3)]
+        failures = sched.schedule_create_volumes(fake_context, request_specs,
+                                                 {})
+
+        self.assertEqual(1, len(failures))
+        self.assertEqual('fake-id2', failures[0][0]['volume_id'])
+        self.assertIsInstance(failures[0][1], exception.NoValidHost)
+        _mock_volumes_update_db.assert_called_once_with(
+            fake_context, {'fake-id0': 'host1', 'fake-id1': 'host1'})
+        self.assertEqual(2, sched.volume_rpcapi.create_volume.call_count)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
+    @mock.patch('cinder.scheduler.weights.capacity.CapacityWeigher.'
+                'weigh_hosts')
+    @mock.patch('cinder.scheduler.driver.volumes_update_db')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_schedule_create_volumes_reweighs_chosen_host(
+            self, _mock_service_get_all_by_topic, _mock_volumes_update_db,
+            _mock_weigh_hosts):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all_by_topic)
+        _mock_volumes_update_db.side_effect = (
+            lambda ctxt, volume_hosts: dict(
+                (volume_id, {'id': volume_id, 'host': host})
+                for volume_id, host in volume_hosts.iteritems()))
+        _mock_weigh_hosts.side_effect = (
+            lambda host_states, properties: [
+                host_state.free_capacity_gb for host_state in host_states])
+
+        request_specs = [{'volume_id': 'fake-id%s' % x,
+                          'snapshot_id': None,
+                          'image_id': None,
+                          'volume_type': {'name': 'LVM_iSCSI'},
+                          'volume_properties': {'project_id': 1,
+                                                'size': 1}}
+                         for x in xrange(3)]
+        failures = sched.schedule_create_volumes(fake_context, request_specs,
+                                                 {})
+
+        self.assertEqual([], failures)
+        # All the candidates are weighed once, then only the chosen host
+        # is weighed again after each volume.
+        weighed = [len(call[0][0])
+                   for call in _mock_weigh_hosts.call_args_list]
+        self.assertEqual(4, len(weighed))
+        self.assertTrue(weighed[0] > 1)
+        self.assertEqual([1, 1, 1], weighed[1:])
+
+    @mock.patch('cinder.scheduler.driver.volumes_update_db')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_schedule_create_volumes_reports_dispatched(
+            self, _mock_service_get_all_by_topic, _mock_volumes_update_db):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        sched.volume_rpcapi.create_volume.side_effect = [
+            None, exception.CinderException()]
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all_by_topic)
+        _mock_volumes_update_db.side_effect = (
+            lambda ctxt, volume_hosts: dict(
+                (volume_id, {'id': volume_id, 'host': host})
+                for volume_id, host in volume_hosts.iteritems()))
+
+        request_specs = [{'volume_id': 'fake-id%s' % x,
+                          'snapshot_id': None,
+                          'image_id': None,
+                          'volume_type': {'name': 'LVM_iSCSI'},
+                          'volume_properties': {'project_id': 1,
+                                                'size': 1}}
+                         for x in xrange(3)]
+        dispatched = []
+        self.assertRaises(exception.CinderException,
+                          sched.schedule_create_volumes, fake_context,
+                          request_specs, {}, dispatched=dispatched)
+
+        self.assertEqual([request_specs[0]], dispatched)
+
+    def test_batch_group_key(self):
+        sched = fakes.FakeFilterScheduler()
+
+        def key(size, volume_type_id='type1', az='zone1'):
+            return sched._batch_group_key(
+                {'volume_properties': {'size': size,
+                                       'volume_type_id': volume_type_id,
+                                       'availability_zone': az}})
+
+        self.assertEqual(key(3), key(4))
+        self.assertNotEqual(key(4), key(5))
+        self.assertNotEqual(key(4), key(4, volume_type_id='type2'))
+        self.assertNotEqual(key(4), key(4, az='zone2'))
+
     def test_max_attempts(self):
         self.flags(scheduler_max_attempts=4)
 
@@ -15,11 +15,16 @@
 Tests For Scheduler Host Filters.
 """
 
+import collections
+
 import mock
 
 from cinder import context
 from cinder.openstack.common import jsonutils
 from cinder.openstack.common.scheduler import filters
+from cinder.openstack.common.scheduler.filters import capabilities_filter
+from cinder.scheduler.filters import capabilities_filter as \
+    compiled_capabilities_filter
 from cinder import test
 from cinder.tests.scheduler import fakes
 
@@ -90,3 +95,73 @@ class HostFiltersTestCase(test.TestCase):
                                     'updated_at': None,
                                     'service': service})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
+
+    def _do_test_capabilities_filter(self, extra_specs, capabilities,
+                                     passes, type_id='fake-type'):
+        filt_cls = self.class_map['CapabilitiesFilter']()
+        filter_properties = {'resource_type': {'id': type_id,
+                                               'name': 'fake_type',
+                                               'extra_specs': extra_specs}}
+        host = fakes.FakeHostState('host1', {'capabilities': capabilities})
+        self.assertEqual(passes,
+                         filt_cls.host_passes(host, filter_properties))
+
+    def test_capabilities_filter_passes(self):
+        self._do_test_capabilities_filter(
+            {'opt1': '1', 'capabilities:opt2': '>= 10', 'scope:ignored': 'x'},
+            {'opt1': '1', 'opt2': 20},
+            True)
+
+    def test_capabilities_filter_fails(self):
+        self._do_test_capabilities_filter(
+            {'opt1': '1', 'capabilities:opt2': '>= 10'},
+            {'opt1': '1', 'opt2': 5},
+            False)
+
+    def test_capabilities_filter_missing_capability(self):
+        self._do_test_capabilities_filter({'opt3': '1'}, {'opt1': '1'},
+                                          False)
+
+    def test_capabilities_filter_nested_scope(self):
+        self._do_test_capabilities_filter(
+            {'capabilities:pool:opt1': '<or> a <or> b'},
+            {'pool': {'opt1': 'b'}},
+            True)
+        self._do_test_capabilities_filter(
+            {'capabilities:pool:opt1': '<or> a <or> b'},
+            {'pool': 'not-a-dict'},
+            False, type_id='fake-type2')
+
+    def test_capabilities_filter_no_extra_specs(self):
+        self._do_test_capabilities_filter({}, {'opt1': '1'}, True)
+
+    def test_capabilities_filter_recompiles_changed_extra_specs(self):
+        self._do_test_capabilities_filter({'opt1': '1'}, {'opt1': '1'}, True)
+        self._do_test_capabilities_filter({'opt1': '2'}, {'opt1': '1'}, False)
+
+    def test_capabilities_filter_compiled_specs_bounded(self):
+        filter_cls = compiled_capabilities_filter.CapabilitiesFilter
+        self.stubs.Set(filter_cls, 'max_compiled_specs', 2)
+        self.stubs.Set(filter_cls, '_compiled_specs',
+                       collections.OrderedDict())
+        for type_id in ('type1', 'type2', 'type1', 'type3'):
+            self._do_test_capabilities_filter({'opt1': '1'}, {'opt1': '1'},
+                                              True, type_id=type_id)
+
+        # type2 is the least recently used
+        self.assertEqual(['type1', 'type3'],
+                         filter_cls._compiled_specs.keys())
+
+    def test_capabilities_filter_matches_extra_specs_ops(self):
+        # The compiled matchers must agree with extra_specs_ops.match().
+        reqs = ['1', '= 10', '== 10', '!= 10', '>= 10', '<= 10', 's== abc',
+                's!= abc', 's< abc', 's<= abc', 's> abc', 's>= abc',
+                '<in> ab', '<is> True', '<or> abc <or> 10', '= x', '>=']
+        values = ['1', '10', '11', 'abc', 'xabcx', 'True', 'false', None]
+        for req in reqs:
+            predicate = compiled_capabilities_filter._compile_requirement(req)
+            for value in values:
+                self.assertEqual(
+                    capabilities_filter.extra_specs_ops.match(value, req),
+                    predicate(value),
+                    'mismatch for %r and %r' % (value, req))
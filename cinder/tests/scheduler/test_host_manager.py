@@ -121,6 +121,7 @@ class HostManagerTestCase(test.TestCase):
     @mock.patch('cinder.utils.service_is_up')
     def test_get_all_host_states(self, _mock_service_is_up,
                                  _mock_service_get_all_by_topic):
+        self.flags(scheduler_host_state_cache_ttl=0)
         context = 'fake_context'
         topic = CONF.volume_topic
 
@@ -189,6 +190,131 @@ class HostManagerTestCase(test.TestCase):
             self.assertEqual(host_state_map[host].service,
                              volume_node)
 
+    def _fake_services(self):
+        return [dict(id=x, host='host%s' % x, topic='volume', disabled=False,
+                     availability_zone='zone1', updated_at=timeutils.utcnow())
+                for x in xrange(1, 4)]
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_get_all_host_states_cached(self, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        _mock_service_get_all_by_topic.return_value = self._fake_services()
+
+        hosts = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(3, len(hosts))
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
+        hosts = list(self.host_manager.get_all_host_states(context))
+        self.assertEqual(3, len(hosts))
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
+        stats = self.host_manager.get_host_state_cache_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(3, stats['hosts'])
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_get_all_host_states_cache_expired(self,
+                                               _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        _mock_service_get_all_by_topic.return_value = self._fake_services()
+        start = timeutils.utcnow()
+        timeutils.set_time_override(start)
+        self.addCleanup(timeutils.clear_time_override)
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(CONF.scheduler_host_state_cache_ttl
+                                       + 1)
+        self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+        stats = self.host_manager.get_host_state_cache_stats()
+        self.assertEqual(0, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_get_all_host_states_service_disabled(
+            self, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        services = self._fake_services()
+        _mock_service_get_all_by_topic.return_value = services
+        start = timeutils.utcnow()
+        timeutils.set_time_override(start)
+        self.addCleanup(timeutils.clear_time_override)
+        self.host_manager.get_all_host_states(context)
+
+        # Services disabled through the API are dropped at the next refresh
+        _mock_service_get_all_by_topic.return_value = services[:2]
+        hosts = self.host_manager.get_all_host_states(context)
+        self.assertEqual(3, len(list(hosts)))
+
+        timeutils.advance_time_seconds(CONF.scheduler_host_state_cache_ttl
+                                       + 1)
+        hosts = self.host_manager.get_all_host_states(context)
+        self.assertEqual(set(['host1', 'host2']),
+                         set(h.host for h in hosts))
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_get_all_host_states_service_registered(
+            self, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        services = self._fake_services()
+        _mock_service_get_all_by_topic.return_value = services[:2]
+        self.host_manager.get_all_host_states(context)
+
+        # The capabilities of a host which isn't cached refresh the cache
+        _mock_service_get_all_by_topic.return_value = services
+        capabs = {'total_capacity_gb': 1024,
+                  'free_capacity_gb': 512,
+                  'reserved_percentage': 0}
+        self.host_manager.update_service_capabilities('volume', 'host3',
+                                                      capabs)
+        hosts = self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         set(h.host for h in hosts))
+        self.assertEqual(512,
+                         self.host_manager.host_state_map['host3'].
+                         free_capacity_gb)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_cached_host_down(
+            self, _mock_service_is_up, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        _mock_service_get_all_by_topic.return_value = self._fake_services()
+        _mock_service_is_up.return_value = True
+        self.host_manager.get_all_host_states(context)
+
+        # A cached host that looks down forces the services table to be
+        # re-read before it is dropped.
+        _mock_service_is_up.side_effect = lambda s: s['host'] != 'host3'
+        hosts = self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(set(['host1', 'host2']),
+                         set(h.host for h in hosts))
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_update_service_capabilities_updates_cache(
+            self, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        _mock_service_get_all_by_topic.return_value = self._fake_services()
+        self.host_manager.get_all_host_states(context)
+
+        capabs = {'total_capacity_gb': 1024,
+                  'free_capacity_gb': 512,
+                  'reserved_percentage': 0}
+        self.host_manager.update_service_capabilities('volume', 'host1',
+                                                      capabs)
+        host_state = self.host_manager.host_state_map['host1']
+        self.assertEqual(512, host_state.free_capacity_gb)
+        self.assertEqual(512, host_state.capabilities['free_capacity_gb'])
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class."""
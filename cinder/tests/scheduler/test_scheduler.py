@@ -102,6 +102,47 @@ class SchedulerManagerTestCase(test.TestCase):
         _mock_sched_create.assert_called_once_with(self.context, request_spec,
                                                    {})
 
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volume')
+    @mock.patch('cinder.db.volume_update')
+    def test_create_volumes_puts_unplaced_volumes_in_error_state(
+            self, _mock_volume_update, _mock_sched_create):
+        # Volumes of a batch without a valid host are set to error while
+        # the others are scheduled.
+        def fake_schedule(context, request_spec, filter_properties):
+            if request_spec['volume_id'] == 2:
+                raise exception.NoValidHost(reason="")
+
+        _mock_sched_create.side_effect = fake_schedule
+        request_specs = [{'volume_id': 1}, {'volume_id': 2}]
+
+        self.manager.create_volumes(self.context, 'fake_topic',
+                                    request_specs, filter_properties={})
+        _mock_volume_update.assert_called_once_with(self.context, 2,
+                                                    {'status': 'error'})
+        self.assertEqual(2, _mock_sched_create.call_count)
+
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volume')
+    @mock.patch('cinder.db.volume_update')
+    def test_create_volumes_exception_spares_dispatched_volumes(
+            self, _mock_volume_update, _mock_sched_create):
+        # When scheduling fails partway through a batch, only the volumes
+        # not cast to a volume host yet are set to error.
+        def fake_schedule(context, request_spec, filter_properties):
+            if request_spec['volume_id'] == 2:
+                raise exception.CinderException()
+
+        _mock_sched_create.side_effect = fake_schedule
+        request_specs = [{'volume_id': 1}, {'volume_id': 2},
+                         {'volume_id': 3}]
+
+        self.assertRaises(exception.CinderException,
+                          self.manager.create_volumes, self.context,
+                          'fake_topic', request_specs, filter_properties={})
+        self.assertEqual([mock.call(self.context, 2, {'status': 'error'}),
+                          mock.call(self.context, 3, {'status': 'error'})],
+                         _mock_volume_update.call_args_list)
+        self.assertEqual(2, _mock_sched_create.call_count)
+
     @mock.patch('cinder.scheduler.driver.Scheduler.host_passes_filters')
     @mock.patch('cinder.db.volume_update')
     def test_migrate_volume_exception_returns_volume_state(
@@ -242,3 +283,13 @@ class SchedulerDriverModuleTestCase(test.TestCase):
         _mock_vol_update.assert_called_once_with(self.context, 31337,
                                                  {'host': 'fake_host',
                                                   'scheduled_at': 'fake-now'})
+
+    @mock.patch('cinder.db.volume_update_hosts')
+    @mock.patch('cinder.openstack.common.timeutils.utcnow')
+    def test_volumes_update_db(self, _mock_utcnow, _mock_update_hosts):
+        _mock_utcnow.return_value = 'fake-now'
+        _mock_update_hosts.return_value = [{'id': 1, 'host': 'fake_host'}]
+        volumes = driver.volumes_update_db(self.context, {1: 'fake_host'})
+        _mock_update_hosts.assert_called_once_with(
+            self.context, {1: 'fake_host'}, {'scheduled_at': 'fake-now'})
+        self.assertEqual({1: {'id': 1, 'host': 'fake_host'}}, volumes)
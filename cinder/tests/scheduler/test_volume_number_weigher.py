@@ -30,17 +30,9 @@ from cinder.tests.scheduler import fakes
 CONF = cfg.CONF
 
 
-def fake_volume_data_get_for_host(context, host, count_only=False):
-    if host == 'host1':
-        return 1
-    elif host == 'host2':
-        return 2
-    elif host == 'host3':
-        return 3
-    elif host == 'host4':
-        return 4
-    else:
-        return 1
+def fake_volume_count_get_all_by_host(context, hosts):
+    counts = {'host1': 1, 'host2': 2, 'host3': 3, 'host4': 4}
+    return dict((host, counts.get(host, 1)) for host in hosts)
 
 
 class VolumeNumberWeigherTestCase(test.TestCase):
@@ -76,8 +68,8 @@ class VolumeNumberWeigherTestCase(test.TestCase):
         # host3: 3 volumes
         # host4: 4 volumes
         # so, host1 should win:
-        with mock.patch.object(api, 'volume_data_get_for_host',
-                               fake_volume_data_get_for_host):
+        with mock.patch.object(api, 'volume_count_get_all_by_host',
+                               fake_volume_count_get_all_by_host):
             weighed_host = self._get_weighed_host(hostinfo_list)
             self.assertEqual(weighed_host.weight, -1.0)
             self.assertEqual(weighed_host.obj.host, 'host1')
@@ -91,8 +83,27 @@ class VolumeNumberWeigherTestCase(test.TestCase):
         # host3: 3 volumes
         # host4: 4 volumes
         # so, host4 should win:
-        with mock.patch.object(api, 'volume_data_get_for_host',
-                               fake_volume_data_get_for_host):
+        with mock.patch.object(api, 'volume_count_get_all_by_host',
+                               fake_volume_count_get_all_by_host):
             weighed_host = self._get_weighed_host(hostinfo_list)
             self.assertEqual(weighed_host.weight, 4.0)
             self.assertEqual(weighed_host.obj.host, 'host4')
+
+    def test_volume_number_weigher_single_query(self):
+        self.flags(volume_number_multiplier=-1.0)
+        hostinfo_list = list(self._get_all_hosts())
+
+        with mock.patch.object(api, 'volume_count_get_all_by_host',
+                               side_effect=fake_volume_count_get_all_by_host
+                               ) as mock_count:
+            weighed_host = self._get_weighed_host(hostinfo_list)
+            self.assertEqual('host1', weighed_host.obj.host)
+            self.assertEqual(1, mock_count.call_count)
+
+            # Counts are kept for the rest of the request and follow the
+            # volumes consumed from the hosts.
+            weighed_host.obj.consume_from_volume({'size': 1})
+            weighed_host.obj.consume_from_volume({'size': 1})
+            weighed_host = self._get_weighed_host(hostinfo_list)
+            self.assertEqual('host2', weighed_host.obj.host)
+            self.assertEqual(1, mock_count.call_count)
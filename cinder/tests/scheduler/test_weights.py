@@ -0,0 +1,123 @@
+# Copyright (c) 2014 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Scheduler weights.
+"""
+
+from cinder.openstack.common.scheduler import weights as oslo_weights
+from cinder.scheduler import weights
+from cinder.scheduler.weights import capacity
+from cinder import test
+from cinder.tests.scheduler import fakes
+
+
+class FakeOsloWeigher(oslo_weights.BaseHostWeigher):
+    def _weigh_object(self, host_state, weight_properties):
+        return host_state.fake_weight
+
+
+class WeightsTestCase(test.TestCase):
+    def setUp(self):
+        super(WeightsTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler(
+            'cinder.scheduler.weights')
+        self.hosts = [
+            fakes.FakeHostState('host1', {'free_capacity_gb': 1000,
+                                          'allocated_capacity_gb': 0,
+                                          'reserved_percentage': 0,
+                                          'fake_weight': 3}),
+            fakes.FakeHostState('host2', {'free_capacity_gb': 500,
+                                          'allocated_capacity_gb': 100,
+                                          'reserved_percentage': 0,
+                                          'fake_weight': 1}),
+            fakes.FakeHostState('host3', {'free_capacity_gb': 100,
+                                          'allocated_capacity_gb': 1000,
+                                          'reserved_percentage': 0,
+                                          'fake_weight': 2}),
+        ]
+
+    def test_normalize(self):
+        self.assertEqual([0.0, 0.5, 1.0], weights.normalize([1, 2, 3]))
+        self.assertEqual([0.0, 0.0], weights.normalize([5, 5]))
+        self.assertEqual([], weights.normalize([]))
+
+    def test_normalize_infinite(self):
+        inf = float('inf')
+        self.assertEqual([1.0, 0.25, 0.75, 0.0],
+                         weights.normalize([inf, 10, 20, -inf]))
+        self.assertEqual([1.0, 0.0, 0.75], weights.normalize([inf, 10, 20]))
+        self.assertEqual([0.25, 1.0, 0.0],
+                         weights.normalize([10, 20, -inf]))
+        self.assertEqual([1.0, 0.0], weights.normalize([inf, 10]))
+        self.assertEqual([1.0, 1.0], weights.normalize([inf, inf]))
+
+    def test_infinite_capacity_weighs_more(self):
+        # A host with infinite free space stays ahead of the host with the
+        # most free space, whatever the other weighers add.
+        self.flags(capacity_weight_multiplier=1.0)
+        self.hosts.append(
+            fakes.FakeHostState('host4', {'free_capacity_gb': 'infinite',
+                                          'allocated_capacity_gb': 0,
+                                          'reserved_percentage': 0}))
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            [capacity.CapacityWeigher, capacity.AllocatedCapacityWeigher],
+            self.hosts, {})
+        self.assertEqual(['host4', 'host1', 'host2', 'host3'],
+                         [h.obj.host for h in weighed_hosts])
+        self.assertTrue(weighed_hosts[0].weight > weighed_hosts[1].weight)
+
+    def test_weights_are_normalized(self):
+        self.flags(capacity_weight_multiplier=1.0)
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            [capacity.CapacityWeigher], self.hosts, {})
+        self.assertEqual(['host1', 'host2', 'host3'],
+                         [h.obj.host for h in weighed_hosts])
+        self.assertEqual(1.0, weighed_hosts[0].weight)
+        self.assertAlmostEqual(400.0 / 900, weighed_hosts[1].weight)
+        self.assertEqual(0.0, weighed_hosts[2].weight)
+
+    def test_combined_weighers(self):
+        # Both weighers contribute the same range whatever their units:
+        # host3 has the least free space and the most allocated space.
+        self.flags(capacity_weight_multiplier=1.0,
+                   allocated_capacity_weight_multiplier=-2.0)
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            [capacity.CapacityWeigher, capacity.AllocatedCapacityWeigher],
+            self.hosts, {})
+        self.assertEqual(['host1', 'host2', 'host3'],
+                         [h.obj.host for h in weighed_hosts])
+        self.assertEqual(1.0, weighed_hosts[0].weight)
+        self.assertEqual(-2.0, weighed_hosts[2].weight)
+
+    def test_top_hosts(self):
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            [capacity.CapacityWeigher], self.hosts, {}, top=2)
+        self.assertEqual(['host1', 'host2'],
+                         [h.obj.host for h in weighed_hosts])
+
+    def test_oslo_weigher(self):
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+            [FakeOsloWeigher], self.hosts, {})
+        self.assertEqual(['host1', 'host3', 'host2'],
+                         [h.obj.host for h in weighed_hosts])
+        self.assertEqual(1.0, weighed_hosts[0].weight)
+
+    def test_weigh_objects_not_normalized(self):
+        # The oslo weight handler still gets the raw weights.
+        self.flags(capacity_weight_multiplier=1.0)
+        weighed_hosts = oslo_weights.HostWeightHandler(
+            'cinder.scheduler.weights').get_weighed_objects(
+                [capacity.CapacityWeigher], self.hosts, {})
+        self.assertEqual(1000, weighed_hosts[0].weight)
@@ -17,6 +17,8 @@ Tests for Backup code.
 
 """
 
+import eventlet
+from eventlet import event
 import mock
 import tempfile
 
@@ -149,6 +151,35 @@ class BackupTestCase(test.TestCase):
                           self.ctxt,
                           backup3_id)
 
+    @mock.patch('cinder.backup.manager.eventlet.spawn_n')
+    def test_init_host_resumes_checkpointed_backup(self, spawn_n):
+        vol1_id = self._create_volume_db_entry(status='backing-up')
+        vol2_id = self._create_volume_db_entry(status='backing-up')
+        backup1_id = self._create_backup_db_entry(status='creating',
+                                                  volume_id=vol1_id)
+        backup2_id = self._create_backup_db_entry(status='creating',
+                                                  volume_id=vol2_id)
+        db.backup_update(self.ctxt, backup1_id,
+                         {'checkpoint': '{"operation": "backup"}'})
+        driver = mock.Mock()
+        driver.can_resume.return_value = True
+
+        with mock.patch.object(self.backup_mgr.service, 'get_backup_driver',
+                               return_value=driver):
+            self.backup_mgr.init_host()
+
+        spawn_n.assert_called_once_with(self.backup_mgr.create_backup,
+                                        mock.ANY, backup1_id)
+        vol1 = db.volume_get(self.ctxt, vol1_id)
+        self.assertEqual('backing-up', vol1['status'])
+        backup1 = db.backup_get(self.ctxt, backup1_id)
+        self.assertEqual('creating', backup1['status'])
+        # Operations without a checkpoint are reset
+        vol2 = db.volume_get(self.ctxt, vol2_id)
+        self.assertEqual('available', vol2['status'])
+        backup2 = db.backup_get(self.ctxt, backup2_id)
+        self.assertEqual('error', backup2['status'])
+
     def test_create_backup_with_bad_volume_status(self):
         """Test error handling when creating a backup from a volume
         with a bad status
@@ -179,10 +210,8 @@ class BackupTestCase(test.TestCase):
         backup_id = self._create_backup_db_entry(volume_id=vol_id)
 
         _mock_volume_backup.side_effect = FakeBackupException('fake')
-        self.assertRaises(FakeBackupException,
-                          self.backup_mgr.create_backup,
-                          self.ctxt,
-                          backup_id)
+        self.backup_mgr.create_backup(self.ctxt, backup_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'available')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -197,6 +226,7 @@ class BackupTestCase(test.TestCase):
         backup_id = self._create_backup_db_entry(volume_id=vol_id)
 
         self.backup_mgr.create_backup(self.ctxt, backup_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'available')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -204,6 +234,47 @@ class BackupTestCase(test.TestCase):
         self.assertEqual(backup['size'], vol_size)
         self.assertTrue(_mock_volume_backup.called)
 
+    @mock.patch('%s.%s' % (CONF.volume_driver, 'backup_volume'))
+    def test_create_backup_scheduled(self, _mock_volume_backup):
+        """Test backup creation waits for a job slot."""
+        vol_id = self._create_volume_db_entry(size=1)
+        backup_id = self._create_backup_db_entry(volume_id=vol_id)
+        _mock_volume_backup.side_effect = lambda *args: self.assertEqual(
+            1, self.backup_mgr.jobs.get_stats()['running'])
+
+        with mock.patch.object(self.backup_mgr.jobs, 'run',
+                               wraps=self.backup_mgr.jobs.run) as run:
+            self.backup_mgr.create_backup(self.ctxt, backup_id)
+            self.backup_mgr.jobs.wait()
+
+        run.assert_called_once_with('backup', 'default', 'fake')
+        self.assertTrue(_mock_volume_backup.called)
+        self.assertEqual(0, self.backup_mgr.jobs.get_stats()['running'])
+
+    @mock.patch('%s.%s' % (CONF.volume_driver, 'backup_volume'))
+    def test_create_backup_queued(self, _mock_volume_backup):
+        """Test a queued backup doesn't hold up the RPC handler."""
+        self.backup_mgr.jobs.max_jobs = 1
+        running = event.Event()
+        _mock_volume_backup.side_effect = lambda *args: running.wait()
+        vol1_id = self._create_volume_db_entry(size=1)
+        backup1_id = self._create_backup_db_entry(volume_id=vol1_id)
+        vol2_id = self._create_volume_db_entry(size=1)
+        backup2_id = self._create_backup_db_entry(volume_id=vol2_id)
+
+        self.backup_mgr.create_backup(self.ctxt, backup1_id)
+        self.backup_mgr.create_backup(self.ctxt, backup2_id)
+        eventlet.sleep(0)
+
+        stats = self.backup_mgr.jobs.get_stats()
+        self.assertEqual(1, stats['running'])
+        self.assertEqual(1, stats['queued'])
+        running.send()
+        self.backup_mgr.jobs.wait()
+        self.assertEqual(2, _mock_volume_backup.call_count)
+        backup2 = db.backup_get(self.ctxt, backup2_id)
+        self.assertEqual('available', backup2['status'])
+
     def test_restore_backup_with_bad_volume_status(self):
         """Test error handling when restoring a backup to a volume
         with a bad status.
@@ -245,11 +316,8 @@ class BackupTestCase(test.TestCase):
                                                  volume_id=vol_id)
 
         _mock_volume_restore.side_effect = FakeBackupException('fake')
-        self.assertRaises(FakeBackupException,
-                          self.backup_mgr.restore_backup,
-                          self.ctxt,
-                          backup_id,
-                          vol_id)
+        self.backup_mgr.restore_backup(self.ctxt, backup_id, vol_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'error_restoring')
         backup = db.backup_get(self.ctxt, backup_id)
@@ -287,6 +355,7 @@ class BackupTestCase(test.TestCase):
                                                  volume_id=vol_id)
 
         self.backup_mgr.restore_backup(self.ctxt, backup_id, vol_id)
+        self.backup_mgr.jobs.wait()
         vol = db.volume_get(self.ctxt, vol_id)
         self.assertEqual(vol['status'], 'available')
         backup = db.backup_get(self.ctxt, backup_id)
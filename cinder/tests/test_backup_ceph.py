@@ -31,6 +31,7 @@ from cinder.openstack.common import jsonutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import processutils
 from cinder import test
+from cinder.tests.backup import fake_rbd
 from cinder.volume.drivers import rbd as rbddriver
 
 LOG = logging.getLogger(__name__)
@@ -382,6 +383,50 @@ class BackupCephTestCase(test.TestCase):
 
         self.assertTrue(self.service.rbd.Image.write.called)
 
+    @common_mocks
+    def test_backup_volume_from_file_resume(self):
+        offset = self.data_length / 2
+        self.service.save_checkpoint(self.backup, {'operation': 'backup',
+                                                   'offset': offset})
+        writes = []
+
+        def mock_write_data(data, offset):
+            writes.append((offset, data))
+
+        self.service.rbd.Image.write = mock.Mock()
+        self.service.rbd.Image.write.side_effect = mock_write_data
+        self.service.rbd.RBD.create = mock.Mock()
+
+        with mock.patch.object(self.service, '_backup_metadata'):
+            with mock.patch.object(self.service, '_discard_bytes'):
+                self.service.backup(self.backup, self.volume_file)
+
+        # The copy continues into the existing image from the checkpoint
+        self.assertFalse(self.service.rbd.RBD.create.called)
+        self.assertEqual(offset, writes[0][0])
+        self.volume_file.seek(offset)
+        self.assertEqual(self.volume_file.read(),
+                         ''.join(data for (_offset, data) in writes))
+        backup = db.backup_get(self.ctxt, self.backup_id)
+        self.assertIsNone(backup['checkpoint'])
+
+    @common_mocks
+    def test_backup_checkpoint(self):
+        self.service.rbd.Image.write = mock.Mock()
+
+        with mock.patch.object(driver.CheckpointTimer, 'due',
+                               return_value=True):
+            with mock.patch.object(self.service, 'save_checkpoint') as save:
+                with mock.patch.object(self.service, '_backup_metadata'):
+                    with mock.patch.object(self.service, '_discard_bytes'):
+                        self.service.backup(self.backup, self.volume_file)
+
+        save.assert_called_with(self.backup, {'operation': 'backup',
+                                              'offset': self.data_length})
+        self.assertTrue(self.service.can_resume(
+            {'checkpoint': '{"operation": "backup", "offset": 1024}'}))
+        self.assertFalse(self.service.can_resume({'checkpoint': None}))
+
     @common_mocks
     def test_get_backup_base_name(self):
         name = self.service._get_backup_base_name(self.volume_id,
@@ -400,6 +445,7 @@ class BackupCephTestCase(test.TestCase):
     @mock.patch('fcntl.fcntl', spec=True)
     @mock.patch('subprocess.Popen', spec=True)
     def test_backup_volume_from_rbd(self, mock_popen, mock_fnctl):
+        self.flags(backup_ceph_diff_engine='cli')
         backup_name = self.service._get_backup_base_name(self.backup_id,
                                                          diff_format=True)
 
@@ -692,6 +738,41 @@ class BackupCephTestCase(test.TestCase):
             self.assertEqual(self.mock_rbd.Image.flush.call_count, 3)
             self.assertFalse(self.mock_rbd.Image.discard.called)
 
+    @common_mocks
+    def test_discard_bytes_file(self):
+        with tempfile.NamedTemporaryFile() as test_file:
+            test_file.write('a' * 3 * self.chunk_size)
+            test_file.seek(self.chunk_size)
+
+            with mock.patch.object(test_file, 'write') as mock_write:
+                self.service._discard_bytes(test_file, self.chunk_size,
+                                            self.chunk_size)
+
+            # The range is zeroed without writing to it
+            self.assertFalse(mock_write.called)
+            self.assertEqual(2 * self.chunk_size, test_file.tell())
+            test_file.seek(0)
+            self.assertEqual('a' * self.chunk_size +
+                             '\0' * self.chunk_size +
+                             'a' * self.chunk_size, test_file.read())
+
+    @common_mocks
+    def test_discard_bytes_file_extends(self):
+        with tempfile.NamedTemporaryFile() as test_file:
+            test_file.write('a' * self.chunk_size)
+
+            with mock.patch.object(test_file, 'write') as mock_write:
+                self.service._discard_bytes(test_file, self.chunk_size,
+                                            2 * self.chunk_size)
+
+            # Discarding past the end still extends the file with zeroes
+            self.assertFalse(mock_write.called)
+            self.assertEqual(3 * self.chunk_size,
+                             os.fstat(test_file.fileno()).st_size)
+            test_file.seek(0)
+            self.assertEqual('a' * self.chunk_size +
+                             '\0' * 2 * self.chunk_size, test_file.read())
+
     @common_mocks
     def test_delete_backup_snapshot(self):
         snap_name = 'backup.%s.snap.3824923.1412' % (uuid.uuid4())
@@ -1033,6 +1114,104 @@ class BackupCephTestCase(test.TestCase):
         self.assertTrue(self.mock_rados.Object.read.called)
 
 
+class BackupCephDiffTransferTestCase(test.TestCase):
+    """Test case for native differential transfers between RBD images."""
+
+    block = 4096
+
+    def setUp(self):
+        super(BackupCephDiffTransferTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.cluster = fake_rbd.FakeCluster(block_size=self.block)
+        self.service = ceph.CephBackupDriver(self.ctxt)
+        self.service.rbd = self.cluster
+        self.service.rados = self.cluster
+        self.data = os.urandom(8 * self.block)
+        self.cluster.create('volumes', 'volume', self.data)
+        self.cluster.create('backups', 'base', '')
+
+    def _transfer(self, src_snap, from_snap=None):
+        return self.service._rbd_diff_transfer(
+            'volume', 'volumes', 'base', 'backups', src_user='cinder',
+            src_conf='conf', dest_user='backup', dest_conf='conf',
+            src_snap=src_snap, from_snap=from_snap)
+
+    def _snap(self, name):
+        self.cluster.images[('volumes', 'volume')].snaps[name] = \
+            bytearray(self.cluster.get('volumes', 'volume'))
+
+    def _write(self, offset, data):
+        self.cluster.images[('volumes', 'volume')].data[
+            offset:offset + len(data)] = data
+
+    def test_diff_transfer_full(self):
+        self._write(2 * self.block, '\0' * self.block)
+        self._snap('snap-1')
+
+        stats = self._transfer('snap-1')
+
+        # The zero block isn't allocated in the source and not copied
+        self.assertEqual(7 * self.block, stats['bytes'])
+        self.assertEqual(0, stats['discarded'])
+        self.assertEqual(self.cluster.get('volumes', 'volume'),
+                         self.cluster.get('backups', 'base'))
+        self.assertEqual(self.cluster.get('volumes', 'volume'),
+                         self.cluster.get('backups', 'base', 'snap-1'))
+
+    def test_diff_transfer_incremental(self):
+        self._snap('snap-1')
+        self._transfer('snap-1')
+        self._write(self.block, 'x' * self.block)
+        self._write(5 * self.block, '\0' * self.block)
+        self._snap('snap-2')
+        self.cluster.writes = []
+
+        stats = self._transfer('snap-2', from_snap='snap-1')
+
+        # Only the changed block is written, the zeroed block is discarded
+        self.assertEqual([(self.block, self.block)], self.cluster.writes)
+        self.assertEqual([(5 * self.block, self.block)],
+                         self.cluster.discards)
+        self.assertEqual(self.block, stats['bytes'])
+        self.assertEqual(self.cluster.get('volumes', 'volume', 'snap-2'),
+                         self.cluster.get('backups', 'base', 'snap-2'))
+        self.assertEqual(self.data,
+                         self.cluster.get('backups', 'base', 'snap-1'))
+
+    def test_diff_transfer_split(self):
+        self.service.chunk_size = 1024
+        self.flags(backup_ceph_diff_queue_depth=2)
+        self._snap('snap-1')
+
+        self._transfer('snap-1')
+
+        self.assertEqual(8 * self.block / 1024, len(self.cluster.writes))
+        self.assertEqual(self.data, self.cluster.get('backups', 'base'))
+
+    def test_diff_transfer_resizes_destination(self):
+        self.cluster.create('backups', 'base', 'x' * 16 * self.block)
+        self._snap('snap-1')
+
+        self._transfer('snap-1')
+
+        self.assertEqual(self.data, self.cluster.get('backups', 'base'))
+
+    def test_diff_transfer_error(self):
+        self._snap('snap-1')
+
+        with mock.patch.object(fake_rbd.FakeImage, 'write',
+                               side_effect=fake_rbd.Error('fake')):
+            self.assertRaises(exception.BackupRBDOperationFailed,
+                              self._transfer, 'snap-1')
+
+        # The snapshot is only created once the transfer is complete
+        self.assertEqual({}, self.cluster.images[('backups', 'base')].snaps)
+
+    def test_diff_transfer_missing_snapshot(self):
+        self.assertRaises(exception.BackupRBDOperationFailed,
+                          self._transfer, 'snap-1')
+
+
 def common_meta_backup_mocks(f):
     """Decorator to set mocks common to all metadata backup tests.
 
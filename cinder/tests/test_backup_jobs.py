@@ -0,0 +1,174 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the scheduling of backup jobs."""
+
+import eventlet
+from eventlet import event
+
+from cinder.backup import jobs
+from cinder import test
+
+
+class JobSchedulerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(JobSchedulerTestCase, self).setUp()
+        self.started = []
+        self.done = {}
+
+    def _job(self, scheduler, name, kind='backup', backend='default',
+             project_id='project'):
+        """Spawn a job running until it is finished with _finish()."""
+        self.done[name] = event.Event()
+
+        def _run():
+            with scheduler.run(kind, backend, project_id):
+                self.started.append(name)
+                self.done[name].wait()
+
+        thread = eventlet.spawn(_run)
+        eventlet.sleep(0)
+        return thread
+
+    def _finish(self, name):
+        self.done[name].send()
+        eventlet.sleep(0)
+        eventlet.sleep(0)
+
+    def test_unlimited(self):
+        scheduler = jobs.JobScheduler()
+
+        for name in ('a', 'b', 'c'):
+            self._job(scheduler, name)
+
+        self.assertEqual(['a', 'b', 'c'], self.started)
+        self.assertEqual(3, scheduler.get_stats()['running'])
+
+    def test_max_jobs(self):
+        scheduler = jobs.JobScheduler(max_jobs=2)
+
+        for name in ('a', 'b', 'c'):
+            self._job(scheduler, name)
+
+        self.assertEqual(['a', 'b'], self.started)
+        self.assertEqual(1, scheduler.get_stats()['queued'])
+        self._finish('a')
+        self.assertEqual(['a', 'b', 'c'], self.started)
+
+    def test_max_jobs_per_backend(self):
+        scheduler = jobs.JobScheduler(max_jobs_per_backend=1)
+
+        self._job(scheduler, 'a1', backend='a')
+        self._job(scheduler, 'a2', backend='a')
+        self._job(scheduler, 'b1', backend='b')
+
+        # The job queued on a busy backend doesn't hold up the others
+        self.assertEqual(['a1', 'b1'], self.started)
+        self.assertEqual({'a': 1, 'b': 1},
+                         scheduler.get_stats()['running_by_backend'])
+        self._finish('a1')
+        self.assertEqual(['a1', 'b1', 'a2'], self.started)
+
+    def test_restores_first(self):
+        scheduler = jobs.JobScheduler(max_jobs=1)
+        self._job(scheduler, 'running')
+
+        self._job(scheduler, 'backup')
+        self._job(scheduler, 'restore', kind='restore')
+        self._finish('running')
+
+        self.assertEqual(['running', 'restore'], self.started)
+        self._finish('restore')
+        self.assertEqual(['running', 'restore', 'backup'], self.started)
+
+    def test_fair_share(self):
+        scheduler = jobs.JobScheduler(max_jobs=2)
+        self._job(scheduler, 'p1-1', project_id='p1')
+        self._job(scheduler, 'p1-2', project_id='p1')
+
+        self._job(scheduler, 'p1-3', project_id='p1')
+        self._job(scheduler, 'p2-1', project_id='p2')
+        self._finish('p1-1')
+
+        # p2 has no job running, p1 still has one
+        self.assertEqual(['p1-1', 'p1-2', 'p2-1'], self.started)
+
+    def test_queued_job_killed(self):
+        scheduler = jobs.JobScheduler(max_jobs=1)
+        self._job(scheduler, 'a')
+        thread = self._job(scheduler, 'b')
+
+        thread.kill()
+
+        self.assertEqual(0, scheduler.get_stats()['queued'])
+        self._finish('a')
+        self.assertEqual(['a'], self.started)
+        self.assertEqual(0, scheduler.get_stats()['running'])
+
+    def test_failed_job_frees_slot(self):
+        scheduler = jobs.JobScheduler(max_jobs=1)
+
+        def _fail():
+            with scheduler.run('backup', 'default', 'project'):
+                raise IOError()
+
+        self.assertRaises(IOError, _fail)
+        self._job(scheduler, 'a')
+        self.assertEqual(['a'], self.started)
+
+    def test_get_stats(self):
+        scheduler = jobs.JobScheduler(max_jobs=1)
+        self._job(scheduler, 'a')
+        self._job(scheduler, 'b', kind='restore')
+
+        stats = scheduler.get_stats()
+
+        self.assertEqual(1, stats['queued'])
+        self.assertEqual({'restore': 1}, stats['queued_by_type'])
+        self.assertEqual(1, stats['running'])
+        self.assertEqual(1, stats['jobs_started'])
+        self._finish('a')
+        stats = scheduler.get_stats()
+        self.assertEqual(2, stats['jobs_started'])
+        self.assertTrue(stats['wait_time_max'] >= stats['wait_time_avg'])
+
+    def test_spawn(self):
+        scheduler = jobs.JobScheduler(max_jobs=1)
+        self._job(scheduler, 'a')
+
+        # The caller isn't held up while the job waits in the queue
+        scheduler.spawn('backup', 'default', 'project', self.started.append,
+                        'b')
+        eventlet.sleep(0)
+
+        self.assertEqual(['a'], self.started)
+        self.assertEqual(1, scheduler.get_stats()['queued'])
+        self._finish('a')
+        scheduler.wait()
+        self.assertEqual(['a', 'b'], self.started)
+        self.assertEqual(0, scheduler.get_stats()['running'])
+
+    def test_spawn_failed_job_frees_slot(self):
+        scheduler = jobs.JobScheduler(max_jobs=1)
+
+        def _fail():
+            raise IOError()
+
+        scheduler.spawn('backup', 'default', 'project', _fail)
+        scheduler.wait()
+
+        self.assertEqual(0, scheduler.get_stats()['running'])
+        self._job(scheduler, 'a')
+        self.assertEqual(['a'], self.started)
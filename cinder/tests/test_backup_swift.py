@@ -18,20 +18,27 @@ Tests for Backup swift code.
 """
 
 import bz2
+import errno
 import hashlib
 import os
+import socket
 import tempfile
 import zlib
 
+import eventlet
+import mock
 from swiftclient import client as swift
 
+from cinder.backup import driver
 from cinder.backup.drivers.swift import SwiftBackupDriver
 from cinder import context
 from cinder import db
 from cinder import exception
 from cinder.openstack.common import log as logging
 from cinder import test
+from cinder.tests.backup import fake_swift_client
 from cinder.tests.backup.fake_swift_client import FakeSwiftClient
+from cinder.volume import blockcopy
 
 
 LOG = logging.getLogger(__name__)
@@ -128,6 +135,64 @@ class BackupSwiftTestCase(test.TestCase):
                           service.backup,
                           backup, self.volume_file)
 
+    def test_backup_pipelined(self):
+        self._create_backup_db_entry()
+        self.flags(backup_compression_algorithm='none',
+                   backup_swift_object_size=8 * 1024,
+                   backup_swift_pipeline_depth=4)
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        uploads = {'current': 0, 'max': 0}
+
+        def fake_put_object(self, container, name, reader, **kwargs):
+            uploads['current'] += 1
+            uploads['max'] = max(uploads['max'], uploads['current'])
+            # Later objects are uploaded faster
+            eventlet.sleep(0.001 * (4 - int(name[-5:]) % 4))
+            uploads['current'] -= 1
+            return 'fake-md5-sum'
+
+        object_lists = []
+
+        def fake_write_metadata(self, backup, volume_id, container,
+                                object_list, volume_meta, parent_id=None):
+            object_lists.append(object_list)
+
+        self.stubs.Set(fake_swift_client.FakeSwiftConnection, 'put_object',
+                       fake_put_object)
+        self.stubs.Set(SwiftBackupDriver, '_write_metadata',
+                       fake_write_metadata)
+        service.backup(backup, self.volume_file)
+
+        object_list = object_lists[0]
+        self.assertEqual(16, len(object_list))
+        self.assertEqual(['%s-%05d' % (backup['service_metadata'], i)
+                          for i in xrange(1, 17)],
+                         [obj.keys()[0] for obj in object_list])
+        self.assertEqual([(i + 1) * 8 * 1024 for i in xrange(16)],
+                         [obj.values()[0]['offset'] for obj in object_list])
+        self.assertEqual(4, uploads['max'])
+        self.assertEqual(17, db.backup_get(self.ctxt, 123)['object_count'])
+
+    def test_backup_pipelined_failure(self):
+        self._create_backup_db_entry()
+        self.flags(backup_swift_object_size=8 * 1024)
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+
+        def fake_put_object(self, container, name, reader, **kwargs):
+            if name.endswith('00002'):
+                raise socket.error(111, 'ECONNREFUSED')
+            return 'fake-md5-sum'
+
+        self.stubs.Set(fake_swift_client.FakeSwiftConnection, 'put_object',
+                       fake_put_object)
+        self.assertRaises(exception.SwiftConnectionFailed,
+                          service.backup,
+                          backup, self.volume_file)
+
     def test_backup_backup_metadata_fail(self):
         """Test of when an exception occurs in backup().
 
@@ -192,6 +257,31 @@ class BackupSwiftTestCase(test.TestCase):
             backup = db.backup_get(self.ctxt, 123)
             service.restore(backup, '1234-5678-1234-8888', volume_file)
 
+    def test_restore_pipelined(self):
+        self._create_backup_db_entry()
+        self.flags(backup_swift_pipeline_depth=2)
+        service = SwiftBackupDriver(self.ctxt)
+
+        def fake_get_object(self, container, name):
+            # Later objects are downloaded faster
+            eventlet.sleep(0.001 * (4 - int(name[-3:])))
+            return None, zlib.compress(name)
+
+        self.stubs.Set(fake_swift_client.FakeSwiftConnection, 'get_object',
+                       fake_get_object)
+        metadata = {'objects': [
+            {'backup_001': {'compression': 'zlib'}},
+            {'backup_002': {'compression': 'zlib'}},
+            {'backup_003': {'compression': 'zlib'}}]}
+
+        with tempfile.NamedTemporaryFile() as volume_file:
+            backup = db.backup_get(self.ctxt, 123)
+            service._restore_v1(backup, '1234-5678-1234-8888', metadata,
+                                volume_file)
+            volume_file.seek(0)
+            self.assertEqual('backup_001backup_002backup_003',
+                             volume_file.read())
+
     def test_restore_wraps_socket_error(self):
         container_name = 'socket_error_on_get'
         self._create_backup_db_entry(container=container_name)
@@ -238,3 +328,388 @@ class BackupSwiftTestCase(test.TestCase):
         compressor = service._get_compressor('bz2')
         self.assertEqual(compressor, bz2)
         self.assertRaises(ValueError, service._get_compressor, 'fake')
+
+
+class FakeSwiftStore(object):
+    """Swift connections keeping the objects in memory."""
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = []
+
+    def Connection(self, *args, **kwargs):
+        return self
+
+    def put_container(self, container):
+        pass
+
+    def get_container(self, container, prefix=None, full_listing=False):
+        return None, [{'name': name} for (c, name) in sorted(self.objects)
+                      if c == container and name.startswith(prefix)]
+
+    def put_object(self, container, name, reader, content_length=None):
+        self.puts.append(name)
+        self.objects[(container, name)] = reader.read()
+        return 'fake-md5-sum'
+
+    def get_object(self, container, name):
+        return None, self.objects[(container, name)]
+
+    def delete_object(self, container, name):
+        del self.objects[(container, name)]
+
+
+class BackupSwiftIncrementalTestCase(test.TestCase):
+    """Test Case for incremental swift backups."""
+
+    chunk_size = 8 * 1024
+
+    def setUp(self):
+        super(BackupSwiftIncrementalTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.store = FakeSwiftStore()
+        self.stubs.Set(swift, 'Connection', self.store.Connection)
+        self.stubs.Set(hashlib, 'md5', fake_md5)
+        self.flags(backup_swift_incremental=True,
+                   backup_swift_object_size=self.chunk_size)
+
+        db.volume_create(self.ctxt, {'id': '1234-5678-1234-8888',
+                                     'size': 1,
+                                     'status': 'available'})
+        self.data = os.urandom(4 * self.chunk_size)
+
+    def _backup(self, backup_id, data):
+        db.backup_create(self.ctxt, {'id': backup_id,
+                                     'size': 1,
+                                     'container': 'test-container',
+                                     'project_id': 'fake-project',
+                                     'volume_id': '1234-5678-1234-8888',
+                                     'status': 'creating'})
+        backup = db.backup_get(self.ctxt, backup_id)
+        with tempfile.NamedTemporaryFile() as volume_file:
+            volume_file.write(data)
+            volume_file.seek(0)
+            SwiftBackupDriver(self.ctxt).backup(backup, volume_file)
+        db.backup_update(self.ctxt, backup_id, {'status': 'available'})
+        return db.backup_get(self.ctxt, backup_id)
+
+    def _restore(self, backup):
+        with tempfile.NamedTemporaryFile() as volume_file:
+            SwiftBackupDriver(self.ctxt).restore(
+                backup, '1234-5678-1234-8888', volume_file)
+            volume_file.seek(0)
+            return volume_file.read()
+
+    def _metadata(self, backup):
+        return SwiftBackupDriver(self.ctxt)._read_metadata(backup)
+
+    def _changed_data(self):
+        chunk = self.chunk_size
+        return self.data[:chunk] + 'x' * chunk + self.data[2 * chunk:]
+
+    def test_backup_incremental(self):
+        parent = self._backup('backup-1', self.data)
+        self.store.puts = []
+
+        backup = self._backup('backup-2', self._changed_data())
+
+        # Only the changed object and the metadata are uploaded
+        prefix = backup['service_metadata']
+        self.assertEqual(['%s-00002' % prefix, '%s_metadata' % prefix],
+                         self.store.puts)
+        metadata = self._metadata(backup)
+        self.assertEqual('backup-1', metadata['parent_id'])
+        parent_prefix = parent['service_metadata']
+        self.assertEqual(['%s-00001' % parent_prefix, '%s-00002' % prefix,
+                          '%s-00003' % parent_prefix,
+                          '%s-00004' % parent_prefix],
+                         [obj.keys()[0] for obj in metadata['objects']])
+        self.assertEqual(self._changed_data(), self._restore(backup))
+        self.assertEqual(self.data, self._restore(parent))
+
+    def test_backup_incremental_disabled(self):
+        self._backup('backup-1', self.data)
+        self.flags(backup_swift_incremental=False)
+        self.store.puts = []
+
+        backup = self._backup('backup-2', self._changed_data())
+
+        self.assertEqual(5, len(self.store.puts))
+        self.assertIsNone(self._metadata(backup)['parent_id'])
+
+    def test_delete_keeps_referenced_objects(self):
+        parent = self._backup('backup-1', self.data)
+        backup = self._backup('backup-2', self._changed_data())
+
+        SwiftBackupDriver(self.ctxt).delete(parent)
+        db.backup_destroy(self.ctxt, 'backup-1')
+
+        # The object which changed is the only one left of the parent
+        parent_prefix = parent['service_metadata']
+        self.assertEqual(['%s-00001' % parent_prefix,
+                          '%s-00003' % parent_prefix,
+                          '%s-00004' % parent_prefix],
+                         [name for (c, name) in sorted(self.store.objects)
+                          if name.startswith(parent_prefix)])
+        self.assertEqual(self._changed_data(), self._restore(backup))
+
+        SwiftBackupDriver(self.ctxt).delete(backup)
+        self.assertEqual({}, self.store.objects)
+
+    def test_delete_parent_of_unreadable_backup(self):
+        parent = self._backup('backup-1', self.data)
+        backup = self._backup('backup-2', self._changed_data())
+        del self.store.objects[('test-container', '%s_metadata' %
+                                backup['service_metadata'])]
+
+        objects = dict(self.store.objects)
+
+        # Nothing is deleted when references are unknown
+        self.assertRaises(exception.InvalidBackup,
+                          SwiftBackupDriver(self.ctxt).delete, parent)
+        self.assertEqual(objects, self.store.objects)
+
+    def _start_backup(self, backup_id, parent):
+        """Create a backup which recorded its parent but has no metadata
+        yet.
+        """
+        db.backup_create(self.ctxt, {'id': backup_id,
+                                     'size': 1,
+                                     'container': 'test-container',
+                                     'project_id': 'fake-project',
+                                     'volume_id': '1234-5678-1234-8888',
+                                     'status': 'creating'})
+        backup = db.backup_get(self.ctxt, backup_id)
+        parent = {'backup_id': parent}
+        self.assertEqual(parent, SwiftBackupDriver(self.ctxt)._record_parent(
+            backup, parent))
+        return backup
+
+    def test_delete_keeps_objects_of_creating_backup_parent(self):
+        self._backup('backup-1', self.data)
+        parent = self._backup('backup-2', self._changed_data())
+        self._start_backup('backup-3', 'backup-2')
+
+        SwiftBackupDriver(self.ctxt).delete(
+            db.backup_get(self.ctxt, 'backup-1'))
+
+        # The objects of backup-1 listed by backup-2 are kept for backup-3
+        self.assertEqual(self._changed_data(), self._restore(parent))
+
+    def test_delete_parent_of_creating_backup(self):
+        parent = self._backup('backup-1', self.data)
+        self._start_backup('backup-2', 'backup-1')
+        objects = dict(self.store.objects)
+
+        self.assertRaises(exception.InvalidBackup,
+                          SwiftBackupDriver(self.ctxt).delete, parent)
+        self.assertEqual(objects, self.store.objects)
+
+    def test_backup_parent_being_deleted(self):
+        self._backup('backup-1', self.data)
+        db.backup_update(self.ctxt, 'backup-1', {'status': 'deleting'})
+        real_backup_get = db.backup_get
+        calls = []
+
+        def backup_get(context, backup_id):
+            # The parent starts being deleted after it was chosen
+            calls.append(backup_id)
+            return real_backup_get(context, backup_id)
+
+        self.stubs.Set(db, 'backup_get', backup_get)
+        self.stubs.Set(SwiftBackupDriver, '_get_parent',
+                       lambda *args: self._metadata(
+                           real_backup_get(self.ctxt, 'backup-1')))
+        backup = self._backup('backup-2', self._changed_data())
+
+        self.assertIn('backup-1', calls)
+        self.assertIsNone(self._metadata(backup)['parent_id'])
+        self.assertIsNone(backup['checkpoint'])
+
+    def test_backup_sparse(self):
+        chunk = self.chunk_size
+        data = self.data[:chunk] + '\0' * 2 * chunk + self.data[3 * chunk:]
+
+        backup = self._backup('backup-1', data)
+
+        # The zero chunks aren't uploaded
+        prefix = backup['service_metadata']
+        self.assertEqual(['%s-00001' % prefix, '%s-00004' % prefix,
+                          '%s_metadata' % prefix], self.store.puts)
+        holes = [obj.values()[0].get('hole', False)
+                 for obj in self._metadata(backup)['objects']]
+        self.assertEqual([False, True, True, False], holes)
+
+        # Holes are zeroed on restore
+        with tempfile.NamedTemporaryFile() as volume_file:
+            volume_file.write('x' * len(data))
+            volume_file.seek(0)
+            SwiftBackupDriver(self.ctxt).restore(
+                backup, '1234-5678-1234-8888', volume_file)
+            volume_file.seek(0)
+            self.assertEqual(data, volume_file.read())
+
+    def test_restore_sparse_trailing_hole(self):
+        data = self.data[:self.chunk_size] + '\0' * self.chunk_size
+        backup = self._backup('backup-1', data)
+
+        self.assertEqual(data, self._restore(backup))
+
+    def test_restore_sparse_writes_zeros(self):
+        data = self.data[:self.chunk_size] + '\0' * self.chunk_size
+        backup = self._backup('backup-1', data)
+
+        with mock.patch.object(blockcopy, 'zero_range', return_value=False):
+            self.assertEqual(data, self._restore(backup))
+
+    def test_delete_sparse(self):
+        data = '\0' * self.chunk_size + self.data[self.chunk_size:]
+        backup = self._backup('backup-1', data)
+
+        SwiftBackupDriver(self.ctxt).delete(backup)
+
+        self.assertEqual({}, self.store.objects)
+
+
+class BackupSwiftCheckpointTestCase(test.TestCase):
+    """Test Case for resuming swift backups and restores."""
+
+    chunk_size = 8 * 1024
+
+    def setUp(self):
+        super(BackupSwiftCheckpointTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.store = FakeSwiftStore()
+        self.stubs.Set(swift, 'Connection', self.store.Connection)
+        self.stubs.Set(hashlib, 'md5', fake_md5)
+        self.flags(backup_swift_object_size=self.chunk_size,
+                   backup_swift_pipeline_depth=1)
+        # Save a checkpoint after every object
+        patcher = mock.patch.object(driver.CheckpointTimer, 'due',
+                                    return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        db.volume_create(self.ctxt, {'id': '1234-5678-1234-8888',
+                                     'size': 1,
+                                     'status': 'available'})
+        db.backup_create(self.ctxt, {'id': 'backup-1',
+                                     'size': 1,
+                                     'container': 'test-container',
+                                     'project_id': 'fake-project',
+                                     'volume_id': '1234-5678-1234-8888',
+                                     'status': 'creating'})
+        self.data = os.urandom(4 * self.chunk_size)
+
+    def _backup_file(self, data):
+        volume_file = tempfile.NamedTemporaryFile()
+        self.addCleanup(volume_file.close)
+        volume_file.write(data)
+        volume_file.seek(0)
+        return volume_file
+
+    def _interrupted_backup(self):
+        """Fail a backup at its third object."""
+        put_object = self.store.put_object
+
+        def fake_put_object(container, name, reader, **kwargs):
+            if name.endswith('-00003'):
+                raise socket.error(errno.ECONNRESET, 'reset')
+            return put_object(container, name, reader, **kwargs)
+
+        backup = db.backup_get(self.ctxt, 'backup-1')
+        with mock.patch.object(self.store, 'put_object',
+                               side_effect=fake_put_object):
+            self.assertRaises(exception.SwiftConnectionFailed,
+                              SwiftBackupDriver(self.ctxt).backup,
+                              backup, self._backup_file(self.data))
+        return db.backup_get(self.ctxt, 'backup-1')
+
+    def test_backup_checkpoint(self):
+        backup = self._interrupted_backup()
+
+        checkpoint = SwiftBackupDriver(self.ctxt).get_checkpoint(backup)
+        self.assertEqual('backup', checkpoint['operation'])
+        self.assertEqual(2 * self.chunk_size, checkpoint['offset'])
+        # Only the latest checkpoint object is kept
+        prefix = backup['service_metadata']
+        self.assertEqual(['%s-00001' % prefix, '%s-00002' % prefix,
+                          '%s_checkpoint-00002' % prefix],
+                         [name for (c, name) in sorted(self.store.objects)])
+
+    def test_backup_resume(self):
+        backup = self._interrupted_backup()
+        self.store.puts = []
+
+        SwiftBackupDriver(self.ctxt).backup(backup,
+                                            self._backup_file(self.data))
+
+        # The objects uploaded before the checkpoint aren't uploaded again
+        prefix = backup['service_metadata']
+        self.assertEqual(['%s-00003' % prefix, '%s-00004' % prefix],
+                         [name for name in self.store.puts
+                          if '_' not in name[len(prefix):]])
+        backup = db.backup_get(self.ctxt, 'backup-1')
+        self.assertIsNone(backup['checkpoint'])
+        self.assertEqual([], [name for (c, name) in self.store.objects
+                              if '_checkpoint-' in name])
+        db.backup_update(self.ctxt, 'backup-1', {'status': 'restoring'})
+        with tempfile.NamedTemporaryFile() as volume_file:
+            SwiftBackupDriver(self.ctxt).restore(
+                backup, '1234-5678-1234-8888', volume_file)
+            volume_file.seek(0)
+            self.assertEqual(self.data, volume_file.read())
+
+    def _interrupted_restore(self):
+        with mock.patch.object(driver.CheckpointTimer, 'due',
+                               return_value=False):
+            SwiftBackupDriver(self.ctxt).backup(
+                db.backup_get(self.ctxt, 'backup-1'),
+                self._backup_file(self.data))
+        backup = db.backup_get(self.ctxt, 'backup-1')
+        SwiftBackupDriver(self.ctxt).save_checkpoint(
+            backup, {'operation': 'restore',
+                     'volume_id': '1234-5678-1234-8888',
+                     'index': 2,
+                     'offset': 2 * self.chunk_size})
+        return backup
+
+    def test_restore_resume(self):
+        backup = self._interrupted_restore()
+        service = SwiftBackupDriver(self.ctxt)
+
+        volume_file = self._backup_file('x' * len(self.data))
+        with mock.patch.object(service, '_is_block_device',
+                               return_value=True):
+            service.restore(backup, '1234-5678-1234-8888', volume_file)
+
+        # The restore continued after the objects written before
+        volume_file.seek(0)
+        self.assertEqual('x' * 2 * self.chunk_size +
+                         self.data[2 * self.chunk_size:], volume_file.read())
+        backup = db.backup_get(self.ctxt, 'backup-1')
+        self.assertIsNone(backup['checkpoint'])
+
+    def test_restore_resume_regular_file(self):
+        backup = self._interrupted_restore()
+
+        # Volume drivers truncate file backed volumes opening them with 'wb'
+        with tempfile.NamedTemporaryFile() as volume_file:
+            SwiftBackupDriver(self.ctxt).restore(
+                backup, '1234-5678-1234-8888', volume_file)
+            volume_file.seek(0)
+            self.assertEqual(self.data[:2 * self.chunk_size],
+                             volume_file.read(2 * self.chunk_size))
+            volume_file.seek(0)
+            self.assertEqual(self.data, volume_file.read())
+
+    def test_can_resume(self):
+        backup = self._interrupted_backup()
+        service = SwiftBackupDriver(self.ctxt)
+
+        self.flags(backup_swift_auth='per_user')
+        self.assertFalse(service.can_resume(backup))
+        self.flags(backup_swift_auth='single_user')
+        self.assertTrue(service.can_resume(backup))
+        service.save_checkpoint(backup, None)
+        self.assertFalse(service.can_resume(backup))
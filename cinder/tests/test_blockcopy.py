@@ -0,0 +1,270 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the in-process volume copy."""
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from cinder import test
+from cinder.volume import blockcopy
+from cinder.volume import utils as volume_utils
+
+CHUNK = 64 * 1024
+
+
+class VolumeCopyTestCase(test.TestCase):
+
+    def setUp(self):
+        super(VolumeCopyTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.src = os.path.join(self.tmpdir, 'src')
+        self.dst = os.path.join(self.tmpdir, 'dst')
+        # Data, then zeros, then data
+        self.data = ('a' * CHUNK + '\0' * 4 * CHUNK + 'b' * CHUNK)
+        self._write(self.src, self.data)
+
+    def _write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _copy(self, src=None, size=None, **kwargs):
+        copy = blockcopy.VolumeCopy(src or self.src, self.dst,
+                                    size or len(self.data),
+                                    chunk_size=CHUNK, **kwargs)
+        return copy, copy.run()
+
+    def test_copy(self):
+        self._write(self.dst, 'x' * len(self.data))
+
+        copy, copied = self._copy(workers=3)
+
+        self.assertEqual(len(self.data), copied)
+        self.assertEqual(4 * CHUNK, copy.skipped)
+        self.assertEqual(self.data, self._read(self.dst))
+
+    def test_copy_new_file(self):
+        copy, copied = self._copy()
+
+        self.assertEqual(self.data, self._read(self.dst))
+
+    def test_copy_dst_zeroed(self):
+        with mock.patch.object(blockcopy._Worker, '_zero') as zero:
+            self._copy(dst_zeroed=True)
+
+        self.assertFalse(zero.called)
+        self.assertEqual(self.data, self._read(self.dst))
+
+    def test_copy_zeros_written_without_hole_punching(self):
+        self._write(self.dst, 'x' * len(self.data))
+
+        with mock.patch.object(blockcopy, '_fallocate',
+                               side_effect=OSError()):
+            self._copy()
+
+        self.assertEqual(self.data, self._read(self.dst))
+
+    def test_copy_trailing_zeros_extend_file(self):
+        self._write(self.src, 'a' * CHUNK + '\0' * CHUNK)
+
+        self._copy(size=2 * CHUNK)
+
+        self.assertEqual(2 * CHUNK, os.path.getsize(self.dst))
+
+    def test_copy_stops_at_end_of_source(self):
+        copy, copied = self._copy(size=100 * len(self.data))
+
+        self.assertEqual(len(self.data), copied)
+        self.assertEqual(self.data, self._read(self.dst))
+
+    def test_copy_unaligned_source(self):
+        self._write(self.src, 'a' * (CHUNK + 100))
+
+        copy, copied = self._copy(size=2 * CHUNK)
+
+        self.assertEqual(CHUNK + 100, copied)
+        self.assertEqual('a' * (CHUNK + 100), self._read(self.dst))
+
+    def test_clear(self):
+        self._write(self.dst, 'x' * len(self.data))
+
+        copy, copied = self._copy(src=blockcopy.ZERO_SOURCE, sync=True)
+
+        self.assertEqual(len(self.data), copy.skipped)
+        self.assertEqual('\0' * len(self.data), self._read(self.dst))
+
+    def test_scrub(self):
+        self._write(self.dst, self.data)
+
+        with mock.patch.object(blockcopy._Worker, '_zero',
+                               return_value=0) as zero:
+            copy, copied = self._copy(src=blockcopy.ZERO_SOURCE,
+                                      scrub=True)
+
+        # Only the chunks with data are zeroed
+        self.assertEqual([mock.call(0, CHUNK), mock.call(5 * CHUNK, CHUNK)],
+                         sorted(zero.call_args_list))
+        self.assertEqual(len(self.data), copied)
+        self.assertEqual(4 * CHUNK, copy.skipped)
+
+    def test_scrub_zeroes_data(self):
+        self._write(self.dst, self.data)
+
+        copy, copied = self._copy(src=blockcopy.ZERO_SOURCE, scrub=True)
+
+        self.assertEqual('\0' * len(self.data), self._read(self.dst))
+
+    def test_scrub_written(self):
+        self._write(self.dst, self.data)
+
+        with mock.patch.object(blockcopy, '_fallocate',
+                               side_effect=OSError()):
+            copy, copied = self._copy(src=blockcopy.ZERO_SOURCE, scrub=True)
+
+        self.assertEqual(2 * CHUNK, copy.written)
+        self.assertEqual('\0' * len(self.data), self._read(self.dst))
+
+    def test_scrub_needs_zero_source(self):
+        self._write(self.dst, 'x' * len(self.data))
+
+        copy, copied = self._copy(scrub=True)
+
+        self.assertFalse(copy.scrub)
+        self.assertEqual(self.data, self._read(self.dst))
+
+    def test_copy_error(self):
+        with mock.patch.object(blockcopy._Worker, 'copy_extent',
+                               side_effect=IOError()):
+            self.assertRaises(IOError, self._copy)
+
+    @mock.patch.object(blockcopy.tpool, 'execute',
+                       side_effect=lambda func, *args: func(*args))
+    def test_copy_error_stops_workers(self, _execute):
+        with mock.patch.object(blockcopy._Worker, 'copy_extent',
+                               side_effect=IOError()) as copy_extent:
+            self.assertRaises(IOError, self._copy, workers=2)
+
+        self.assertEqual(1, copy_extent.call_count)
+
+    def test_copy_bps_limit(self):
+        with mock.patch.object(blockcopy.TokenBucket,
+                               'consume') as consume:
+            self._copy(bps_limit=CHUNK)
+
+        self.assertEqual(6, consume.call_count)
+        consume.assert_called_with(CHUNK)
+
+
+class TokenBucketTestCase(test.TestCase):
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time', return_value=100.0)
+    def test_consume(self, _time, sleep):
+        bucket = blockcopy.TokenBucket(1000)
+
+        bucket.consume(1000)
+        self.assertFalse(sleep.called)
+
+        bucket.consume(500)
+        sleep.assert_called_once_with(0.5)
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time')
+    def test_consume_refill(self, _time, sleep):
+        _time.return_value = 100.0
+        bucket = blockcopy.TokenBucket(1000)
+        bucket.consume(1000)
+
+        _time.return_value = 101.0
+        bucket.consume(1000)
+
+        self.assertFalse(sleep.called)
+
+
+class SupportsODirectTestCase(test.TestCase):
+
+    def test_supports_odirect_cached(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        self.stubs.Set(blockcopy, '_odirect_support', {})
+
+        with mock.patch.object(os, 'open',
+                               side_effect=OSError(22, 'EINVAL')) as os_open:
+            self.assertFalse(blockcopy.supports_odirect(path, os.O_RDONLY))
+            self.assertFalse(blockcopy.supports_odirect(path, os.O_RDONLY))
+
+        self.assertEqual(1, os_open.call_count)
+
+
+class ZeroRangeTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ZeroRangeTestCase, self).setUp()
+        self.file = tempfile.TemporaryFile()
+        self.addCleanup(self.file.close)
+        self.file.write('a' * 3 * CHUNK)
+        self.file.flush()
+
+    def test_zero_range_file(self):
+        self.assertTrue(blockcopy.zero_range(self.file.fileno(), CHUNK,
+                                             CHUNK))
+
+        self.file.seek(0)
+        self.assertEqual('a' * CHUNK + '\0' * CHUNK + 'a' * CHUNK,
+                         self.file.read())
+
+    def test_zero_range_unsupported(self):
+        with mock.patch.object(blockcopy, '_fallocate',
+                               side_effect=OSError()):
+            self.assertFalse(blockcopy.zero_range(self.file.fileno(), CHUNK,
+                                                  CHUNK))
+
+
+class CopyVolumeNativeTestCase(test.TestCase):
+
+    @mock.patch.object(blockcopy, 'VolumeCopy')
+    def test_copy_volume(self, volume_copy):
+        self.flags(volume_copy_engine='native', volume_copy_bps_limit=100,
+                   volume_copy_workers=2)
+
+        volume_utils.copy_volume('/dev/zero', '/tmp/dst', 10, '4M',
+                                 sync=True, sparse=True)
+
+        volume_copy.assert_called_once_with('/dev/zero', '/tmp/dst',
+                                            10 * 1024 * 1024,
+                                            chunk_size=4 * 1024 * 1024,
+                                            workers=2, bps_limit=100,
+                                            sync=True, dst_zeroed=True,
+                                            scrub=False)
+        volume_copy.return_value.run.assert_called_once_with()
+
+    @mock.patch.object(blockcopy, 'VolumeCopy')
+    def test_copy_volume_ionice(self, volume_copy):
+        self.flags(volume_copy_engine='native')
+        execute = mock.Mock()
+
+        volume_utils.copy_volume('/dev/zero', '/tmp/dst', 10, '1M',
+                                 execute=execute, ionice='-c3')
+
+        self.assertFalse(volume_copy.called)
+        self.assertTrue(execute.called)
@@ -16,11 +16,16 @@
 
 import datetime
 
+import mock
 from oslo.config import cfg
+import sqlalchemy
 
 from cinder import context
 from cinder import db
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
 from cinder import exception
+from cinder.openstack.common.db import exception as db_exc
 from cinder.openstack.common import uuidutils
 from cinder.quota import ReservableResource
 from cinder import test
@@ -47,14 +52,13 @@ def _quota_reserve(context, project_id):
     deltas = {}
     for i, resource in enumerate(('volumes', 'gigabytes')):
         quotas[resource] = db.quota_create(context, project_id,
-                                           resource, i + 1)
+                                           resource, i + 1).hard_limit
         resources[resource] = ReservableResource(resource,
                                                  '_sync_%s' % resource)
         deltas[resource] = i + 1
     return db.quota_reserve(
         context, resources, quotas, deltas,
-        datetime.datetime.utcnow(), datetime.datetime.utcnow(),
-        datetime.timedelta(days=1), project_id
+        datetime.datetime.utcnow(), 0, 0, project_id
     )
 
 
@@ -370,6 +374,42 @@ class DBAPIVolumeTestCase(BaseTest):
         self._assertEqualListsOfObjects(volumes[2:], db.volume_get_all(
                                         self.ctxt, 2, 2, 'id', None))
 
+    def test_volume_get_all_columns(self):
+        volumes = [db.volume_create(self.ctxt,
+                                    {'display_name': 'vol%d' % i,
+                                     'metadata': {'key': 'value'}})
+                   for i in xrange(3)]
+        result = db.volume_get_all(self.ctxt, None, None, 'display_name',
+                                   'asc', columns=('id', 'display_name'))
+        self.assertEqual([{'id': volume['id'],
+                           'display_name': volume['display_name']}
+                          for volume in volumes], result)
+
+    def test_volume_get_all_by_project_columns(self):
+        volume = db.volume_create(self.ctxt, {'project_id': 'p1',
+                                              'display_name': 'vol1'})
+        db.volume_create(self.ctxt, {'project_id': 'p2'})
+        result = db.volume_get_all_by_project(self.ctxt, 'p1', None, None,
+                                              'created_at', 'asc',
+                                              filters={'display_name':
+                                                       'vol1'},
+                                              columns=('id',))
+        self.assertEqual([{'id': volume['id']}], result)
+
+    def test_volume_get_all_by_project_loads_metadata(self):
+        db.volume_create(self.ctxt, {'project_id': 'p1',
+                                     'metadata': {'m1': 'v1'},
+                                     'admin_metadata': {'a1': 'v2'}})
+        volumes = db.volume_get_all_by_project(self.ctxt, 'p1', None, None,
+                                               'created_at', 'asc')
+        self.assertEqual(1, len(volumes))
+        self.assertEqual({'m1': 'v1'},
+                         dict((item['key'], item['value']) for item in
+                              volumes[0]['volume_metadata']))
+        self.assertEqual({'a1': 'v2'},
+                         dict((item['key'], item['value']) for item in
+                              volumes[0]['volume_admin_metadata']))
+
     def test_volume_get_all_by_host(self):
         volumes = []
         for i in xrange(3):
@@ -656,6 +696,17 @@ class DBAPIVolumeTestCase(BaseTest):
         self.assertRaises(exception.ISCSITargetNotFoundForVolume,
                           db.volume_get_iscsi_target_num, self.ctxt, 42)
 
+    def test_volume_count_get_all_by_host(self):
+        for host in ('h1', 'h1', 'h2', 'h3'):
+            db.volume_create(self.ctxt, {'host': host})
+        deleted = db.volume_create(self.ctxt, {'host': 'h2'})
+        db.volume_destroy(self.ctxt, deleted['id'])
+
+        self.assertEqual({'h1': 2, 'h2': 1},
+                         db.volume_count_get_all_by_host(
+                             self.ctxt, ['h1', 'h2', 'h4']))
+        self.assertEqual({}, db.volume_count_get_all_by_host(self.ctxt, []))
+
     def test_volume_update(self):
         volume = db.volume_create(self.ctxt, {'host': 'h1'})
         db.volume_update(self.ctxt, volume['id'],
@@ -667,6 +718,23 @@ class DBAPIVolumeTestCase(BaseTest):
         self.assertRaises(exception.VolumeNotFound, db.volume_update,
                           self.ctxt, 42, {})
 
+    def test_volume_update_hosts(self):
+        volumes = [db.volume_create(self.ctxt, {'host': 'h1'})
+                   for i in xrange(3)]
+        volume_hosts = {volumes[0]['id']: 'h2',
+                        volumes[1]['id']: 'h2',
+                        volumes[2]['id']: 'h3',
+                        'nonexistent': 'h3'}
+        now = datetime.datetime(2014, 1, 1)
+        updated = db.volume_update_hosts(self.ctxt, volume_hosts,
+                                         {'scheduled_at': now})
+
+        self.assertEqual(3, len(updated))
+        for volume in volumes:
+            volume = db.volume_get(self.ctxt, volume['id'])
+            self.assertEqual(volume_hosts[volume['id']], volume['host'])
+            self.assertEqual(now, volume['scheduled_at'])
+
     def test_volume_metadata_get(self):
         metadata = {'a': 'b', 'c': 'd'}
         db.volume_create(self.ctxt, {'id': 1, 'metadata': metadata})
@@ -701,6 +769,59 @@ class DBAPIVolumeTestCase(BaseTest):
         self.assertEqual(metadata, db.volume_metadata_get(self.ctxt, 1))
 
 
+class DBAPIVolumeListQueryTestCase(BaseTest):
+    """Shape of the queries listing the volumes of a project."""
+
+    def setUp(self):
+        super(DBAPIVolumeListQueryTestCase, self).setUp()
+        for i in xrange(3):
+            db.volume_create(self.ctxt, {'project_id': 'project',
+                                         'display_name': 'vol%d' % i,
+                                         'metadata': {'k1': 'v', 'k2': 'v',
+                                                      'k3': 'v'}})
+        self.statements = []
+        engine = sqlalchemy_api.get_engine()
+        sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                                self._record)
+        self.addCleanup(sqlalchemy.event.remove, engine,
+                        'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(' '.join(statement.split()))
+
+    def _list(self, columns=None):
+        return db.volume_get_all_by_project(self.ctxt, 'project', None, None,
+                                            'created_at', 'desc',
+                                            columns=columns)
+
+    def test_volume_list_columns(self):
+        volumes = self._list(columns=('id', 'display_name'))
+
+        self.assertEqual(3, len(volumes))
+        self.assertEqual(1, len(self.statements))
+        statement = self.statements[0]
+        select = statement[:statement.index(' FROM ')]
+        self.assertIn('volumes.id', select)
+        self.assertIn('volumes.display_name', select)
+        self.assertNotIn('volumes.size', select)
+        self.assertNotIn('volume_metadata', statement)
+
+    def test_volume_list_detail(self):
+        volumes = self._list()
+
+        self.assertEqual(3, len(volumes))
+        self.assertEqual(3, len(volumes[0]['volume_metadata']))
+        # The metadata isn't joined into the query of the volumes, which
+        # would multiply its rows, but loaded by another one
+        volume_query = [statement for statement in self.statements
+                        if statement.startswith('SELECT volumes.')]
+        self.assertEqual(1, len(volume_query))
+        self.assertNotIn('volume_metadata', volume_query[0])
+        self.assertTrue(any(statement.startswith('SELECT volume_metadata.')
+                            for statement in self.statements))
+
+
 class DBAPISnapshotTestCase(BaseTest):
 
     """Tests for cinder.db.api.snapshot_*."""
@@ -724,6 +845,68 @@ class DBAPISnapshotTestCase(BaseTest):
                                         db.snapshot_get_all(self.ctxt),
                                         ignored_keys=['metadata', 'volume'])
 
+    def test_snapshot_get_all_paginate(self):
+        db.volume_create(self.ctxt, {'id': 1})
+        snapshots = [db.snapshot_create(self.ctxt,
+                                        {'id': i, 'volume_id': 1,
+                                         'status': 'available'})
+                     for i in range(1, 6)]
+        ignored_keys = ['metadata', 'volume']
+
+        page = db.snapshot_get_all(self.ctxt, limit=2, sort_key='id',
+                                   sort_dir='asc')
+        self._assertEqualListsOfObjects(snapshots[:2], page,
+                                        ignored_keys=ignored_keys)
+        page = db.snapshot_get_all(self.ctxt, marker=page[-1]['id'],
+                                   limit=2, sort_key='id', sort_dir='asc')
+        self._assertEqualListsOfObjects(snapshots[2:4], page,
+                                        ignored_keys=ignored_keys)
+        page = db.snapshot_get_all(self.ctxt, limit=2, sort_key='id',
+                                   sort_dir='desc', offset=1)
+        self._assertEqualListsOfObjects(snapshots[2:4], page,
+                                        ignored_keys=ignored_keys)
+
+    def test_snapshot_get_all_filters(self):
+        db.volume_create(self.ctxt, {'id': 1})
+        db.volume_create(self.ctxt, {'id': 2})
+        snapshot1 = db.snapshot_create(self.ctxt, {'id': 1, 'volume_id': 1,
+                                                   'status': 'available'})
+        snapshot2 = db.snapshot_create(self.ctxt, {'id': 2, 'volume_id': 2,
+                                                   'status': 'creating'})
+        ignored_keys = ['metadata', 'volume']
+
+        self._assertEqualListsOfObjects(
+            [snapshot2],
+            db.snapshot_get_all(self.ctxt, filters={'status': 'creating'}),
+            ignored_keys=ignored_keys)
+        self._assertEqualListsOfObjects(
+            [snapshot1, snapshot2],
+            db.snapshot_get_all(self.ctxt, filters={'volume_id': [1, 2]}),
+            ignored_keys=ignored_keys)
+        # Unknown columns and relationships do not match anything
+        self.assertEqual([], db.snapshot_get_all(self.ctxt,
+                                                 filters={'foo': 'bar'}))
+        self.assertEqual([], db.snapshot_get_all(self.ctxt,
+                                                 filters={'volume': 1}))
+
+    def test_snapshot_get_all_by_project_paginate(self):
+        db.volume_create(self.ctxt, {'id': 1})
+        snapshots = [db.snapshot_create(self.ctxt,
+                                        {'id': i, 'volume_id': 1,
+                                         'project_id': 'project%d' % (i % 2)})
+                     for i in range(1, 6)]
+
+        page = db.snapshot_get_all_by_project(self.ctxt, 'project1',
+                                              limit=2, sort_key='id',
+                                              sort_dir='asc')
+        self._assertEqualListsOfObjects([snapshots[0], snapshots[2]], page,
+                                        ignored_keys=['metadata', 'volume'])
+        page = db.snapshot_get_all_by_project(self.ctxt, 'project1',
+                                              marker=page[-1]['id'],
+                                              sort_key='id', sort_dir='asc')
+        self._assertEqualListsOfObjects([snapshots[4]], page,
+                                        ignored_keys=['metadata', 'volume'])
+
     def test_snapshot_metadata_get(self):
         metadata = {'a': 'b', 'c': 'd'}
         db.volume_create(self.ctxt, {'id': 1})
@@ -787,6 +970,44 @@ class DBAPIVolumeTypeTestCase(BaseTest):
                           self.ctxt,
                           {'name': 'n2', 'id': vt['id']})
 
+    def test_volume_type_generation_get(self):
+        self.assertEqual(0, db.volume_type_generation_get(self.ctxt))
+        vt = db.volume_type_create(self.ctxt, {'name': 'n1'})
+        self.assertEqual(1, db.volume_type_generation_get(self.ctxt))
+        self.assertRaises(exception.VolumeTypeExists,
+                          db.volume_type_create,
+                          self.ctxt,
+                          {'name': 'n1'})
+        self.assertEqual(1, db.volume_type_generation_get(self.ctxt))
+        db.volume_type_destroy(self.ctxt, vt['id'])
+        self.assertEqual(2, db.volume_type_generation_get(self.ctxt))
+
+    def test_volume_type_create_seeds_generation(self):
+        session = sqlalchemy_api.get_session()
+        session.execute(models.ResourceGeneration.__table__.delete())
+
+        db.volume_type_create(self.ctxt, {'name': 'n1'})
+        self.assertEqual(1, db.volume_type_generation_get(self.ctxt))
+
+    def test_resource_generation_ensure_insert_race(self):
+        session = sqlalchemy_api.get_session()
+        table = models.ResourceGeneration.__table__
+        session.execute(table.delete())
+        real_save = models.ResourceGeneration.save
+
+        def save(self, session):
+            # Another process inserts the missing row after it was found
+            # missing
+            sqlalchemy_api.get_session().execute(
+                table.insert(), {'resource': 'volume_types',
+                                 'generation': 5, 'deleted': False})
+            real_save(self, session)
+
+        with mock.patch.object(models.ResourceGeneration, 'save', save):
+            db.volume_type_create(self.ctxt, {'name': 'n1'})
+
+        self.assertEqual(6, db.volume_type_generation_get(self.ctxt))
+
 
 class DBAPIEncryptionTestCase(BaseTest):
 
@@ -944,6 +1165,43 @@ class DBAPIReservationTestCase(BaseTest):
                              self.ctxt,
                              'project1'))
 
+    def test_quota_reserve_over_quota(self):
+        _quota_reserve(self.ctxt, 'project1')
+        self.assertRaises(exception.OverQuota,
+                          _quota_reserve, self.ctxt, 'project1')
+        expected = {'project_id': 'project1',
+                    'volumes': {'reserved': 1, 'in_use': 0},
+                    'gigabytes': {'reserved': 2, 'in_use': 0},
+                    }
+        self.assertEqual(expected,
+                         db.quota_usage_get_all_by_project(
+                             self.ctxt,
+                             'project1'))
+
+    def test_quota_reserve_retry_on_deadlock(self):
+        real_reserve = sqlalchemy_api._quota_usage_reserve
+        calls = []
+
+        def fake_reserve(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise db_exc.DBDeadlock()
+            return real_reserve(*args, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, '_quota_usage_reserve', fake_reserve)
+        self.stubs.Set(sqlalchemy_api.time, 'sleep', lambda interval: None)
+        reservations = _quota_reserve(self.ctxt, 'project1')
+
+        self.assertEqual(2, len(reservations))
+        expected = {'project_id': 'project1',
+                    'volumes': {'reserved': 1, 'in_use': 0},
+                    'gigabytes': {'reserved': 2, 'in_use': 0},
+                    }
+        self.assertEqual(expected,
+                         db.quota_usage_get_all_by_project(
+                             self.ctxt,
+                             'project1'))
+
     def test_reservation_expire(self):
         self.values['expire'] = datetime.datetime.utcnow() + \
             datetime.timedelta(days=1)
@@ -1062,6 +1320,19 @@ class DBAPIQuotaTestCase(BaseTest):
                           'volumes': {'reserved': 1, 'in_use': 0}},
                          quota_usage)
 
+    def test_get_quota_usages_lock_rereads(self):
+        reservations = _quota_reserve(self.ctxt, 'project1')
+        session = sqlalchemy_api.get_session()
+        usages = sqlalchemy_api._get_quota_usages(self.ctxt, session,
+                                                  'project1', lock=False)
+        self.assertEqual(1, usages['volumes'].reserved)
+        # The usages change while the rows aren't locked
+        db.reservation_rollback(self.ctxt, reservations, 'project1')
+
+        usages = sqlalchemy_api._get_quota_usages(self.ctxt, session,
+                                                  'project1')
+        self.assertEqual(0, usages['volumes'].reserved)
+
     def test_quota_destroy(self):
         db.quota_create(self.ctxt, 'project1', 'resource1', 41)
         self.assertIsNone(db.quota_destroy(self.ctxt, 'project1',
@@ -1157,7 +1428,8 @@ class DBAPIBackupTestCase(BaseTest):
             'service_metadata': 'metadata',
             'service': 'service',
             'size': 1000,
-            'object_count': 100}
+            'object_count': 100,
+            'checkpoint': 'checkpoint'}
         if one:
             return base_values
 
@@ -1197,6 +1469,21 @@ class DBAPIBackupTestCase(BaseTest):
         filtered_backups = db.backup_get_all(self.ctxt, filters=filters)
         self._assertEqualListsOfObjects([self.created[1]], filtered_backups)
 
+    def tests_backup_get_all_paginate(self):
+        ordered = sorted(self.created, key=lambda backup: backup['id'])
+        page = db.backup_get_all(self.ctxt, limit=2, sort_key='id')
+        self._assertEqualListsOfObjects(ordered[:2], page)
+        page = db.backup_get_all(self.ctxt, marker=page[-1]['id'],
+                                 sort_key='id')
+        self._assertEqualListsOfObjects(ordered[2:], page)
+        page = db.backup_get_all(self.ctxt, sort_key='id', sort_dir='desc',
+                                 offset=1, limit=1)
+        self._assertEqualListsOfObjects([ordered[1]], page)
+
+    def tests_backup_get_all_by_invalid_filter(self):
+        self.assertEqual([], db.backup_get_all(self.ctxt,
+                                               filters={'foo': 'bar'}))
+
     def test_backup_get_all_by_host(self):
         byhost = db.backup_get_all_by_host(self.ctxt,
                                            self.created[1]['host'])
@@ -16,13 +16,18 @@
 """Unit tests for image utils."""
 
 import contextlib
-import mox
+import os
+import shutil
 import tempfile
 
+import mock
+import mox
+
 from oslo.config import cfg
 
 from cinder import context
 from cinder import exception
+from cinder.image import cache as image_cache
 from cinder.image import image_utils
 from cinder.openstack.common import processutils
 from cinder.openstack.common import units
@@ -497,6 +502,218 @@ class TestUtils(test.TestCase):
         m.VerifyAll()
 
 
+class TestFetchToVolumeFormatCached(test.TestCase):
+    TEST_IMAGE_ID = 321
+    TEST_DEV_PATH = "/dev/ether/fake_dev"
+
+    def setUp(self):
+        super(TestFetchToVolumeFormatCached, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.cache = image_cache.ImageCache(self.cache_dir, units.Gi)
+        self.image_service = FakeImageService()
+        self.image_meta = dict(self.image_service.show(None, None),
+                               checksum='abc')
+
+    def _qemu_img_info(self, path):
+        # Cached files hold the name of their format
+        fmt = 'raw'
+        if os.path.exists(path):
+            with open(path) as f:
+                fmt = f.read()
+        return mock.Mock(file_format=fmt, backing_file=None,
+                         virtual_size=units.Gi)
+
+    def _fetch(self, context, image_service, image_id, path, *args):
+        with open(path, 'w') as f:
+            f.write(self.image_meta['disk_format'])
+
+    def _convert_image(self, source, dest, out_format, bps_limit=None):
+        if dest != self.TEST_DEV_PATH:
+            with open(dest, 'w') as f:
+                f.write(out_format)
+
+    def _fetch_to_raw(self, size=1):
+        with contextlib.nested(
+                mock.patch.object(self.image_service, 'show',
+                                  return_value=self.image_meta),
+                mock.patch.object(image_cache, 'get_cache',
+                                  return_value=self.cache),
+                mock.patch.object(image_utils, 'qemu_img_info',
+                                  side_effect=self._qemu_img_info),
+                mock.patch.object(image_utils, 'fetch',
+                                  side_effect=self._fetch),
+                mock.patch.object(image_utils, 'convert_image',
+                                  side_effect=self._convert_image)
+        ) as (_show, _get_cache, _qemu_img_info, fetch, convert_image):
+            image_utils.fetch_to_raw(None, self.image_service,
+                                     self.TEST_IMAGE_ID, self.TEST_DEV_PATH,
+                                     None, size=size)
+            return fetch, convert_image
+
+    def test_fetch_to_raw_cached(self):
+        fetch, convert_image = self._fetch_to_raw()
+        self.assertEqual(1, fetch.call_count)
+        converted = os.path.join(self.cache_dir, '321-abc.raw')
+        convert_image.assert_any_call(os.path.join(self.cache_dir,
+                                                   '321-abc'),
+                                      mock.ANY, 'raw')
+        convert_image.assert_called_with(converted, self.TEST_DEV_PATH,
+                                         'raw', bps_limit=mock.ANY)
+
+        fetch, convert_image = self._fetch_to_raw()
+        self.assertFalse(fetch.called)
+        convert_image.assert_called_once_with(converted, self.TEST_DEV_PATH,
+                                              'raw', bps_limit=mock.ANY)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+        self.assertEqual(1, self.cache.converted_hits)
+        self.assertEqual(1, self.cache.converted_misses)
+
+    def test_fetch_to_raw_cached_raw_image(self):
+        self.image_meta['disk_format'] = 'raw'
+
+        self._fetch_to_raw()
+        fetch, convert_image = self._fetch_to_raw()
+
+        self.assertFalse(fetch.called)
+        convert_image.assert_called_once_with(
+            os.path.join(self.cache_dir, '321-abc'), self.TEST_DEV_PATH,
+            'raw', bps_limit=mock.ANY)
+        self.assertEqual(['321-abc'], os.listdir(self.cache_dir))
+
+    def test_fetch_to_raw_cached_image_size(self):
+        self._fetch_to_raw()
+        # The cached image is checked against the size of each volume
+        self.assertRaises(exception.ImageUnacceptable,
+                          self._fetch_to_raw, size=0)
+
+
+class TestStreamToVolume(test.TestCase):
+    TEST_IMAGE_ID = 321
+
+    def setUp(self):
+        super(TestStreamToVolume, self).setUp()
+        fd, self.dest = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.dest)
+        self.image_service = FakeImageService()
+        self.image_meta = {'disk_format': 'raw', 'container_format': 'bare',
+                           'size': 1024}
+        self.stubs.Set(self.image_service, 'show',
+                       mock.Mock(return_value=self.image_meta))
+
+    def _set_image_data(self, data):
+        self.image_meta['size'] = len(data)
+        self.image_service._imagedata[self.TEST_IMAGE_ID] = data
+
+    def _read_volume(self):
+        with open(self.dest) as f:
+            return f.read()
+
+    def test_fetch_to_raw_streams_raw_image(self):
+        data = ''.join(chr(i % 256) for i in range(4096))
+        self._set_image_data(data)
+
+        with contextlib.nested(
+                mock.patch.object(image_utils, 'fetch'),
+                mock.patch.object(image_utils, 'convert_image')
+        ) as (fetch, convert_image):
+            image_utils.fetch_to_raw(None, self.image_service,
+                                     self.TEST_IMAGE_ID, self.dest, None,
+                                     size=1)
+
+        self.assertFalse(fetch.called)
+        self.assertFalse(convert_image.called)
+        self.assertEqual(data, self._read_volume())
+
+    def test_stream_to_volume_small_image(self):
+        self._set_image_data('raw')
+
+        image_utils.stream_to_volume(None, self.image_service,
+                                     self.TEST_IMAGE_ID, self.image_meta,
+                                     self.dest)
+
+        self.assertEqual('raw', self._read_volume())
+
+    def test_stream_to_volume_chunks(self):
+        chunks = ['a' * 100, 'b' * 500, 'c' * 1000]
+        self.image_meta['size'] = 1600
+
+        def download(context, image_id, data):
+            for chunk in chunks:
+                data.write(chunk)
+
+        with mock.patch.object(self.image_service, 'download',
+                               side_effect=download):
+            image_utils.stream_to_volume(None, self.image_service,
+                                         self.TEST_IMAGE_ID, self.image_meta,
+                                         self.dest)
+
+        self.assertEqual(''.join(chunks), self._read_volume())
+
+    def test_stream_to_volume_rejects_qcow2(self):
+        self._set_image_data('QFI\xfb' + '\0' * 1020)
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          image_utils.stream_to_volume, None,
+                          self.image_service, self.TEST_IMAGE_ID,
+                          self.image_meta, self.dest)
+        self.assertEqual('', self._read_volume())
+
+    def test_stream_to_volume_rejects_vdi(self):
+        self._set_image_data('\0' * 64 + '\x7f\x10\xda\xbe' + '\0' * 956)
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          image_utils.stream_to_volume, None,
+                          self.image_service, self.TEST_IMAGE_ID,
+                          self.image_meta, self.dest)
+
+    def test_stream_to_volume_size_mismatch(self):
+        self._set_image_data('\0' * 1024)
+        self.image_meta['size'] = 2048
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          image_utils.stream_to_volume, None,
+                          self.image_service, self.TEST_IMAGE_ID,
+                          self.image_meta, self.dest)
+
+    def test_stream_to_volume_image_too_big(self):
+        self.image_meta['size'] = 2 * units.Gi
+
+        with mock.patch.object(self.image_service, 'download') as download:
+            self.assertRaises(exception.ImageUnacceptable,
+                              image_utils.stream_to_volume, None,
+                              self.image_service, self.TEST_IMAGE_ID,
+                              self.image_meta, self.dest, size=1)
+        self.assertFalse(download.called)
+
+    def test_can_stream_to_volume(self):
+        self.assertTrue(image_utils._can_stream_to_volume(self.image_meta,
+                                                          'raw'))
+        self.assertFalse(image_utils._can_stream_to_volume(self.image_meta,
+                                                           'vpc'))
+
+        self.flags(image_stream_raw=False)
+        self.assertFalse(image_utils._can_stream_to_volume(self.image_meta,
+                                                           'raw'))
+
+    def test_can_stream_to_volume_not_raw(self):
+        self.image_meta['disk_format'] = 'qcow2'
+        self.assertFalse(image_utils._can_stream_to_volume(self.image_meta,
+                                                           'raw'))
+
+        self.image_meta.update(disk_format='vhd', container_format='ovf')
+        self.assertFalse(image_utils._can_stream_to_volume(self.image_meta,
+                                                           'raw'))
+
+    def test_can_stream_to_volume_cached(self):
+        self.image_meta['checksum'] = 'abc'
+        with mock.patch.object(image_cache, 'get_cache'):
+            self.assertFalse(image_utils._can_stream_to_volume(
+                self.image_meta, 'raw'))
+
+
 class TestExtractTo(test.TestCase):
     def test_extract_to_calls_tar(self):
         mox = self.mox
@@ -1071,3 +1071,61 @@ class TestMigrations(test.TestCase):
                                         metadata,
                                         autoload=True)
             self.assertNotIn('disabled_reason', services.c)
+
+    def test_migration_023(self):
+        """Test that adding resource_generations table works correctly."""
+        for (key, engine) in self.engines.items():
+            migration_api.version_control(engine,
+                                          TestMigrations.REPOSITORY,
+                                          migration.db_initial_version())
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 22)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 23)
+
+            self.assertTrue(engine.dialect.has_table(engine.connect(),
+                                                     "resource_generations"))
+            resource_generations = sqlalchemy.Table('resource_generations',
+                                                    metadata,
+                                                    autoload=True)
+            self.assertIsInstance(resource_generations.c.resource.type,
+                                  sqlalchemy.types.VARCHAR)
+            self.assertIsInstance(resource_generations.c.generation.type,
+                                  sqlalchemy.types.INTEGER)
+            generation = sqlalchemy.select(
+                [resource_generations.c.generation]).\
+                where(resource_generations.c.resource == 'volume_types').\
+                execute().scalar()
+            self.assertEqual(0, generation)
+
+            migration_api.downgrade(engine, TestMigrations.REPOSITORY, 22)
+
+            self.assertFalse(engine.dialect.has_table(engine.connect(),
+                                                      "resource_generations"))
+
+    def test_migration_024(self):
+        """Test that adding checkpoint column to backups works correctly."""
+        for (key, engine) in self.engines.items():
+            migration_api.version_control(engine,
+                                          TestMigrations.REPOSITORY,
+                                          migration.db_initial_version())
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 23)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 24)
+            backups = sqlalchemy.Table('backups',
+                                       metadata,
+                                       autoload=True)
+            self.assertIsInstance(backups.c.checkpoint.type,
+                                  sqlalchemy.types.TEXT)
+
+            migration_api.downgrade(engine, TestMigrations.REPOSITORY, 23)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            backups = sqlalchemy.Table('backups',
+                                       metadata,
+                                       autoload=True)
+            self.assertNotIn('checkpoint', backups.c)
@@ -17,6 +17,7 @@
 
 import errno
 import os
+import time
 
 import mock
 import mox as mox_lib
@@ -135,6 +136,8 @@ class NfsDriverTestCase(test.TestCase):
         self.configuration.nfs_oversub_ratio = 1.0
         self.configuration.nfs_mount_point_base = self.TEST_MNT_POINT_BASE
         self.configuration.nfs_mount_options = None
+        self.configuration.nfs_capacity_cache_ttl = 30
+        self.configuration.nfs_allocated_rescan_interval = 3600
         self.configuration.volume_dd_blocksize = '1M'
         self._driver = nfs.NfsDriver(configuration=self.configuration)
         self._driver.shares = {}
@@ -414,12 +417,6 @@ class NfsDriverTestCase(test.TestCase):
         drv._get_capacity_info(self.TEST_NFS_EXPORT1).\
             AndReturn((5 * units.Gi, 2 * units.Gi,
                        2 * units.Gi))
-        drv._get_capacity_info(self.TEST_NFS_EXPORT1).\
-            AndReturn((5 * units.Gi, 2 * units.Gi,
-                       2 * units.Gi))
-        drv._get_capacity_info(self.TEST_NFS_EXPORT2).\
-            AndReturn((10 * units.Gi, 3 * units.Gi,
-                       1 * units.Gi))
         drv._get_capacity_info(self.TEST_NFS_EXPORT2).\
             AndReturn((10 * units.Gi, 3 * units.Gi,
                        1 * units.Gi))
@@ -549,6 +546,7 @@ class NfsDriverTestCase(test.TestCase):
 
         volume = DumbVolume()
         volume['name'] = 'volume-123'
+        volume['size'] = self.TEST_SIZE_IN_GB
         volume['provider_location'] = self.TEST_NFS_EXPORT1
 
         mox.StubOutWithMock(drv, 'local_path')
@@ -572,6 +570,7 @@ class NfsDriverTestCase(test.TestCase):
 
         volume = DumbVolume()
         volume['name'] = 'volume-123'
+        volume['size'] = self.TEST_SIZE_IN_GB
         volume['provider_location'] = self.TEST_NFS_EXPORT1
 
         mox.StubOutWithMock(drv, '_ensure_share_mounted')
@@ -732,6 +731,162 @@ class NfsDriverTestCase(test.TestCase):
                         self.assertRaises(exception.ExtendVolumeError,
                                           drv.extend_volume, volume, 2)
 
+    def test_find_share_uses_cached_capacity(self):
+        """_find_share probes each share once within the cache ttl."""
+        drv = self._driver
+        drv._mounted_shares = [self.TEST_NFS_EXPORT1, self.TEST_NFS_EXPORT2]
+        capacities = {self.TEST_NFS_EXPORT1: (5 * units.Gi, 2 * units.Gi,
+                                              2 * units.Gi),
+                      self.TEST_NFS_EXPORT2: (10 * units.Gi, 3 * units.Gi,
+                                              1 * units.Gi)}
+
+        with mock.patch.object(drv, '_get_capacity_info',
+                               side_effect=capacities.get) as get_capacity:
+            self.assertEqual(self.TEST_NFS_EXPORT2,
+                             drv._find_share(self.TEST_SIZE_IN_GB))
+            self.assertEqual(self.TEST_NFS_EXPORT2,
+                             drv._find_share(self.TEST_SIZE_IN_GB))
+            with mock.patch.object(drv, '_ensure_shares_mounted'):
+                drv.get_volume_stats(refresh=True)
+
+        self.assertEqual(2, get_capacity.call_count)
+        self.assertEqual(15.0, drv._stats['total_capacity_gb'])
+
+    def test_find_share_capacity_cache_expired(self):
+        """Shares are probed again once their cached capacity expires."""
+        drv = self._driver
+        drv._mounted_shares = [self.TEST_NFS_EXPORT1]
+        self.configuration.nfs_capacity_cache_ttl = 0
+
+        with mock.patch.object(drv, '_get_capacity_info',
+                               return_value=(5 * units.Gi, 2 * units.Gi,
+                                             2 * units.Gi)) as get_capacity:
+            drv._find_share(self.TEST_SIZE_IN_GB)
+            probes = get_capacity.call_count
+            drv._find_share(self.TEST_SIZE_IN_GB)
+
+        self.assertEqual(2 * probes, get_capacity.call_count)
+
+    def test_create_delete_volume_update_share_capacity(self):
+        """Created and deleted volumes are accounted in the cache."""
+        drv = self._driver
+        self.configuration.nfs_sparsed_volumes = False
+        drv._share_capacity[self.TEST_NFS_EXPORT1] = (
+            time.time(), (10 * units.Gi, 8 * units.Gi, 2 * units.Gi))
+        drv._share_allocated[self.TEST_NFS_EXPORT1] = (time.time(),
+                                                       2 * units.Gi)
+
+        volume = DumbVolume()
+        volume['size'] = 3
+        volume['provider_location'] = None
+        with mock.patch.object(drv, '_ensure_shares_mounted'):
+            with mock.patch.object(drv, '_find_share',
+                                   return_value=self.TEST_NFS_EXPORT1):
+                with mock.patch.object(drv, '_do_create_volume'):
+                    volume['provider_location'] = drv.create_volume(
+                        volume)['provider_location']
+
+        self.assertEqual((10 * units.Gi, 5 * units.Gi, 5 * units.Gi),
+                         drv._get_share_capacity(self.TEST_NFS_EXPORT1))
+        self.assertEqual(5 * units.Gi,
+                         drv._share_allocated[self.TEST_NFS_EXPORT1][1])
+
+        volume['name'] = 'volume-123'
+        with mock.patch.object(drv, '_ensure_share_mounted'):
+            with mock.patch.object(drv, '_execute'):
+                drv.delete_volume(volume)
+
+        self.assertEqual((10 * units.Gi, 8 * units.Gi, 2 * units.Gi),
+                         drv._get_share_capacity(self.TEST_NFS_EXPORT1))
+        self.assertEqual(2 * units.Gi,
+                         drv._share_allocated[self.TEST_NFS_EXPORT1][1])
+
+    def test_create_volume_reserves_share_capacity(self):
+        """Concurrent creates see the space of the volumes being created."""
+        drv = self._driver
+        drv._mounted_shares = [self.TEST_NFS_EXPORT1, self.TEST_NFS_EXPORT2]
+        drv._share_capacity[self.TEST_NFS_EXPORT1] = (
+            time.time(), (10 * units.Gi, 8 * units.Gi, 2 * units.Gi))
+        drv._share_capacity[self.TEST_NFS_EXPORT2] = (
+            time.time(), (10 * units.Gi, 8 * units.Gi, 3 * units.Gi))
+        chosen = []
+
+        def _do_create_volume(volume):
+            chosen.append(volume['provider_location'])
+            if len(chosen) == 1:
+                # The second volume is created while the first one is
+                drv.create_volume(second)
+
+        first = DumbVolume()
+        first['size'] = 2
+        second = DumbVolume()
+        second['size'] = 2
+        with mock.patch.object(drv, '_ensure_shares_mounted'):
+            with mock.patch.object(drv, '_do_create_volume',
+                                   side_effect=_do_create_volume):
+                drv.create_volume(first)
+
+        self.assertEqual([self.TEST_NFS_EXPORT1, self.TEST_NFS_EXPORT2],
+                         chosen)
+
+    def test_create_volume_failure_releases_share_capacity(self):
+        """The space reserved for a volume is given back on failure."""
+        drv = self._driver
+        drv._share_capacity[self.TEST_NFS_EXPORT1] = (
+            time.time(), (10 * units.Gi, 8 * units.Gi, 2 * units.Gi))
+
+        volume = DumbVolume()
+        volume['size'] = 3
+        with mock.patch.object(drv, '_ensure_shares_mounted'):
+            with mock.patch.object(drv, '_find_share',
+                                   return_value=self.TEST_NFS_EXPORT1):
+                with mock.patch.object(drv, '_do_create_volume',
+                                       side_effect=OSError()):
+                    self.assertRaises(OSError, drv.create_volume, volume)
+
+        self.assertEqual((10 * units.Gi, 8 * units.Gi, 2 * units.Gi),
+                         drv._get_share_capacity(self.TEST_NFS_EXPORT1))
+
+    def test_extend_volume_updates_share_capacity(self):
+        """Extended volumes are accounted in the cache."""
+        drv = self._driver
+        drv._share_capacity['nfs_share'] = (
+            time.time(), (10 * units.Gi, 8 * units.Gi, 2 * units.Gi))
+        volume = {'id': '80ee16b6-75d2-4d54-9539-ffc1b4b0fb10', 'size': 1,
+                  'provider_location': 'nfs_share'}
+
+        with mock.patch.object(image_utils, 'resize_image'):
+            with mock.patch.object(drv, 'local_path', return_value='path'):
+                with mock.patch.object(drv, '_is_file_size_equal',
+                                       return_value=True):
+                    drv.extend_volume(volume, 3)
+
+        # Sparse volumes only add to the apparent space allocated
+        self.assertEqual((10 * units.Gi, 8 * units.Gi, 4 * units.Gi),
+                         drv._get_share_capacity('nfs_share'))
+
+    def test_get_capacity_info_tracks_allocated_space(self):
+        """du only runs once per nfs_allocated_rescan_interval."""
+        drv = self._driver
+        drv._share_allocated[self.TEST_NFS_EXPORT1] = (time.time(),
+                                                       4 * units.Gi)
+
+        with mock.patch.object(drv, '_get_mount_point_for_share',
+                               return_value=self.TEST_MNT_POINT):
+            with mock.patch.object(drv, '_execute',
+                                   return_value=('1 100 50', None)) as execute:
+                self.assertEqual((100, 50, 4 * units.Gi),
+                                 drv._get_capacity_info(self.TEST_NFS_EXPORT1))
+                execute.assert_called_once_with('stat', '-f', '-c',
+                                                '%S %b %a',
+                                                self.TEST_MNT_POINT,
+                                                run_as_root=True)
+
+                self.configuration.nfs_allocated_rescan_interval = 0
+                execute.side_effect = [('1 100 50', None), ('512 /mnt', None)]
+                self.assertEqual((100, 50, 512),
+                                 drv._get_capacity_info(self.TEST_NFS_EXPORT1))
+
     def test_is_file_size_equal(self):
         """File sizes are equal."""
         drv = self._driver
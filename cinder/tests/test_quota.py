@@ -17,7 +17,9 @@
 
 
 import datetime
+import uuid
 
+import eventlet
 import mock
 from oslo.config import cfg
 
@@ -707,6 +709,101 @@ class VolumeTypeQuotaEngineTestCase(test.TestCase):
         db.volume_type_destroy(ctx, vtype['id'])
         db.volume_type_destroy(ctx, vtype2['id'])
 
+    def test_resources_cached(self):
+        calls = []
+
+        def fake_vtga(context, inactive=False, filters=None):
+            calls.append('volume_type_get_all')
+            return {}
+        self.stubs.Set(db, 'volume_type_get_all', fake_vtga)
+
+        engine = quota.VolumeTypeQuotaEngine()
+        resources = engine.resources
+        self.assertIs(resources, engine.resources)
+        self.assertEqual(engine.resource_names,
+                         ['gigabytes', 'snapshots', 'volumes'])
+        self.assertEqual(calls, ['volume_type_get_all'])
+
+    def test_resources_rebuilt_on_volume_type_change(self):
+        self.flags(quota_resources_cache_ttl=0)
+        ctx = context.RequestContext('admin', 'admin', is_admin=True)
+        engine = quota.VolumeTypeQuotaEngine()
+        self.assertEqual(engine.resource_names,
+                         ['gigabytes', 'snapshots', 'volumes'])
+
+        vtype = db.volume_type_create(ctx, {'name': 'type1'})
+        self.assertEqual(engine.resource_names,
+                         ['gigabytes', 'gigabytes_type1',
+                          'snapshots', 'snapshots_type1',
+                          'volumes', 'volumes_type1'])
+
+        db.volume_type_destroy(ctx, vtype['id'])
+        self.assertEqual(engine.resource_names,
+                         ['gigabytes', 'snapshots', 'volumes'])
+
+    def test_resources_rebuilt_on_generation_change(self):
+        calls = []
+        generation = [0]
+
+        def fake_vtga(context, inactive=False, filters=None):
+            calls.append('volume_type_get_all')
+            return {}
+
+        def fake_vtgg(context):
+            return generation[0]
+        self.stubs.Set(db, 'volume_type_get_all', fake_vtga)
+        self.stubs.Set(db, 'volume_type_generation_get', fake_vtgg)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+        engine = quota.VolumeTypeQuotaEngine()
+        engine.resources
+        engine.resources
+        self.assertEqual(len(calls), 1)
+
+        # Another process created or destroyed a volume type.
+        generation[0] += 1
+        engine.resources
+        self.assertEqual(len(calls), 1)
+        timeutils.advance_time_seconds(CONF.quota_resources_cache_ttl + 1)
+        engine.resources
+        self.assertEqual(len(calls), 2)
+
+        engine.invalidate_resources()
+        engine.resources
+        self.assertEqual(len(calls), 3)
+
+    def test_generation_checked_once_per_ttl(self):
+        calls = []
+
+        def fake_vtgg(context):
+            calls.append('volume_type_generation_get')
+            return 0
+        self.stubs.Set(db, 'volume_type_generation_get', fake_vtgg)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+        engine = quota.VolumeTypeQuotaEngine()
+        for i in xrange(3):
+            engine.resources
+        self.assertEqual(len(calls), 1)
+
+        timeutils.advance_time_seconds(CONF.quota_resources_cache_ttl + 1)
+        engine.resources
+        engine.resources
+        self.assertEqual(len(calls), 2)
+
+    def test_reserve_unknown_resource_checks_generation(self):
+        ctx = context.RequestContext('admin', 'admin', is_admin=True)
+        engine = quota.VolumeTypeQuotaEngine()
+        self.assertNotIn('volumes_type1', engine.resources)
+
+        # Created by another process, before the TTL expired
+        db.volume_type_create(ctx, {'name': 'type1'})
+        reservations = engine.reserve(ctx, volumes=1, volumes_type1=1)
+        engine.rollback(ctx, reservations)
+        self.assertIn('volumes_type1', engine.resources)
+
 
 class DbQuotaDriverTestCase(test.TestCase):
     def setUp(self):
@@ -1075,6 +1172,9 @@ class FakeSession(object):
     def __exit__(self, exc_type, exc_value, exc_traceback):
         return False
 
+    def flush(self):
+        pass
+
 
 class FakeUsage(sqa_models.QuotaUsage):
     def save(self, *args, **kwargs):
@@ -1116,12 +1216,17 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.usages = {}
         self.usages_created = {}
         self.reservations_created = {}
+        self.reserve_calls = []
+        self.usages_read = []
 
         def fake_get_session():
             return FakeSession()
 
-        def fake_get_quota_usages(context, session, project_id):
-            return self.usages.copy()
+        def fake_get_quota_usages(context, session, project_id,
+                                  resources=None, lock=True):
+            self.usages_read.append((sorted(resources), lock))
+            return dict((k, v) for k, v in self.usages.items()
+                        if resources is None or k in resources)
 
         def fake_quota_usage_create(context, project_id, resource, in_use,
                                     reserved, until_refresh, session=None,
@@ -1134,20 +1239,35 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
 
             return quota_usage_ref
 
-        def fake_reservation_create(context, uuid, usage_id, project_id,
-                                    resource, delta, expire, session=None):
-            reservation_ref = self._make_reservation(
-                uuid, usage_id, project_id, resource, delta, expire,
-                timeutils.utcnow(), timeutils.utcnow())
+        def fake_quota_usage_reserve(context, session, usage, delta,
+                                     hard_limit):
+            self.reserve_calls.append((usage.resource, delta))
+            if hard_limit >= 0 and hard_limit < delta + usage.total:
+                return False
+            usage.reserved += delta
+            return True
+
+        def fake_reservations_create(context, session, usages, project_id,
+                                     deltas, expire):
+            result = []
+            for resource, delta in deltas.items():
+                reservation_ref = self._make_reservation(
+                    str(uuid.uuid4()), usages[resource], project_id,
+                    resource, delta, expire,
+                    timeutils.utcnow(), timeutils.utcnow())
 
-            self.reservations_created[resource] = reservation_ref
+                self.reservations_created[resource] = reservation_ref
+                result.append(reservation_ref.uuid)
 
-            return reservation_ref
+            return result
 
         self.stubs.Set(sqa_api, 'get_session', fake_get_session)
         self.stubs.Set(sqa_api, '_get_quota_usages', fake_get_quota_usages)
         self.stubs.Set(sqa_api, '_quota_usage_create', fake_quota_usage_create)
-        self.stubs.Set(sqa_api, '_reservation_create', fake_reservation_create)
+        self.stubs.Set(sqa_api, '_quota_usage_reserve',
+                       fake_quota_usage_reserve)
+        self.stubs.Set(sqa_api, '_reservations_create',
+                       fake_reservations_create)
 
         patcher = mock.patch.object(timeutils, 'utcnow')
         self.addCleanup(patcher.stop)
@@ -1439,6 +1559,58 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.assertEqual(self.reservations_created, {})
 
+    def test_quota_reserve_no_refresh_no_lock(self):
+        self.init_usage('test_project', 'volumes', 3, 0)
+        self.init_usage('test_project', 'gigabytes', 3, 0)
+        self.init_usage('test_project', 'snapshots', 3, 0)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        sqa_api.quota_reserve(context, self.resources, quotas,
+                              deltas, self.expire, 0, 0)
+
+        # Only the usages being reserved are read, and none is locked.
+        self.assertEqual(self.usages_read,
+                         [(['gigabytes', 'volumes'], False)])
+        self.assertEqual(self.reserve_calls,
+                         [('gigabytes', 2 * 1024), ('volumes', 2)])
+
+    def test_quota_reserve_refresh_locks_refreshed_usages(self):
+        self.init_usage('test_project', 'volumes', 3, 0, until_refresh=1)
+        self.init_usage('test_project', 'gigabytes', 3, 0)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        sqa_api.quota_reserve(context, self.resources, quotas,
+                              deltas, self.expire, 5, 0)
+
+        self.assertEqual(self.sync_called, set(['volumes']))
+        self.assertEqual(self.usages_read,
+                         [(['gigabytes', 'volumes'], False),
+                          (['volumes'], True)])
+
+    def test_quota_reserve_overs_gives_back_reserved(self):
+        self.init_usage('test_project', 'volumes', 4, 0)
+        self.init_usage('test_project', 'gigabytes', 1 * 1024, 0)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        self.assertRaises(exception.OverQuota,
+                          sqa_api.quota_reserve,
+                          context, self.resources, quotas,
+                          deltas, self.expire, 0, 0)
+
+        self.assertEqual(self.reserve_calls,
+                         [('gigabytes', 2 * 1024), ('volumes', 2),
+                          ('gigabytes', -2 * 1024)])
+        self.compare_usage(self.usages, [dict(resource='volumes',
+                                              in_use=4,
+                                              reserved=0),
+                                         dict(resource='gigabytes',
+                                              in_use=1 * 1024,
+                                              reserved=0), ])
+        self.assertEqual(self.reservations_created, {})
+
     def test_quota_reserve_reduction(self):
         self.init_usage('test_project', 'volumes', 10, 0)
         self.init_usage('test_project', 'gigabytes', 20 * 1024, 0)
@@ -1469,3 +1641,66 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                                        usage_id=self.usages['gigabytes'],
                                        project_id='test_project',
                                        delta=-2 * 1024), ])
+
+
+class QuotaReserveConcurrencyTestCase(test.TestCase):
+    """Reservations of green threads sharing one project never overcommit."""
+
+    num_threads = 20
+    rounds = 4
+
+    def setUp(self):
+        super(QuotaReserveConcurrencyTestCase, self).setUp()
+        self.context = context.RequestContext('admin', 'test_project',
+                                              is_admin=True)
+        db.quota_class_destroy_all_by_name(self.context, 'default')
+
+    def _reserve_and_commit(self, results):
+        for i in xrange(self.rounds):
+            try:
+                reservations = quota.QUOTAS.reserve(self.context,
+                                                    volumes=1,
+                                                    gigabytes=1)
+            except exception.OverQuota:
+                results['overs'] += 1
+                continue
+            quota.QUOTAS.commit(self.context, reservations)
+            results['committed'] += 1
+            # Let the other threads interleave with this one
+            eventlet.sleep(0)
+
+    def _run(self):
+        results = {'committed': 0, 'overs': 0}
+        pool = eventlet.GreenPool(self.num_threads)
+        for i in xrange(self.num_threads):
+            pool.spawn_n(self._reserve_and_commit, results)
+        pool.waitall()
+        return results
+
+    def test_reserve_concurrency(self):
+        total = self.num_threads * self.rounds
+        self.flags(quota_volumes=total, quota_gigabytes=total)
+
+        results = self._run()
+
+        self.assertEqual({'committed': total, 'overs': 0}, results)
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'test_project')
+        self.assertEqual({'in_use': total, 'reserved': 0},
+                         usages['volumes'])
+
+    def test_reserve_concurrency_over_quota(self):
+        total = self.num_threads * self.rounds
+        limit = total // 2
+        self.flags(quota_volumes=limit, quota_gigabytes=total)
+
+        results = self._run()
+
+        self.assertEqual({'committed': limit, 'overs': total - limit},
+                         results)
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'test_project')
+        self.assertEqual({'in_use': limit, 'reserved': 0},
+                         usages['volumes'])
+        self.assertEqual({'in_use': limit, 'reserved': 0},
+                         usages['gigabytes'])
@@ -38,6 +38,7 @@ from cinder.brick.local_dev import lvm as brick_lvm
 from cinder import context
 from cinder import db
 from cinder import exception
+from cinder.image import cache as image_cache
 from cinder.image import image_utils
 from cinder import keymgr
 from cinder.openstack.common import fileutils
@@ -97,8 +98,10 @@ class BaseVolumeTestCase(test.TestCase):
         self.extension_manager = extension.ExtensionManager(
             "BaseVolumeTestCase")
         vol_tmpdir = tempfile.mkdtemp()
+        # The commands run by the drivers are faked, so copy volumes with dd
         self.flags(volumes_dir=vol_tmpdir,
-                   notification_driver=["test"])
+                   notification_driver=["test"],
+                   volume_copy_engine='dd')
         self.addCleanup(self._cleanup)
         self.volume = importutils.import_object(CONF.volume_manager)
         self.context = context.get_admin_context()
@@ -228,7 +231,9 @@ class VolumeTestCase(BaseVolumeTestCase):
         self.stubs.Set(volutils, 'clear_volume',
                        lambda a, b, volume_clear=mox.IgnoreArg(),
                        volume_clear_size=mox.IgnoreArg(),
-                       lvm_type=mox.IgnoreArg(): None)
+                       lvm_type=mox.IgnoreArg(),
+                       bps_limit=mox.IgnoreArg(),
+                       scrub=mox.IgnoreArg(): None)
 
     def test_init_host_clears_downloads(self):
         """Test that init_host will unwedge a volume stuck in downloading."""
@@ -576,6 +581,19 @@ class VolumeTestCase(BaseVolumeTestCase):
             self.assertEqual(volume_stats['key2'],
                              fake_capabilities['key2'])
 
+    def test_image_cache_capabilities(self):
+        fake_stats = {'hits': 1, 'misses': 2}
+        cache = mock.Mock()
+        cache.get_stats.return_value = fake_stats
+
+        with mock.patch.object(image_cache, 'get_cache', return_value=cache):
+            manager = VolumeManager()
+            manager.driver.set_initialized()
+            manager.publish_service_capabilities(self.context)
+
+        self.assertEqual(fake_stats,
+                         manager.last_capabilities['image_cache'])
+
     def test_extra_capabilities_fail(self):
         with mock.patch.object(jsonutils, 'loads') as mock_loads:
             mock_loads.side_effect = exception.CinderException('test')
@@ -3387,6 +3405,136 @@ class LVMVolumeDriverTestCase(DriverTestCase):
 
         lvm_driver._delete_volume(fake_snapshot, is_snapshot=True)
 
+    def _clear_snapshot(self, usage, volume_clear_size=0):
+        configuration = conf.Configuration(fake_opt, 'fake_group')
+        configuration.volume_clear = 'zero'
+        configuration.volume_clear_size = volume_clear_size
+        configuration.volume_clear_scrub = True
+        lvm_driver = lvm.LVMVolumeDriver(configuration=configuration,
+                                         vg_obj=mock.Mock())
+        lvm_driver.vg.get_snapshot_usage.return_value = usage
+
+        with contextlib.nested(
+                mock.patch.object(os.path, 'exists', return_value=True),
+                mock.patch.object(volutils, 'clear_volume')) as (
+                _exists, clear_volume):
+            lvm_driver._clear_volume({'name': 'snapshot-1', 'id': '1',
+                                      'size': 2}, is_snapshot=True)
+
+        lvm_driver.vg.get_snapshot_usage.assert_called_once_with(
+            '_snapshot-1')
+        return clear_volume
+
+    def test_clear_snapshot_cow_usage(self):
+        clear_volume = self._clear_snapshot(10.0)
+
+        # 10% of 2 GiB, plus 1 MiB
+        clear_volume.assert_called_once_with(
+            2048, mock.ANY, volume_clear='zero', volume_clear_size=206,
+            bps_limit=None, scrub=True)
+
+    def test_clear_snapshot_cow_usage_within_clear_size(self):
+        clear_volume = self._clear_snapshot(10.0, volume_clear_size=100)
+
+        self.assertEqual(100, clear_volume.call_args[1]['volume_clear_size'])
+
+    def test_clear_snapshot_cow_usage_unknown(self):
+        clear_volume = self._clear_snapshot(None)
+
+        self.assertEqual(0, clear_volume.call_args[1]['volume_clear_size'])
+
+    def _lazy_clear_driver(self):
+        configuration = conf.Configuration(fake_opt, 'fake_group')
+        configuration.volume_clear = 'zero'
+        configuration.volume_clear_size = 0
+        configuration.lvm_lazy_clear = True
+        configuration.lvm_lazy_clear_bps_limit = 1000
+        return lvm.LVMVolumeDriver(configuration=configuration,
+                                   vg_obj=mock.Mock())
+
+    def test_delete_volume_lazy_clear(self):
+        lvm_driver = self._lazy_clear_driver()
+        volume = dict(self.FAKE_VOLUME, size=2)
+
+        with mock.patch.object(lvm_driver, '_clear_volume') as clear_volume:
+            lvm_driver._delete_volume(volume)
+
+            lvm_driver.vg.rename_volume.assert_called_once_with(
+                'test1', 'reclaim-test1')
+            self.assertFalse(lvm_driver.vg.delete.called)
+            self.assertEqual({'reclaim-test1': 2}, lvm_driver._reclaims)
+
+            lvm_driver._reclaimer.wait()
+
+        clear_volume.assert_called_once_with(
+            {'name': 'reclaim-test1', 'id': 'reclaim-test1', 'size': 2},
+            bps_limit=1000)
+        lvm_driver.vg.delete.assert_called_once_with('reclaim-test1')
+        self.assertEqual({}, lvm_driver._reclaims)
+        self.assertIsNone(lvm_driver._reclaimer)
+
+    def test_delete_volume_lazy_clear_failure(self):
+        lvm_driver = self._lazy_clear_driver()
+
+        with mock.patch.object(lvm_driver, '_clear_volume',
+                               side_effect=exception.VolumeBackendAPIException(
+                                   data='fake')):
+            lvm_driver._delete_volume(dict(self.FAKE_VOLUME, size=2))
+            lvm_driver._reclaimer.wait()
+
+        # The LV is left to be reclaimed again, its space still pending
+        self.assertFalse(lvm_driver.vg.delete.called)
+        self.assertEqual({}, lvm_driver._reclaims)
+        self.assertEqual({'reclaim-test1': 2}, lvm_driver._failed_reclaims)
+        lvm_driver._update_volume_stats()
+        self.assertEqual(2, lvm_driver._stats['pending_reclaim_capacity_gb'])
+
+    def test_delete_volume_lazy_clear_retries_failed(self):
+        lvm_driver = self._lazy_clear_driver()
+        lvm_driver._failed_reclaims['reclaim-test0'] = 1
+
+        with mock.patch.object(lvm_driver, '_clear_volume') as clear_volume:
+            lvm_driver._delete_volume(dict(self.FAKE_VOLUME, size=2))
+            lvm_driver._reclaimer.wait()
+
+        self.assertEqual(2, clear_volume.call_count)
+        self.assertEqual([mock.call('reclaim-test1'),
+                          mock.call('reclaim-test0')],
+                         lvm_driver.vg.delete.call_args_list)
+        self.assertEqual({}, lvm_driver._failed_reclaims)
+
+    def test_delete_snapshot_lazy_clear(self):
+        lvm_driver = self._lazy_clear_driver()
+
+        with mock.patch.object(lvm_driver, '_clear_volume') as clear_volume:
+            lvm_driver._delete_volume({'name': 'snapshot-1', 'id': '1',
+                                       'size': 2}, is_snapshot=True)
+
+        self.assertTrue(clear_volume.called)
+        self.assertFalse(lvm_driver.vg.rename_volume.called)
+        lvm_driver.vg.delete.assert_called_once_with('_snapshot-1')
+
+    def test_resume_reclaims(self):
+        lvm_driver = self._lazy_clear_driver()
+        lvm_driver.vg.get_volumes.return_value = [
+            {'vg': 'cinder-volumes', 'name': 'volume-1', 'size': '1.00'},
+            {'vg': 'cinder-volumes', 'name': 'reclaim-volume-2',
+             'size': '2.00'}]
+
+        with mock.patch.object(lvm_driver, '_queue_reclaim') as queue:
+            lvm_driver._resume_reclaims()
+
+        queue.assert_called_once_with('reclaim-volume-2', 2.0)
+
+    def test_update_volume_stats_pending_reclaim(self):
+        lvm_driver = self._lazy_clear_driver()
+        lvm_driver._reclaims['reclaim-volume-1'] = 2
+        lvm_driver._reclaims['reclaim-volume-2'] = 3
+
+        lvm_driver._update_volume_stats()
+
+        self.assertEqual(5, lvm_driver._stats['pending_reclaim_capacity_gb'])
+
 
 class ISCSITestCase(DriverTestCase):
     """Test Case for ISCSIDriver"""
@@ -95,6 +95,30 @@ class VolumeGlanceMetadataTestCase(test.TestCase):
         self._assert_metadata_equals('2', 'key2', 'value2', metadata[1])
         self._assert_metadata_equals('2', 'key22', 'value22', metadata[2])
 
+    def test_vols_get_glance_metadata_by_volume_ids(self):
+        ctxt = context.get_admin_context()
+        db.volume_create(ctxt, {'id': '1', 'project_id': 'p1'})
+        db.volume_create(ctxt, {'id': '2', 'project_id': 'p1'})
+        db.volume_create(ctxt, {'id': '3', 'project_id': 'p2'})
+        db.volume_glance_metadata_create(ctxt, '1', 'key1', 'value1')
+        db.volume_glance_metadata_create(ctxt, '2', 'key2', 'value2')
+        db.volume_glance_metadata_create(ctxt, '3', 'key3', 'value3')
+
+        metadata = db.volume_glance_metadata_get_by_volume_ids(ctxt,
+                                                               ['2', '3'])
+        self.assertEqual(2, len(metadata))
+        self._assert_metadata_equals('2', 'key2', 'value2', metadata[0])
+        self._assert_metadata_equals('3', 'key3', 'value3', metadata[1])
+
+        user_ctxt = context.RequestContext('user', 'p1')
+        metadata = db.volume_glance_metadata_get_by_volume_ids(
+            user_ctxt, ['1', '3'])
+        self.assertEqual(1, len(metadata))
+        self._assert_metadata_equals('1', 'key1', 'value1', metadata[0])
+
+        self.assertEqual(
+            [], db.volume_glance_metadata_get_by_volume_ids(ctxt, []))
+
     def _assert_metadata_equals(self, volume_id, key, value, observed):
         self.assertEqual(volume_id, observed.volume_id)
         self.assertEqual(key, observed.key)
@@ -114,7 +114,8 @@ class ClearVolumeTestCase(test.TestCase):
         self.mox.StubOutWithMock(volume_utils, 'copy_volume')
         volume_utils.copy_volume("/dev/zero", "volume_path", 1024,
                                  CONF.volume_dd_blocksize, sync=True,
-                                 ionice=None, execute=utils.execute)
+                                 ionice=None, execute=utils.execute,
+                                 bps_limit=None, scrub=False)
         self.mox.ReplayAll()
         volume_utils.clear_volume(1024, "volume_path")
 
@@ -125,7 +126,8 @@ class ClearVolumeTestCase(test.TestCase):
         self.mox.StubOutWithMock(volume_utils, 'copy_volume')
         volume_utils.copy_volume("/dev/zero", "volume_path", 1,
                                  CONF.volume_dd_blocksize, sync=True,
-                                 ionice=None, execute=utils.execute)
+                                 ionice=None, execute=utils.execute,
+                                 bps_limit=None, scrub=False)
         self.mox.ReplayAll()
         volume_utils.clear_volume(1024, "volume_path")
 
@@ -138,7 +140,8 @@ class ClearVolumeTestCase(test.TestCase):
         volume_utils.copy_volume("/dev/zero", "volume_path", 1024,
                                  CONF.volume_dd_blocksize, sync=True,
                                  ionice=CONF.volume_clear_ionice,
-                                 execute=utils.execute)
+                                 execute=utils.execute, bps_limit=None,
+                                 scrub=False)
         self.mox.ReplayAll()
         volume_utils.clear_volume(1024, "volume_path")
 
@@ -150,7 +153,8 @@ class ClearVolumeTestCase(test.TestCase):
         volume_utils.copy_volume("/dev/zero", "volume_path", 1,
                                  CONF.volume_dd_blocksize, sync=True,
                                  ionice=CONF.volume_clear_ionice,
-                                 execute=utils.execute)
+                                 execute=utils.execute, bps_limit=None,
+                                 scrub=False)
         self.mox.ReplayAll()
         volume_utils.clear_volume(1024, "volume_path")
 
@@ -204,6 +208,8 @@ class ClearVolumeTestCase(test.TestCase):
 class CopyVolumeTestCase(test.TestCase):
 
     def test_copy_volume_dd_iflag_and_oflag(self):
+        self.flags(volume_copy_engine='dd')
+
         def fake_utils_execute(*cmd, **kwargs):
             if 'if=/dev/zero' in cmd and 'iflag=direct' in cmd:
                 raise processutils.ProcessExecutionError()
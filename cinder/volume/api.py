@@ -289,7 +289,8 @@ class API(base.Base):
         return volume
 
     def get_all(self, context, marker=None, limit=None, sort_key='created_at',
-                sort_dir='desc', filters=None, viewable_admin_meta=False):
+                sort_dir='desc', filters=None, viewable_admin_meta=False,
+                columns=None):
         check_policy(context, 'get_all')
         if filters == None:
             filters = {}
@@ -318,7 +319,8 @@ class API(base.Base):
             # Need to remove all_tenants to pass the filtering below.
             del filters['all_tenants']
             volumes = self.db.volume_get_all(context, marker, limit, sort_key,
-                                             sort_dir, filters=filters)
+                                             sort_dir, filters=filters,
+                                             columns=columns)
         else:
             if viewable_admin_meta:
                 context = context.elevated()
@@ -326,7 +328,8 @@ class API(base.Base):
                                                         context.project_id,
                                                         marker, limit,
                                                         sort_key, sort_dir,
-                                                        filters=filters)
+                                                        filters=filters,
+                                                        columns=columns)
 
         return volumes
 
@@ -340,31 +343,38 @@ class API(base.Base):
         rv = self.db.volume_get(context, volume_id)
         return dict(rv.iteritems())
 
-    def get_all_snapshots(self, context, search_opts=None):
+    def get_all_snapshots(self, context, search_opts=None, marker=None,
+                          limit=None, sort_key='created_at', sort_dir='asc',
+                          offset=None):
         check_policy(context, 'get_all_snapshots')
 
         search_opts = search_opts or {}
 
+        try:
+            if limit is not None:
+                limit = int(limit)
+                if limit < 0:
+                    msg = _('limit param must be positive')
+                    raise exception.InvalidInput(reason=msg)
+        except ValueError:
+            msg = _('limit param must be an integer')
+            raise exception.InvalidInput(reason=msg)
+
+        if search_opts:
+            LOG.debug("Searching by: %s" % search_opts)
+
         if (context.is_admin and 'all_tenants' in search_opts):
             # Need to remove all_tenants to pass the filtering below.
             del search_opts['all_tenants']
-            snapshots = self.db.snapshot_get_all(context)
+            snapshots = self.db.snapshot_get_all(context, marker, limit,
+                                                 sort_key, sort_dir,
+                                                 filters=search_opts,
+                                                 offset=offset)
         else:
             snapshots = self.db.snapshot_get_all_by_project(
-                context, context.project_id)
+                context, context.project_id, marker, limit, sort_key,
+                sort_dir, filters=search_opts, offset=offset)
 
-        if search_opts:
-            LOG.debug("Searching by: %s" % search_opts)
-
-            results = []
-            not_found = object()
-            for snapshot in snapshots:
-                for opt, value in search_opts.iteritems():
-                    if snapshot.get(opt, not_found) != value:
-                        break
-                else:
-                    results.append(snapshot)
-            snapshots = results
         return snapshots
 
     @wrap_check_policy
@@ -700,9 +710,13 @@ class API(base.Base):
     def get_snapshot_metadata_value(self, snapshot, key):
         pass
 
-    def get_volumes_image_metadata(self, context):
+    def get_volumes_image_metadata(self, context, volume_ids=None):
         check_policy(context, 'get_volumes_image_metadata')
-        db_data = self.db.volume_glance_metadata_get_all(context)
+        if volume_ids is None:
+            db_data = self.db.volume_glance_metadata_get_all(context)
+        else:
+            db_data = self.db.volume_glance_metadata_get_by_volume_ids(
+                context, volume_ids)
         results = collections.defaultdict(dict)
         for meta_entry in db_data:
             results[meta_entry['volume_id']].update({meta_entry['key']:
@@ -0,0 +1,422 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process copy of volume data.
+
+The data is copied in extents by several workers, each reading and writing
+through aligned O_DIRECT buffers in a native thread so that the green
+threads of the service keep running. Extents which are all zeros are not
+written: they are left alone on targets known to be zeroed, punched out of
+files and zeroed by the kernel on block devices.
+
+Targets can also be scrubbed: only their extents which aren't zeros are
+zeroed, so that clearing a mostly empty volume mostly reads it.
+"""
+
+
+import ctypes
+import errno
+import fcntl
+import io
+import mmap
+import os
+import stat
+import struct
+import time
+
+import eventlet
+from eventlet import tpool
+
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import units
+
+LOG = logging.getLogger(__name__)
+
+ZERO_SOURCE = '/dev/zero'
+
+# ioctls zeroing and discarding a range of a block device,
+# _IO(0x12, 127) and _IO(0x12, 119)
+BLKZEROOUT = 0x127f
+BLKDISCARD = 0x1277
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
+# O_DIRECT transfers must be aligned on the logical block size
+_DIRECT_ALIGNMENT = 512
+
+# (device, flags) : whether the device can be opened with O_DIRECT
+_odirect_support = {}
+
+# device number : whether discarded blocks of the device read zeros
+_discard_zeroes_data = {}
+
+_libc = None
+
+
+def _fallocate(fd, mode, offset, length):
+    global _libc
+    if _libc is None:
+        # The symbols of the process include libc, without looking it up
+        # with ldconfig
+        _libc = ctypes.CDLL(None, use_errno=True)
+    if _libc.fallocate(fd, mode, ctypes.c_int64(offset),
+                       ctypes.c_int64(length)):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def _device_key(path):
+    st = os.stat(path)
+    if stat.S_ISBLK(st.st_mode) or stat.S_ISCHR(st.st_mode):
+        return ('dev', st.st_rdev)
+    return ('fs', st.st_dev)
+
+
+def supports_odirect(path, flags):
+    """Return whether path can be opened with O_DIRECT and flags.
+
+    The answer is cached per device, or per filesystem for files.
+    """
+    key = (_device_key(path), flags)
+    if key not in _odirect_support:
+        try:
+            os.close(os.open(path, flags | os.O_DIRECT))
+            _odirect_support[key] = True
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+            _odirect_support[key] = False
+    return _odirect_support[key]
+
+
+def _device_discard_zeroes_data(rdev):
+    """Return whether the blocks discarded from a block device read zeros.
+
+    The answer is cached per device.
+    """
+    if rdev not in _discard_zeroes_data:
+        sysfs = ('/sys/dev/block/%d:%d/queue/discard_zeroes_data' %
+                 (os.major(rdev), os.minor(rdev)))
+        try:
+            with open(sysfs) as f:
+                _discard_zeroes_data[rdev] = f.read().strip() == '1'
+        except IOError:
+            _discard_zeroes_data[rdev] = False
+    return _discard_zeroes_data[rdev]
+
+
+def zero_range(fd, offset, count):
+    """Zero a range of a file or block device without writing zeros.
+
+    Blocks are discarded from devices where they then read zeros, else
+    zeroed by the kernel, and holes are punched in files.
+
+    :returns: whether the range was zeroed
+    """
+    st = os.fstat(fd)
+    arg = struct.pack('QQ', offset, count)
+    try:
+        if not stat.S_ISBLK(st.st_mode):
+            _fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
+                       offset, count)
+            return True
+        if _device_discard_zeroes_data(st.st_rdev):
+            try:
+                fcntl.ioctl(fd, BLKDISCARD, arg)
+                return True
+            except IOError:
+                pass
+        fcntl.ioctl(fd, BLKZEROOUT, arg)
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class TokenBucket(object):
+    """Limits the rate of a flow of bytes.
+
+    Bytes are consumed from a bucket refilled at rate bytes per second,
+    holding at most a second worth of bytes.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.time()
+
+    def consume(self, count):
+        now = time.time()
+        self.tokens = min(self.rate,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= count
+        if self.tokens < 0:
+            time.sleep(-self.tokens / float(self.rate))
+
+
+class _Worker(object):
+    """Copies extents with its own descriptors and aligned buffer."""
+
+    def __init__(self, copy):
+        self.copy = copy
+        self.buf = mmap.mmap(-1, copy.chunk_size)
+        # Anonymous mappings are zero filled and aligned for O_DIRECT
+        self.zero_buf = None
+        self.src = None
+        if not copy.zero_source:
+            self.src = _File(copy.src, os.O_RDONLY)
+        if copy.scrub:
+            self.dst = _File(copy.dst, os.O_RDWR)
+        else:
+            self.dst = _File(copy.dst, os.O_WRONLY | os.O_CREAT)
+
+    def _read(self, src, offset, length):
+        buf = self.buf
+        if length != len(buf):
+            buf = mmap.mmap(-1, length)
+        f = src.get(offset, length)
+        f.seek(offset)
+        return buf, f.readinto(buf) or 0
+
+    def _write(self, offset, buf, count):
+        f = self.dst.get(offset, count)
+        f.seek(offset)
+        f.write(buffer(buf, 0, count))
+
+    def _zero(self, offset, count):
+        """Zero a range of the target without writing zeros if possible.
+
+        :returns: the number of bytes written to zero the range
+        """
+        if zero_range(self.dst.fileno(), offset, count):
+            return 0
+        if self.zero_buf is None:
+            self.zero_buf = mmap.mmap(-1, self.copy.chunk_size)
+        self._write(offset, self.zero_buf, count)
+        return count
+
+    def _is_zeros(self, buf, count):
+        if count == len(self.copy.zeros):
+            return buf[:] == self.copy.zeros
+        return buf[:count] == self.copy.zeros[:count]
+
+    def copy_extent(self, offset, length):
+        """Copy an extent.
+
+        :returns: the bytes copied, whether they were zeros and the bytes
+                  written
+        """
+        if self.copy.scrub:
+            buf, count = self._read(self.dst, offset, length)
+            if not count or self._is_zeros(buf, count):
+                return count, True, 0
+            return count, False, self._zero(offset, count)
+
+        if self.copy.zero_source:
+            buf, count = None, length
+            zeros = True
+        else:
+            buf, count = self._read(self.src, offset, length)
+            zeros = self._is_zeros(buf, count)
+
+        if not count:
+            return 0, False, 0
+        if not zeros:
+            self._write(offset, buf, count)
+            return count, zeros, count
+        elif not self.copy.dst_zeroed:
+            return count, zeros, self._zero(offset, count)
+        return count, zeros, 0
+
+    def fsync(self):
+        os.fsync(self.dst.fileno())
+
+    def close(self):
+        for f in (self.src, self.dst):
+            if f is not None:
+                f.close()
+        self.buf.close()
+        if self.zero_buf is not None:
+            self.zero_buf.close()
+
+
+class _File(object):
+    """A path opened with O_DIRECT if possible, and without if needed."""
+
+    def __init__(self, path, flags):
+        self.path = path
+        self.flags = flags
+        self.mode = {os.O_RDONLY: 'r', os.O_RDWR: 'r+'}.get(flags, 'w')
+        self.direct = supports_odirect(path, flags)
+        self._direct = None
+        self._buffered = None
+        if self.direct:
+            self._direct = self._open(flags | os.O_DIRECT)
+        else:
+            self._buffered = self._open(flags)
+
+    def _open(self, flags):
+        return io.FileIO(os.open(self.path, flags), self.mode)
+
+    def get(self, offset, count):
+        """Return the file to transfer count bytes at offset with."""
+        if (self.direct and not offset % _DIRECT_ALIGNMENT and
+                not count % _DIRECT_ALIGNMENT):
+            return self._direct
+        if self._buffered is None:
+            self._buffered = self._open(self.flags)
+        return self._buffered
+
+    def fileno(self):
+        return (self._direct or self._buffered).fileno()
+
+    def close(self):
+        for f in (self._direct, self._buffered):
+            if f is not None:
+                f.close()
+
+
+class VolumeCopy(object):
+    """Copy size bytes from src to dst."""
+
+    def __init__(self, src, dst, size, chunk_size=units.Mi, workers=4,
+                 bps_limit=0, sync=False, dst_zeroed=False, scrub=False,
+                 progress_interval=30):
+        """Prepare a copy.
+
+        :param src: path of the source, /dev/zero to zero dst
+        :param dst: path of the target
+        :param size: bytes to copy
+        :param chunk_size: bytes copied at once by a worker
+        :param workers: number of extents copied concurrently
+        :param bps_limit: bytes per second read from the source, 0 for
+                          no limit
+        :param sync: whether to flush dst to disk before returning
+        :param dst_zeroed: whether dst reads zeros where it isn't written,
+                           such as a new thin volume or sparse file
+        :param scrub: with /dev/zero as src, only zero the extents of dst
+                      which aren't zeros already
+        :param progress_interval: seconds between progress reports
+        """
+        self.src = src
+        self.dst = dst
+        self.size = size
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.sync = sync
+        self.dst_zeroed = dst_zeroed
+        self.progress_interval = progress_interval
+        self.limiter = TokenBucket(bps_limit) if bps_limit else None
+
+        self.zero_source = src == ZERO_SOURCE
+        self.scrub = scrub and self.zero_source
+        self.zeros = '\0' * chunk_size
+        dst_mode = os.stat(dst).st_mode if os.path.exists(dst) else None
+        self.dst_is_file = dst_mode is None or stat.S_ISREG(dst_mode)
+
+        self.copied = 0
+        self.skipped = 0
+        self.written = 0
+        self._eof = None
+        self._failed = False
+        self._started = None
+        self._reported = None
+
+    def _extents(self):
+        offset = 0
+        while offset < self.size:
+            # Sources shorter than size are copied up to their end
+            if self._eof is not None and offset >= self._eof:
+                return
+            # The other workers stop once one of them failed
+            if self._failed:
+                return
+            yield offset, min(self.chunk_size, self.size - offset)
+            offset += self.chunk_size
+
+    def _progress(self, count, zeros, written):
+        self.copied += count
+        self.written += written
+        if zeros:
+            self.skipped += count
+        now = time.time()
+        if now - self._reported >= self.progress_interval:
+            self._reported = now
+            LOG.debug('Copied %(copied)d of %(size)d bytes from %(src)s to '
+                      '%(dst)s (%(rate).2f MB/s)' %
+                      {'copied': self.copied, 'size': self.size,
+                       'src': self.src, 'dst': self.dst,
+                       'rate': self.throughput})
+
+    @property
+    def throughput(self):
+        """Megabytes copied per second."""
+        elapsed = max(time.time() - self._started, 0.001)
+        return self.copied / elapsed / units.Mi
+
+    def _run_worker(self, extents):
+        worker = _Worker(self)
+        try:
+            for offset, length in extents:
+                if self.limiter:
+                    self.limiter.consume(length)
+                count, zeros, written = tpool.execute(worker.copy_extent,
+                                                      offset, length)
+                if count < length:
+                    self._eof = min(self._eof or self.size, offset + count)
+                self._progress(count, zeros, written)
+            if self.sync:
+                tpool.execute(worker.fsync)
+        except Exception:
+            self._failed = True
+            raise
+        finally:
+            worker.close()
+
+    def run(self):
+        """Copy the data, return the number of bytes copied."""
+        if not os.path.exists(self.dst):
+            open(self.dst, 'a').close()
+        self._started = self._reported = time.time()
+        extents = self._extents()
+        pool = eventlet.GreenPool(self.workers)
+        threads = [pool.spawn(self._run_worker, extents)
+                   for i in range(self.workers)]
+        # Wait for all the workers before raising the error of any of them
+        errors = []
+        for thread in threads:
+            try:
+                thread.wait()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+        if self.dst_is_file:
+            # Holes punched at the end don't extend files
+            with open(self.dst, 'r+b') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < self.copied:
+                    f.truncate(self.copied)
+
+        LOG.info(_('Copied %(copied)d bytes from %(src)s to %(dst)s in '
+                   '%(time).2f s (%(rate).2f MB/s), %(skipped)d bytes were '
+                   'zeros, %(written)d bytes were written') %
+                 {'copied': self.copied, 'src': self.src, 'dst': self.dst,
+                  'time': time.time() - self._started,
+                  'rate': self.throughput, 'skipped': self.skipped,
+                  'written': self.written})
+        return self.copied
@@ -73,6 +73,12 @@ volume_opts = [
     cfg.IntOpt('volume_clear_size',
                default=0,
                help='Size in MiB to wipe at start of old volumes. 0 => all'),
+    cfg.BoolOpt('volume_clear_scrub',
+                default=False,
+                help='Read old volumes when wiping them with zeros and only '
+                     'zero the blocks which are not zeros already, which is '
+                     'faster for volumes mostly left unwritten. Not used '
+                     'with volume_clear_ionice'),
     cfg.StrOpt('volume_clear_ionice',
                default=None,
                help='The flag to pass to ionice to alter the i/o priority '
@@ -113,6 +119,15 @@ volume_opts = [
                default=0,
                help='The upper limit of bandwidth of volume copy. '
                     '0 => unlimited'),
+    cfg.StrOpt('volume_copy_engine',
+               default='native',
+               help='How volumes are copied and cleared: "native" copies '
+                    'in-process with O_DIRECT and skips the writing of '
+                    'zeros, "dd" runs dd'),
+    cfg.IntOpt('volume_copy_workers',
+               default=4,
+               help='Number of blocks copied concurrently by the native '
+                    'volume copy engine'),
 ]
 
 # for backward compatibility
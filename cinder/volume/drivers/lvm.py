@@ -18,10 +18,12 @@ Driver for Linux servers running LVM.
 
 """
 
+import collections
 import math
 import os
 import socket
 
+import eventlet
 from oslo.config import cfg
 
 from cinder.brick import exception as brick_exception
@@ -49,8 +51,28 @@ volume_opts = [
     cfg.StrOpt('lvm_type',
                default='default',
                help='Type of LVM volumes to deploy; (default or thin)'),
+    cfg.IntOpt('lvm_lv_cache_ttl',
+               default=30,
+               help='Seconds the inventory of the LVs of the volume group '
+                    'is cached for, LVs created, changed and deleted by the '
+                    'driver are kept current in it. 0 disables the cache'),
+    cfg.BoolOpt('lvm_lazy_clear',
+                default=False,
+                help='Clear deleted volumes in the background instead of '
+                     'before their deletion completes. Their LVs are '
+                     'renamed with a reclaim- prefix, then cleared and '
+                     'removed one at a time, also after a restart of the '
+                     'service'),
+    cfg.IntOpt('lvm_lazy_clear_bps_limit',
+               default=0,
+               help='Upper limit of the bandwidth used to clear deleted '
+                    'volumes in the background, in bytes per second. '
+                    '0 => volume_copy_bps_limit'),
 ]
 
+# Prefix of the LVs of deleted volumes waiting to be cleared and removed
+RECLAIM_PREFIX = 'reclaim-'
+
 CONF = cfg.CONF
 CONF.register_opts(volume_opts)
 
@@ -68,6 +90,11 @@ class LVMVolumeDriver(driver.VolumeDriver):
         self.backend_name =\
             self.configuration.safe_get('volume_backend_name') or 'LVM'
         self.protocol = 'local'
+        # name of LV to reclaim : size in GB
+        self._reclaims = collections.OrderedDict()
+        # name of LV which failed to be reclaimed : size in GB
+        self._failed_reclaims = {}
+        self._reclaimer = None
 
     def set_execute(self, execute):
         self._execute = execute
@@ -77,10 +104,12 @@ class LVMVolumeDriver(driver.VolumeDriver):
         if self.vg is None:
             root_helper = utils.get_root_helper()
             try:
-                self.vg = lvm.LVM(self.configuration.volume_group,
-                                  root_helper,
-                                  lvm_type=self.configuration.lvm_type,
-                                  executor=self._execute)
+                self.vg = lvm.LVM(
+                    self.configuration.volume_group,
+                    root_helper,
+                    lvm_type=self.configuration.lvm_type,
+                    executor=self._execute,
+                    lv_cache_ttl=self.configuration.lvm_lv_cache_ttl)
             except brick_exception.VolumeGroupNotFound:
                 message = ("Volume Group %s does not exist" %
                            self.configuration.volume_group)
@@ -113,6 +142,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
                     raise exception.VolumeBackendAPIException(
                         data=exception_message)
 
+        self._resume_reclaims()
+
     def _sizestr(self, size_in_g):
         if int(size_in_g) == 0:
             return '100m'
@@ -125,6 +156,9 @@ class LVMVolumeDriver(driver.VolumeDriver):
         """Deletes a logical volume."""
         if self.configuration.volume_clear != 'none' and \
                 self.configuration.lvm_type != 'thin':
+            if self.configuration.lvm_lazy_clear and not is_snapshot:
+                self._reclaim_volume(volume)
+                return
             self._clear_volume(volume, is_snapshot)
 
         name = volume['name']
@@ -132,9 +166,64 @@ class LVMVolumeDriver(driver.VolumeDriver):
             name = self._escape_snapshot(volume['name'])
         self.vg.delete(name)
 
-    def _clear_volume(self, volume, is_snapshot=False):
+    def _get_clear_size(self, volume):
+        size_in_g = volume.get('size', volume.get('volume_size', None))
+        if size_in_g is None:
+            msg = (_("Size for volume: %s not found, "
+                     "cannot secure delete.") % volume['id'])
+            LOG.error(msg)
+            raise exception.InvalidParameterValue(msg)
+        return size_in_g
+
+    def _reclaim_volume(self, volume):
+        """Clear and remove a deleted volume in the background."""
+        size_in_g = self._get_clear_size(volume)
+        name = RECLAIM_PREFIX + volume['name']
+        self.vg.rename_volume(volume['name'], name)
+        self._queue_reclaim(name, size_in_g)
+
+    def _resume_reclaims(self):
+        """Reclaim the volumes deleted before a restart of the service."""
+        for lv in self.vg.get_volumes():
+            if (lv['name'].startswith(RECLAIM_PREFIX) and
+                    lv['name'] not in self._reclaims):
+                LOG.info(_('Resuming the reclaim of deleted volume %s')
+                         % lv['name'])
+                self._queue_reclaim(lv['name'], float(lv['size']))
+
+    def _queue_reclaim(self, name, size_in_g):
+        self._reclaims[name] = size_in_g
+        # The LVs which failed to be reclaimed are tried again after it
+        while self._failed_reclaims:
+            failed_name, failed_size_in_g = self._failed_reclaims.popitem()
+            self._reclaims[failed_name] = failed_size_in_g
+        if self._reclaimer is None:
+            self._reclaimer = eventlet.spawn(self._run_reclaims)
+
+    def _run_reclaims(self):
+        try:
+            while self._reclaims:
+                name, size_in_g = self._reclaims.items()[0]
+                try:
+                    self._clear_volume({'name': name, 'id': name,
+                                        'size': size_in_g},
+                                       bps_limit=self.configuration.
+                                       lvm_lazy_clear_bps_limit)
+                    self.vg.delete(name)
+                except Exception:
+                    # The LV is reclaimed again when the next deleted
+                    # volume is queued, or after a restart, its space
+                    # stays pending until then
+                    LOG.exception(_('Failed to reclaim deleted volume %s')
+                                  % name)
+                    self._failed_reclaims[name] = size_in_g
+                finally:
+                    del self._reclaims[name]
+        finally:
+            self._reclaimer = None
+
+    def _clear_volume(self, volume, is_snapshot=False, bps_limit=None):
         # zero out old volumes to prevent data leaking between users
-        # TODO(ja): reclaiming space should be done lazy and low priority
         if is_snapshot:
             # if the volume to be cleared is a snapshot of another volume
             # we need to clear out the volume using the -cow instead of the
@@ -145,30 +234,52 @@ class LVMVolumeDriver(driver.VolumeDriver):
         else:
             dev_path = self.local_path(volume)
 
-        # TODO(jdg): Maybe we could optimize this for snaps by looking at
-        # the cow table and only overwriting what's necessary?
-        # for now we're still skipping on snaps due to hang issue
         if not os.path.exists(dev_path):
             msg = (_('Volume device file path %s does not exist.')
                    % dev_path)
             LOG.error(msg)
             raise exception.VolumeBackendAPIException(data=msg)
 
-        size_in_g = volume.get('size', volume.get('volume_size', None))
-        if size_in_g is None:
-            msg = (_("Size for volume: %s not found, "
-                     "cannot secure delete.") % volume['id'])
-            LOG.error(msg)
-            raise exception.InvalidParameterValue(msg)
+        size_in_g = self._get_clear_size(volume)
 
         # clear_volume expects sizes in MiB, we store integer GiB
         # be sure to convert before passing in
-        vol_sz_in_meg = size_in_g * units.Ki
+        vol_sz_in_meg = int(size_in_g * units.Ki)
+
+        volume_clear_size = self.configuration.volume_clear_size
+        if is_snapshot:
+            cow_sz_in_meg = self._get_cow_usage(volume, vol_sz_in_meg)
+            if cow_sz_in_meg is not None and (
+                    not volume_clear_size or
+                    cow_sz_in_meg < volume_clear_size):
+                volume_clear_size = cow_sz_in_meg
 
         volutils.clear_volume(
             vol_sz_in_meg, dev_path,
             volume_clear=self.configuration.volume_clear,
-            volume_clear_size=self.configuration.volume_clear_size)
+            volume_clear_size=volume_clear_size,
+            bps_limit=bps_limit,
+            scrub=self.configuration.volume_clear_scrub)
+
+    def _get_cow_usage(self, snapshot, size_in_m):
+        """Return the MiB at the start of a snapshot COW which were written.
+
+        The snapshot stores its chunks one after the other from the start
+        of the COW device, so the part past its usage was never written.
+
+        :returns: the size in MiB, None if it isn't known
+        """
+        name = self._escape_snapshot(snapshot['name'])
+        try:
+            percent = self.vg.get_snapshot_usage(name)
+        except processutils.ProcessExecutionError:
+            LOG.warning(_('Failed to get the COW usage of snapshot %s, '
+                          'clearing all of it') % name)
+            return None
+        if percent is None:
+            return None
+        # One more MiB covers the chunk being written and the rounding
+        return min(size_in_m, int(math.ceil(size_in_m * percent / 100)) + 1)
 
     def _escape_snapshot(self, snapshot_name):
         # Linux LVM reserves name that starts with snapshot, so that
@@ -195,6 +306,11 @@ class LVMVolumeDriver(driver.VolumeDriver):
                             self.configuration.lvm_type,
                             mirror_count)
 
+    def _sparse_copy_volume(self):
+        """Whether new volumes read zeros where they weren't written."""
+        # New thin volumes don't map any block of their pool yet
+        return self.configuration.lvm_type == 'thin'
+
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
         self._create_volume(volume['name'],
@@ -212,7 +328,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
                              self.local_path(volume),
                              snapshot['volume_size'] * units.Ki,
                              self.configuration.volume_dd_blocksize,
-                             execute=self._execute)
+                             execute=self._execute,
+                             sparse=self._sparse_copy_volume())
 
     def delete_volume(self, volume):
         """Deletes a logical volume."""
@@ -306,7 +423,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
                 self.local_path(volume),
                 src_vref['size'] * units.Ki,
                 self.configuration.volume_dd_blocksize,
-                execute=self._execute)
+                execute=self._execute,
+                sparse=self._sparse_copy_volume())
         finally:
             self.delete_snapshot(temp_snapshot)
 
@@ -370,6 +488,10 @@ class LVMVolumeDriver(driver.VolumeDriver):
         else:
             data['total_capacity_gb'] = self.vg.vg_size
             data['free_capacity_gb'] = self.vg.vg_free_space
+        # The space of deleted volumes is only free once they are cleared
+        data['pending_reclaim_capacity_gb'] = (
+            sum(self._reclaims.values()) +
+            sum(self._failed_reclaims.values()))
         data['reserved_percentage'] = self.configuration.reserved_percentage
         data['QoS_support'] = False
         data['location_info'] =\
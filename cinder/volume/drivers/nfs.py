@@ -16,12 +16,15 @@
 import errno
 import os
 import re
+import time
 
+import eventlet
 from oslo.config import cfg
 
 from cinder.brick.remotefs import remotefs
 from cinder import exception
 from cinder.image import image_utils
+from cinder.openstack.common import excutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import processutils as putils
 from cinder.openstack.common import units
@@ -58,6 +61,19 @@ volume_opts = [
                default=None,
                help=('Mount options passed to the nfs client. See section '
                      'of the nfs man page for details.')),
+    cfg.IntOpt('nfs_capacity_cache_ttl',
+               default=30,
+               help=('Seconds the capacity of an nfs share is cached for '
+                     'before it is probed again. Volumes created, extended '
+                     'and deleted by the driver are accounted for in the '
+                     'cache in the meantime. 0 disables the cache.')),
+    cfg.IntOpt('nfs_allocated_rescan_interval',
+               default=3600,
+               help=('Seconds between scans of the space allocated to the '
+                     'files of an nfs share with du, which is tracked as '
+                     'volumes are created, extended and deleted by the '
+                     'driver in between. 0 scans the share each time its '
+                     'capacity is probed.')),
 ]
 
 nas_opts = [
@@ -355,8 +371,8 @@ class RemoteFsDriver(driver.VolumeDriver):
 
         global_capacity = 0
         global_free = 0
-        for share in self._mounted_shares:
-            capacity, free, used = self._get_capacity_info(share)
+        for capacity, free, used in self._get_share_capacities(
+                self._mounted_shares):
             global_capacity += capacity
             global_free += free
 
@@ -384,6 +400,14 @@ class RemoteFsDriver(driver.VolumeDriver):
     def _get_capacity_info(self, nfs_share):
         raise NotImplementedError()
 
+    def _get_share_capacities(self, shares):
+        """Return the capacity info of each of the given shares.
+
+        :param shares: list of shares
+        :returns: list of the tuples returned by _get_capacity_info
+        """
+        return [self._get_capacity_info(share) for share in shares]
+
     def _find_share(self, volume_size_in_gib):
         raise NotImplementedError()
 
@@ -403,6 +427,10 @@ class NfsDriver(RemoteFsDriver):
 
     def __init__(self, execute=putils.execute, *args, **kwargs):
         self._remotefsclient = None
+        # share : (time probed, (total size, available, allocated))
+        self._share_capacity = {}
+        # share : (time scanned, apparent space allocated)
+        self._share_allocated = {}
         super(NfsDriver, self).__init__(*args, **kwargs)
         self.configuration.append_config_values(volume_opts)
         root_helper = utils.get_root_helper()
@@ -484,11 +512,15 @@ class NfsDriver(RemoteFsDriver):
         target_share = None
         target_share_reserved = 0
 
+        # Probe the shares whose capacity is not cached all at once, the
+        # eligibility checks below then use the cached capacities
+        self._get_share_capacities(self._mounted_shares)
+
         for nfs_share in self._mounted_shares:
             if not self._is_share_eligible(nfs_share, volume_size_in_gib):
                 continue
             total_size, total_available, total_allocated = \
-                self._get_capacity_info(nfs_share)
+                self._get_share_capacity(nfs_share)
             if target_share is not None:
                 if target_share_reserved > total_allocated:
                     target_share = nfs_share
@@ -524,7 +556,7 @@ class NfsDriver(RemoteFsDriver):
         requested_volume_size = volume_size_in_gib * units.Gi
 
         total_size, total_available, total_allocated = \
-            self._get_capacity_info(nfs_share)
+            self._get_share_capacity(nfs_share)
         apparent_size = max(0, total_size * oversub_ratio)
         apparent_available = max(0, apparent_size - total_allocated)
         used = (total_size - total_available) / total_size
@@ -563,10 +595,106 @@ class NfsDriver(RemoteFsDriver):
         total_available = block_size * blocks_avail
         total_size = block_size * blocks_total
 
+        total_allocated = self._get_allocated_space(nfs_share, mount_point)
+        return total_size, total_available, total_allocated
+
+    def _get_allocated_space(self, nfs_share, mount_point):
+        """Return the apparent space allocated to the files of the share.
+
+        The share is scanned with du once every
+        nfs_allocated_rescan_interval seconds, the space is tracked as
+        volumes are created, extended and deleted in between.
+        """
+        scanned = self._share_allocated.get(nfs_share)
+        if (scanned is not None and time.time() - scanned[0] <
+                self.configuration.nfs_allocated_rescan_interval):
+            return scanned[1]
+
         du, _ = self._execute('du', '-sb', '--apparent-size', '--exclude',
                               '*snapshot*', mount_point, run_as_root=True)
         total_allocated = float(du.split()[0])
-        return total_size, total_available, total_allocated
+        self._share_allocated[nfs_share] = (time.time(), total_allocated)
+        return total_allocated
+
+    def _get_share_capacity(self, nfs_share):
+        """Return the capacity info of the share, cached if fresh enough.
+
+        :param nfs_share: example 172.18.194.100:/var/nfs
+        :returns: tuple as returned by _get_capacity_info
+        """
+        probed = self._share_capacity.get(nfs_share)
+        if (probed is not None and time.time() - probed[0] <
+                self.configuration.nfs_capacity_cache_ttl):
+            return probed[1]
+
+        capacity = self._get_capacity_info(nfs_share)
+        self._share_capacity[nfs_share] = (time.time(), capacity)
+        return capacity
+
+    def _get_share_capacities(self, shares):
+        """Return the capacity info of the shares, probed in parallel."""
+        pool = eventlet.GreenPool(max(len(shares), 1))
+        return list(pool.imap(self._get_share_capacity, shares))
+
+    def _update_share_capacity(self, nfs_share, size_in_gib):
+        """Account for a volume created, extended or deleted on the share.
+
+        :param nfs_share: share of the volume
+        :param size_in_gib: size in GB added to the share, negative for the
+                            space given back
+        """
+        size = size_in_gib * units.Gi
+        scanned = self._share_allocated.get(nfs_share)
+        if scanned is not None:
+            self._share_allocated[nfs_share] = (scanned[0],
+                                                max(0, scanned[1] + size))
+
+        probed = self._share_capacity.get(nfs_share)
+        if probed is not None:
+            total_size, total_available, total_allocated = probed[1]
+            if not self.configuration.nfs_sparsed_volumes:
+                total_available = min(total_size,
+                                      max(0, total_available - size))
+            self._share_capacity[nfs_share] = (
+                probed[0],
+                (total_size, total_available,
+                 max(0, total_allocated + size)))
+
+    def create_volume(self, volume):
+        """Creates a volume.
+
+        The space of the volume is accounted on the share as soon as it is
+        chosen, so that volumes created concurrently within
+        nfs_capacity_cache_ttl see it, and given back if the volume can't
+        be created.
+
+        :param volume: volume reference
+        """
+        self._ensure_shares_mounted()
+
+        nfs_share = self._find_share(volume['size'])
+        self._update_share_capacity(nfs_share, volume['size'])
+        volume['provider_location'] = nfs_share
+
+        LOG.info(_('casted to %s') % nfs_share)
+
+        try:
+            self._do_create_volume(volume)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._update_share_capacity(nfs_share, -volume['size'])
+
+        return {'provider_location': nfs_share}
+
+    def delete_volume(self, volume):
+        """Deletes a logical volume.
+
+        :param volume: volume reference
+        """
+        super(NfsDriver, self).delete_volume(volume)
+        if volume['provider_location']:
+            self._update_share_capacity(volume['provider_location'],
+                                        -volume['size'])
 
     def _get_mount_point_base(self):
         return self.base
@@ -586,6 +714,7 @@ class NfsDriver(RemoteFsDriver):
         if not self._is_file_size_equal(path, new_size):
             raise exception.ExtendVolumeError(
                 reason='Resizing image file failed.')
+        self._update_share_capacity(volume['provider_location'], extend_by)
 
     def _is_file_size_equal(self, path, size):
         """Checks if file size at path is equal to size."""
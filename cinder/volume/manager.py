@@ -45,6 +45,7 @@ from cinder import compute
 from cinder import context
 from cinder import exception
 from cinder import flow_utils
+from cinder.image import cache as image_cache
 from cinder.image import glance
 from cinder import manager
 from cinder.openstack.common import excutils
@@ -1132,6 +1133,9 @@ class VolumeManager(manager.SchedulerDependentManager):
             if volume_stats:
                 # Append volume stats with 'allocated_capacity_gb'
                 volume_stats.update(self.stats)
+                cache = image_cache.get_cache()
+                if cache:
+                    volume_stats['image_cache'] = cache.get_stats()
                 # queue it to be sent to the Schedulers.
                 self.update_service_capabilities(volume_stats)
 
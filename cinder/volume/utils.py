@@ -15,7 +15,9 @@
 """Volume-related Utilities and helpers."""
 
 
+import contextlib
 import math
+import os
 
 from oslo.config import cfg
 
@@ -27,6 +29,7 @@ from cinder.openstack.common import strutils
 from cinder.openstack.common import units
 from cinder import rpc
 from cinder import utils
+from cinder.volume import blockcopy
 
 
 CONF = cfg.CONF
@@ -175,8 +178,53 @@ def _calculate_count(size_in_m, blocksize):
     return blocksize, int(count)
 
 
+@contextlib.contextmanager
+def _temporary_access(path, mode):
+    """Temporarily chown path if it can't be accessed with mode."""
+    if os.path.exists(path) and not os.access(path, mode):
+        with utils.temporary_chown(path):
+            yield
+    else:
+        yield
+
+
+def _copy_volume_native(srcstr, deststr, size_in_m, blocksize, sync=False,
+                        sparse=False, bps_limit=0, scrub=False):
+    blocksize, count = _calculate_count(size_in_m, blocksize)
+    copy = blockcopy.VolumeCopy(srcstr, deststr, size_in_m * units.Mi,
+                                chunk_size=int(strutils.string_to_bytes(
+                                    '%sB' % blocksize)),
+                                workers=CONF.volume_copy_workers,
+                                bps_limit=bps_limit,
+                                sync=sync, dst_zeroed=sparse, scrub=scrub)
+    dst_mode = os.R_OK | os.W_OK if copy.scrub else os.W_OK
+    with _temporary_access(srcstr, os.R_OK):
+        with _temporary_access(deststr, dst_mode):
+            copy.run()
+
+
 def copy_volume(srcstr, deststr, size_in_m, blocksize, sync=False,
-                execute=utils.execute, ionice=None):
+                execute=utils.execute, ionice=None, sparse=False,
+                bps_limit=None, scrub=False):
+    """Copy size_in_m megabytes of data from srcstr to deststr.
+
+    :param sync: whether to flush the data to disk before returning
+    :param ionice: ionice class for the copy, which then runs dd
+    :param sparse: whether deststr reads zeros where it isn't written, in
+                   which case zeros are not written to it
+    :param bps_limit: bandwidth limit of the copy in bytes per second,
+                      volume_copy_bps_limit if None or 0
+    :param scrub: with /dev/zero as srcstr, only zero the blocks of deststr
+                  which aren't zeros already. Ignored by dd
+    """
+    bps_limit = bps_limit or CONF.volume_copy_bps_limit
+    # The I/O priority of dd can be lowered without lowering the one of
+    # the service
+    if CONF.volume_copy_engine == 'native' and ionice is None:
+        return _copy_volume_native(srcstr, deststr, size_in_m, blocksize,
+                                   sync=sync, sparse=sparse,
+                                   bps_limit=bps_limit, scrub=scrub)
+
     # Use O_DIRECT to avoid thrashing the system buffer cache
     extra_flags = []
     # Check whether O_DIRECT is supported to iflag and oflag separately
@@ -203,7 +251,7 @@ def copy_volume(srcstr, deststr, size_in_m, blocksize, sync=False,
     if ionice is not None:
         cmd = ['ionice', ionice] + cmd
 
-    cgcmd = setup_blkio_cgroup(srcstr, deststr, CONF.volume_copy_bps_limit)
+    cgcmd = setup_blkio_cgroup(srcstr, deststr, bps_limit)
     if cgcmd:
         cmd = cgcmd + cmd
 
@@ -212,8 +260,13 @@ def copy_volume(srcstr, deststr, size_in_m, blocksize, sync=False,
 
 
 def clear_volume(volume_size, volume_path, volume_clear=None,
-                 volume_clear_size=None, volume_clear_ionice=None):
-    """Unprovision old volumes to prevent data leaking between users."""
+                 volume_clear_size=None, volume_clear_ionice=None,
+                 bps_limit=None, scrub=False):
+    """Unprovision old volumes to prevent data leaking between users.
+
+    :param scrub: whether to zero only the blocks which aren't zeros
+                  already, for volumes mostly left unwritten
+    """
     if volume_clear is None:
         volume_clear = CONF.volume_clear
 
@@ -232,7 +285,8 @@ def clear_volume(volume_size, volume_path, volume_clear=None,
         return copy_volume('/dev/zero', volume_path, volume_clear_size,
                            CONF.volume_dd_blocksize,
                            sync=True, execute=utils.execute,
-                           ionice=volume_clear_ionice)
+                           ionice=volume_clear_ionice, bps_limit=bps_limit,
+                           scrub=scrub)
     elif volume_clear == 'shred':
         clear_cmd = ['shred', '-n3']
         if volume_clear_size:
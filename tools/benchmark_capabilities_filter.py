@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-host cost of the oslo and the compiled CapabilitiesFilter.
+
+Usage: tools/with_venv.sh python tools/benchmark_capabilities_filter.py
+       [num_hosts] [rounds]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from cinder.openstack.common.scheduler.filters import capabilities_filter
+from cinder.scheduler.filters import capabilities_filter as \
+    compiled_capabilities_filter
+
+EXTRA_SPECS = {'volume_backend_name': 'lvm',
+               'capabilities:QoS_support': '<is> True',
+               'capabilities:storage_protocol': '<or> iSCSI <or> FC',
+               'capabilities:free_capacity_gb': '>= 10',
+               'capabilities:vendor_name': 's== Open Source',
+               'qos:read_iops': '1000'}
+
+
+class HostState(object):
+
+    def __init__(self, host, capabilities):
+        self.host = host
+        self.capabilities = capabilities
+
+
+def time_filter(filter_cls, hosts, filter_properties, rounds):
+    """Return the seconds spent per host and the hosts passing."""
+    start = time.time()
+    for i in xrange(rounds):
+        passed = list(filter_cls().filter_all(hosts, filter_properties))
+    per_host = (time.time() - start) / (rounds * len(hosts))
+    return per_host, passed
+
+
+def main(argv):
+    num_hosts = int(argv[1]) if len(argv) > 1 else 500
+    rounds = int(argv[2]) if len(argv) > 2 else 10
+
+    filter_properties = {'resource_type': {'id': 'bench-type',
+                                           'extra_specs': EXTRA_SPECS}}
+    hosts = [HostState('host%s' % x,
+                       {'volume_backend_name': 'lvm',
+                        'QoS_support': True,
+                        'storage_protocol': 'iSCSI',
+                        'free_capacity_gb': x % 20,
+                        'vendor_name': 'Open Source'})
+             for x in xrange(num_hosts)]
+
+    oslo_cost, oslo_passed = time_filter(
+        capabilities_filter.CapabilitiesFilter, hosts, filter_properties,
+        rounds)
+    compiled_cost, compiled_passed = time_filter(
+        compiled_capabilities_filter.CapabilitiesFilter, hosts,
+        filter_properties, rounds)
+
+    if oslo_passed != compiled_passed:
+        print('The filters disagree on the hosts passing', file=sys.stderr)
+        return 1
+    print('CapabilitiesFilter per-host cost over %d hosts: oslo %.2fus, '
+          'compiled %.2fus' % (num_hosts, oslo_cost * 1e6,
+                               compiled_cost * 1e6))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))